@@ -50,8 +50,8 @@ BACKEND = "tf"
 DISTRIBUTED_BACKEND = "distributed_tf"
 
 distributed_compatible_backends = dict(
-    tf=["distributed_tf", "ray", "horovod"],
-    pytorch=["ray", "horovod"]
+    tf=["distributed_tf", "ray", "horovod", "multiprocessing"],
+    pytorch=["ray", "horovod", "multiprocessing"]
 )
 
 
@@ -136,6 +136,9 @@ elif DISTRIBUTED_BACKEND == "ray":
         import ray
     except ImportError as e:
         raise ValueError("INIT ERROR: Cannot run RLGraph with distributed backend Ray.")
+elif DISTRIBUTED_BACKEND == "multiprocessing":
+    # Single-node execution via the standard library, e.g. `LocalApexExecutor`.
+    pass
 else:
     raise ValueError("Distributed backend {} not supported".format(DISTRIBUTED_BACKEND))
 
@@ -29,6 +29,7 @@ from rlgraph.graphs.graph_executor import GraphExecutor
 from rlgraph.spaces.space import Space
 from rlgraph.utils.decorators import rlgraph_api
 from rlgraph.utils.input_parsing import parse_execution_spec, parse_observe_spec, parse_update_spec
+from rlgraph.utils.n_step_util import n_step_post_process
 from rlgraph.utils.specifiable import Specifiable
 
 
@@ -342,15 +343,16 @@ class Agent(Specifiable):
 
             buffer_is_full = len(self.rewards_buffer[env_id]) >= self.observe_spec["buffer_size"]
 
+            # With n-step post-processing: Insert the n-step records of the buffer. If the episode is still running,
+            # keep the last n-1 records, which lack enough future rewards, for the next insert.
+            if self.observe_spec["n_step"] > 1:
+                if buffer_is_full or self.terminals_buffer[env_id][-1]:
+                    self._observe_n_step_buffer(env_id, was_terminal=bool(self.terminals_buffer[env_id][-1]))
             # If the buffer (per environment) is full OR the episode was aborted:
             # Change terminal of last record artificially to True, insert and flush the buffer.
-            if buffer_is_full or self.terminals_buffer[env_id][-1]:
+            elif buffer_is_full or self.terminals_buffer[env_id][-1]:
                 self.terminals_buffer[env_id][-1] = True
 
-                # TODO: Apply n-step post-processing if necessary.
-                # if self.observe_spec["n_step"] > 1:
-                #    pass
-
                 self._observe_graph(
                     preprocessed_states=np.asarray(self.states_buffer[env_id]),
                     actions=np.asarray(self.actions_buffer[env_id]),
@@ -363,6 +365,36 @@ class Agent(Specifiable):
         else:
             self._observe_graph(preprocessed_states, actions, internals, rewards, next_states, terminals)
 
+    def _observe_n_step_buffer(self, env_id, was_terminal):
+        """
+        Inserts the n-step post-processed records of an environment buffer and removes them from the buffer.
+
+        Args:
+            env_id (str): Environment id whose buffer to insert.
+            was_terminal (bool): Whether the buffered trajectory ended an episode. If False, the last n-1
+                records remain in the buffer.
+        """
+        num_records, rewards, terminals, next_state_indices = n_step_post_process(
+            self.rewards_buffer[env_id], self.terminals_buffer[env_id], self.observe_spec["n_step"],
+            self.discount, was_terminal=was_terminal
+        )
+        if num_records > 0:
+            next_states_buffer = self.next_states_buffer[env_id]
+            self._observe_graph(
+                preprocessed_states=np.asarray(self.states_buffer[env_id][:num_records]),
+                actions=np.asarray(self.actions_buffer[env_id][:num_records]),
+                internals=np.asarray(self.internals_buffer[env_id][:num_records]),
+                rewards=rewards,
+                next_states=np.asarray([next_states_buffer[i] for i in next_state_indices]),
+                terminals=terminals
+            )
+        if was_terminal:
+            self.reset_env_buffers(env_id)
+        else:
+            for buffer in [self.states_buffer, self.actions_buffer, self.internals_buffer, self.rewards_buffer,
+                           self.next_states_buffer, self.terminals_buffer]:
+                del buffer[env_id][:num_records]
+
     def _observe_graph(self, preprocessed_states, actions, internals, rewards, next_states, terminals):
         """
         This methods defines the actual call to the computational graph by executing
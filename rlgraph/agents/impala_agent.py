@@ -27,6 +27,7 @@ from rlgraph.components.common.dict_merger import DictMerger
 from rlgraph.components.common.container_splitter import ContainerSplitter
 from rlgraph.components.common.slice import Slice
 from rlgraph.components.common.staging_area import StagingArea
+from rlgraph.components.common.synchronizable import Synchronizable
 from rlgraph.components.common.environment_stepper import EnvironmentStepper
 from rlgraph.components.layers.preprocessing.reshape import ReShape
 from rlgraph.components.layers.preprocessing.transpose import Transpose
@@ -393,6 +394,10 @@ class IMPALAAgent(Agent):
                 self.loss_function, self.optimizer
             ]
 
+        # Learners can also be fed trajectories from outside the graph, e.g. collected by Ray actors.
+        if self.type == "learner":
+            self.input_spaces["records"] = self.fifo_record_space
+
         # Add all the agent's sub-components to the root.
         self.root_component.add_components(*sub_components)
 
@@ -443,8 +448,30 @@ class IMPALAAgent(Agent):
             self.define_graph_api_single(*sub_components)
         elif self.type == "actor":
             self.define_graph_api_actor(*sub_components)
+            self.define_graph_api_weight_sync("environment-stepper/actor-component/policy")
         else:
             self.define_graph_api_learner(*sub_components)
+            self.define_graph_api_weight_sync("policy")
+
+    def define_graph_api_weight_sync(self, policy_path):
+        """
+        Defines the API-methods to get and set the policy weights, so actors and learners can sync their
+        policies without sharing variables through a TF cluster (e.g. when run as Ray actors).
+
+        Args:
+            policy_path (str): The path of local scopes from the root to the policy Component.
+        """
+        policy = self.policy
+        policy.add_components(Synchronizable(), expose_apis="sync")
+        self.input_spaces["weights"] = "variables:{}".format(policy_path)
+
+        @rlgraph_api(component=self.root_component)
+        def get_policy_weights(self_):
+            return policy._variables()
+
+        @rlgraph_api(component=self.root_component, must_be_complete=False)
+        def set_policy_weights(self_, weights):
+            return policy.sync(weights)
 
     def define_graph_api_single(self, fifo_output_splitter, fifo_queue, queue_runner,
                                 transpose_states, transpose_terminals,
@@ -564,6 +591,16 @@ class IMPALAAgent(Agent):
 
             return insert_op, terminals
 
+        # Perform n-steps in the env and return the results, e.g. to send them to a learner outside the graph.
+        @rlgraph_api(component=self.root_component)
+        def perform_n_steps(self_):
+            step_results = env_stepper.step()
+
+            terminals, states, action_log_probs, internal_states = env_output_splitter.split(step_results)
+            initial_internal_states = internal_states_slicer.slice(internal_states, 0)
+
+            return merger.merge(terminals, states, action_log_probs, initial_internal_states)
+
         @rlgraph_api(component=self.root_component)
         def reset(self):
             # Resets the environment running inside the agent.
@@ -593,6 +630,10 @@ class IMPALAAgent(Agent):
         def get_queue_size(self_):
             return fifo_queue.get_size()
 
+        @rlgraph_api(component=self.root_component)
+        def insert_records(self_, records):
+            return fifo_queue.insert_records(records)
+
         @rlgraph_api(component=self.root_component)
         def update_from_memory(self_):
             # Pull n records from the queue.
@@ -653,6 +694,25 @@ class IMPALAAgent(Agent):
     def get_action(self, states, internal_states=None, use_exploration=True, extra_returns=None):
         pass
 
+    def perform_n_steps(self):
+        """
+        Steps the actor's environment for `worker_sample_size` steps.
+
+        Returns:
+            dict: One trajectory record as inserted into the FIFOQueue: terminals, states (including the previous
+                actions and rewards), behaviour policy action probabilities and initial internal states.
+        """
+        return self.graph_executor.execute("perform_n_steps")
+
+    def insert_records(self, records):
+        """
+        Inserts a single trajectory record into the learner's FIFOQueue. Blocks while the queue is full.
+
+        Args:
+            records (dict): Trajectory record as returned by an actor's `perform_n_steps`.
+        """
+        self.graph_executor.execute(("insert_records", [records]))
+
     def _observe_graph(self, preprocessed_states, actions, internals, rewards, terminals):
         self.graph_executor.execute(("insert_records", [preprocessed_states, actions, rewards, terminals]))
 
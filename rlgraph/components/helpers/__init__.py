@@ -17,9 +17,12 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
-from rlgraph.components.helpers.mem_segment_tree import MemSegmentTree
+from rlgraph.components.helpers.mem_frame_buffer import MemFrameBuffer
+from rlgraph.components.helpers.mem_map_storage import MemMapStorage
+from rlgraph.components.helpers.mem_segment_tree import MemSegmentTree, NumpyMinSumSegmentTree
 from rlgraph.components.helpers.segment_tree import SegmentTree
 from rlgraph.components.helpers.softmax import SoftMax
 from rlgraph.components.helpers.v_trace_function import VTraceFunction
 
-__all__ = ["MemSegmentTree", "SegmentTree", "SoftMax", "VTraceFunction"]
+__all__ = ["MemFrameBuffer", "MemMapStorage", "MemSegmentTree", "NumpyMinSumSegmentTree", "SegmentTree", "SoftMax",
+           "VTraceFunction"]
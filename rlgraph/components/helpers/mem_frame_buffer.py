@@ -0,0 +1,222 @@
+# Copyright 2018 The RLgraph authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+
+
+class MemFrameBuffer(object):
+    """
+    In-memory ring buffer of observation frames for replay memories holding frame-stacked states, e.g. as
+    produced by the `Sequence` preprocessor (frames concatenated or stacked in the last rank).
+
+    Each frame is stored once. A state is referenced by the absolute position of its newest frame and rebuilt
+    from the `frame_stack` consecutive frames ending there. Consecutive states of a trajectory share all but one
+    frame, so only the newest frame is written for them. Whenever a stack does not continue the previously
+    written one (e.g. at the start of an episode or trajectory fragment), all of its frames are written. This
+    means episode boundaries (including the repeated reset frame a `Sequence` fills in) are reproduced exactly.
+    """
+
+    def __init__(self, capacity, frame_stack=4, n_step_adjustment=1):
+        """
+        Args:
+            capacity (int): Number of frames in the ring.
+            frame_stack (int): Number of frames stacked in the last rank of each state.
+            n_step_adjustment (int): Offset between a transition's state and next state in a trajectory. Used
+                to find next states among the states of the same inserted batch.
+        """
+        assert capacity >= frame_stack, "ERROR: Frame capacity must be at least the frame stack size."
+        self.capacity = capacity
+        self.frame_stack = frame_stack
+        self.n_step_adjustment = n_step_adjustment
+
+        # Allocated on first insert.
+        self.frames = None
+        self.frame_channels = None
+
+        # Total number of frames written, the ring position of absolute position p is p % capacity.
+        self.frames_written = 0
+        # Last written stack and absolute position of its newest frame.
+        self.last_stack = None
+        self.last_position = -1
+
+    def insert(self, states, next_states):
+        """
+        Stores the frames of a batch of transitions.
+
+        Args:
+            states (ndarray): Frame-stacked states of shape (batch,) + state shape, in trajectory order.
+            next_states (ndarray): Frame-stacked next states.
+
+        Returns:
+            Tuple[ndarray, ndarray]: Absolute newest-frame positions for states and next states.
+        """
+        num_records = len(states)
+        state_positions = np.zeros(num_records, dtype=np.int64)
+        next_state_positions = np.zeros(num_records, dtype=np.int64)
+        if self.frames is None:
+            self._init_frames(states[0])
+
+        segment_start = 0
+        for i in range(num_records):
+            # A state that does not continue the last one starts a new trajectory fragment: store the
+            # remaining next states of the previous fragment first so these can continue its last state.
+            if i > 0 and self._match(states[i]) is None:
+                self._insert_next_states(states, next_states, state_positions, next_state_positions,
+                                         segment_start, i)
+                segment_start = i
+            state_positions[i] = self._register(states[i])
+        self._insert_next_states(states, next_states, state_positions, next_state_positions,
+                                 segment_start, num_records)
+
+        return state_positions, next_state_positions
+
+    def get_stacks(self, positions):
+        """
+        Rebuilds frame-stacked states.
+
+        Args:
+            positions (ndarray): Absolute newest-frame positions.
+
+        Returns:
+            ndarray: States of shape (len(positions),) + state shape.
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        frame_indices = (positions[:, np.newaxis] + np.arange(1 - self.frame_stack, 1)) % self.capacity
+        # Shape: (batch, frame_stack) + frame shape -> concatenate frames in the last rank.
+        frames = np.moveaxis(self.frames[frame_indices], 1, -2)
+        return frames.reshape(frames.shape[:-2] + (self.frame_stack * self.frame_channels,))
+
+    def get_valid_start(self):
+        """
+        Returns:
+            int: Smallest absolute newest-frame position whose stack has not been overwritten.
+        """
+        return self.frames_written - self.capacity + self.frame_stack - 1
+
+    def find_stale(self, positions, start, stop):
+        """
+        Finds transitions referencing overwritten frames. Assumes the newest-frame positions of transitions
+        are non-decreasing in insertion order, so stale transitions are always the oldest ones.
+
+        Args:
+            positions (ndarray): Newest state frame position per transition slot of a ring memory.
+            start (int): Absolute insertion count of the oldest transition not known to be stale.
+            stop (int): Total number of transitions inserted.
+
+        Returns:
+            int: Absolute insertion count of the oldest valid transition. Transitions in [start, result) are stale.
+        """
+        valid_start = self.get_valid_start()
+        while start < stop:
+            window = np.arange(start, min(start + 256, stop))
+            num_stale = int(np.searchsorted(positions[window % len(positions)], valid_start))
+            start += num_stale
+            if num_stale < len(window):
+                break
+        return start
+
+    def get_state(self):
+        """
+        Returns:
+            Tuple[dict, dict]: Scalar state and arrays (frames and last written stack) for memory snapshots.
+        """
+        metadata = dict(frames_written=self.frames_written, last_position=self.last_position,
+                        frame_channels=self.frame_channels)
+        arrays = {}
+        if self.frames is not None:
+            arrays["frames"] = self.frames
+        if self.last_stack is not None:
+            arrays["last_stack"] = np.asarray(self.last_stack)
+        return metadata, arrays
+
+    def set_state(self, metadata, arrays):
+        """
+        Restores a state returned by `get_state`.
+
+        Args:
+            metadata (dict): Scalar state.
+            arrays (dict): Frames and last written stack.
+        """
+        assert "frames" not in arrays or len(arrays["frames"]) == self.capacity, \
+            "ERROR: Snapshot frame capacity {} does not match frame capacity {}.".format(
+                len(arrays["frames"]), self.capacity)
+        self.frames_written = metadata["frames_written"]
+        self.last_position = metadata["last_position"]
+        self.frame_channels = metadata["frame_channels"]
+        self.frames = arrays.get("frames", None)
+        self.last_stack = arrays.get("last_stack", None)
+
+    def _init_frames(self, stack):
+        stack = np.asarray(stack)
+        assert stack.shape[-1] % self.frame_stack == 0, \
+            "ERROR: Last rank of states ({}) must be divisible by frame stack {}.".format(
+                stack.shape[-1], self.frame_stack)
+        self.frame_channels = stack.shape[-1] // self.frame_stack
+        self.frames = np.zeros((self.capacity,) + stack.shape[:-1] + (self.frame_channels,), dtype=stack.dtype)
+
+    def _match(self, stack):
+        """
+        Compares a stack to the last written one.
+
+        Returns:
+            Union[int, None]: 0 if equal, 1 if shifted by one new frame, None otherwise.
+        """
+        if self.last_stack is None:
+            return None
+        if np.array_equal(stack, self.last_stack):
+            return 0
+        channels = self.frame_channels
+        if np.array_equal(stack[..., :-channels], self.last_stack[..., channels:]):
+            return 1
+        return None
+
+    def _register(self, stack):
+        """
+        Writes the frames of a stack not yet present in the ring.
+
+        Returns:
+            int: Absolute position of the stack's newest frame.
+        """
+        match = self._match(stack)
+        if match == 0:
+            return self.last_position
+        elif match == 1:
+            self._write(stack[np.newaxis, ..., -self.frame_channels:])
+        else:
+            self._write(np.stack(np.split(stack, self.frame_stack, axis=-1)))
+        self.last_stack = stack
+        self.last_position = self.frames_written - 1
+        return self.last_position
+
+    def _write(self, frames):
+        positions = np.arange(self.frames_written, self.frames_written + len(frames)) % self.capacity
+        self.frames[positions] = frames
+        self.frames_written += len(frames)
+
+    def _insert_next_states(self, states, next_states, state_positions, next_state_positions, start, stop):
+        """
+        Resolves next states of one trajectory fragment [start, stop): next states found n steps ahead among
+        the fragment's states are referenced, the remaining ones (at the end of the fragment) are registered.
+        """
+        for i in range(start, stop):
+            candidate = i + self.n_step_adjustment
+            if candidate < stop and np.array_equal(next_states[i], states[candidate]):
+                next_state_positions[i] = state_positions[candidate]
+            else:
+                next_state_positions[i] = self._register(next_states[i])
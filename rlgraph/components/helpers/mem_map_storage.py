@@ -0,0 +1,186 @@
+# Copyright 2018 The RLgraph authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from rlgraph.utils.rlgraph_errors import RLGraphError
+
+
+class MemMapStorage(object):
+    """
+    Disk-backed record storage for replay memories with capacities beyond RAM. Every record field is kept in
+    its own `np.memmap` file of shape (capacity,) + field shape, so the resident memory only consists of
+    the pages the OS currently caches.
+
+    Byte-string fields (e.g. compressed states) are stored in fixed-width rows of `max_bytes` bytes plus
+    a length per row.
+
+    A temporary directory created by the storage is removed on `close`.
+    """
+    def __init__(self, capacity, directory=None, max_bytes=None):
+        """
+        Args:
+            capacity (int): Number of rows per field.
+            directory (Optional[str]): Directory for the memmap files. Defaults to a new temporary directory.
+            max_bytes (Optional[int]): Row width of byte-string fields. Required to create byte-string fields
+                via `create_columns` unless passed there.
+        """
+        self.capacity = capacity
+        # Only a directory created here is removed on `close`.
+        self.temporary_directory = directory is None
+        if directory is None:
+            directory = tempfile.mkdtemp(prefix="rlgraph_replay_")
+        elif not os.path.exists(directory):
+            os.makedirs(directory)
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+        # Field name -> memmap.
+        self.columns = {}
+        # Byte-string field name -> memmap of value lengths.
+        self.byte_lengths = {}
+
+    def create_column(self, name, shape, dtype):
+        """
+        Creates the memmap file of a field.
+
+        Args:
+            name (str): Field name, e.g. a flattened record space key.
+            shape (tuple): Shape of one value of the field.
+            dtype (Union[str, np.dtype]): Numpy dtype of the field.
+        """
+        self.columns[name] = np.memmap(self._get_path(name), mode="w+", dtype=dtype,
+                                       shape=(self.capacity,) + tuple(shape))
+
+    def create_byte_column(self, name, max_bytes):
+        """
+        Creates the memmap files of a byte-string field.
+
+        Args:
+            name (str): Field name.
+            max_bytes (int): Maximum length of a value.
+        """
+        self.create_column(name, (max_bytes,), np.uint8)
+        self.byte_lengths[name] = np.memmap(self._get_path(name + "_lengths"), mode="w+", dtype=np.int64,
+                                            shape=(self.capacity,))
+
+    def create_columns(self, values, max_bytes=None):
+        """
+        Creates all fields from batched example values, e.g. of a first inserted batch.
+
+        Args:
+            values (dict): Field name -> value array with a leading batch rank.
+            max_bytes (Optional[dict]): Byte-string field name -> row width, overriding `self.max_bytes`.
+
+        Raises:
+            RLGraphError: If the row width of a byte-string field is unknown.
+        """
+        for name, value in values.items():
+            value = np.asarray(value)
+            if value.dtype.kind in ["S", "O"]:
+                row_width = (max_bytes or {}).get(name, self.max_bytes)
+                if row_width is None:
+                    raise RLGraphError("ERROR: Row width of byte-string memmap field '{}' is unknown. Set "
+                                       "`max_bytes`.".format(name))
+                self.create_byte_column(name, row_width)
+            else:
+                self.create_column(name, value.shape[1:], value.dtype)
+
+    def write(self, indices, values):
+        """
+        Writes a batch of values.
+
+        Args:
+            indices (Union[slice, ndarray]): Rows to write to.
+            values (dict): Field name -> value array with a leading batch rank.
+        """
+        for name, value in values.items():
+            if name in self.byte_lengths:
+                if isinstance(indices, slice):
+                    self._write_bytes(name, range(indices.start, indices.stop), value)
+                else:
+                    self._write_bytes(name, indices, value)
+            else:
+                self.columns[name][indices] = value
+
+    def read(self, indices, names=None):
+        """
+        Reads a batch of rows. The rows are gathered in ascending order (and each only once), so
+        the OS pages them in with mostly sequential reads.
+
+        Args:
+            indices (ndarray): Rows to read, in any order and possibly repeated.
+            names (Optional[list]): Fields to read, defaults to all.
+
+        Returns:
+            dict: Field name -> value array in the order of `indices`. Byte-string fields are returned as
+                object arrays of bytes.
+        """
+        unique_indices, inverse = np.unique(indices, return_inverse=True)
+        values = {}
+        for name in (names or self.columns.keys()):
+            if name in self.byte_lengths:
+                rows = np.asarray(self.columns[name][unique_indices])
+                lengths = np.asarray(self.byte_lengths[name][unique_indices])
+                gathered = np.empty(len(unique_indices), dtype=object)
+                for i in range(len(unique_indices)):
+                    gathered[i] = rows[i, :lengths[i]].tobytes()
+            else:
+                gathered = np.asarray(self.columns[name][unique_indices])
+            values[name] = gathered[inverse]
+        return values
+
+    def flush(self):
+        """
+        Writes all pending changes to disk.
+        """
+        for column in list(self.columns.values()) + list(self.byte_lengths.values()):
+            column.flush()
+
+    def close(self):
+        """
+        Releases the memmap files and removes the directory if it is a temporary directory created by
+        this storage.
+        """
+        self.columns = {}
+        self.byte_lengths = {}
+        if self.temporary_directory:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self.temporary_directory = False
+
+    def __del__(self):
+        self.close()
+
+    def _write_bytes(self, name, indices, values):
+        column = self.columns[name]
+        lengths = self.byte_lengths[name]
+        for index, value in zip(indices, values):
+            if len(value) > column.shape[1]:
+                raise RLGraphError("ERROR: Value of length {} exceeds max bytes {} of memmap field '{}'. Increase "
+                                   "`max_bytes`.".format(len(value), column.shape[1], name))
+            column[index, :len(value)] = np.frombuffer(value, dtype=np.uint8)
+            lengths[index] = len(value)
+
+    def _get_path(self, name):
+        # Flattened keys contain scope separators.
+        return os.path.join(self.directory, name.strip("/").replace("/", "__") + ".dat")
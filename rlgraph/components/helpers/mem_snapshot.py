@@ -0,0 +1,316 @@
+# Copyright 2018 The RLgraph authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import io
+import json
+import os
+import struct
+from threading import Thread
+import zlib
+
+import numpy as np
+
+from rlgraph.utils.rlgraph_errors import RLGraphError
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+
+# File signature and version of the snapshot format.
+SNAPSHOT_MAGIC = b"RLGSNAP2"
+
+# Chunk encodings: A numeric array, an object array of bytes (lengths and concatenated bytes), or an object
+# array of equally shaped values stacked into one numeric array.
+CHUNK_ARRAY = 0
+CHUNK_BYTES_VALUES = 1
+CHUNK_STACKED_VALUES = 2
+
+# Target uncompressed size of a chunk.
+CHUNK_BYTES = 16 * 1024 * 1024
+
+
+def write_snapshot(path, metadata, arrays, compression=None, read_chunk=None):
+    """
+    Writes a memory snapshot as a stream of compressed chunks, so neither the compressed nor the
+    serialized snapshot has to fit into memory at once. The snapshot is written to a temporary file
+    first and then moved to `path`, so an interrupted write never replaces a previous snapshot.
+
+    Layout: Signature, JSON header (metadata, compression, dtype and shape of each array), then a sequence of
+    chunks, each holding a row range of one array: A header (array name, start row, encoding), followed by
+    the length-prefixed compressed chunk data in the `.npy` format. Nothing is pickled, so reading a snapshot
+    cannot execute code.
+
+    Args:
+        path (str): File to write.
+        metadata (dict): JSON-serializable scalars, e.g. index, size and max-priority of a memory.
+        arrays (dict): Name -> array (or memmap), chunked along the first rank. Object arrays are supported if
+            they hold bytes (e.g. compressed states) or equally shaped values.
+        compression (Optional[str]): One of "lz4", "zlib" or "none". Defaults to "lz4" if installed, else "zlib".
+        read_chunk (Optional[callable]): Called with array name, array, start and stop row to copy a chunk out
+            of an array, e.g. `BackgroundSnapshot.read_chunk`. Defaults to slicing the array.
+    """
+    if compression is None:
+        compression = "lz4" if lz4 is not None else "zlib"
+    compress = _get_compressor(compression)
+
+    header = dict(
+        metadata=metadata,
+        compression=compression,
+        arrays={name: [np.dtype(array.dtype).str, list(np.shape(array))] for name, array in arrays.items()}
+    )
+    header = json.dumps(header).encode("utf-8")
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(SNAPSHOT_MAGIC)
+        f.write(struct.pack("<Q", len(header)))
+        f.write(header)
+        for name, array in arrays.items():
+            num_rows = len(array)
+            chunk_rows = _get_chunk_rows(array)
+            encoded_name = name.encode("utf-8")
+            for start in range(0, num_rows, chunk_rows):
+                stop = min(start + chunk_rows, num_rows)
+                if read_chunk is None:
+                    chunk = np.ascontiguousarray(array[start:stop])
+                else:
+                    chunk = read_chunk(name, array, start, stop)
+                encoding, data = _encode_chunk(name, chunk)
+                data = compress(data)
+                f.write(struct.pack("<H", len(encoded_name)))
+                f.write(encoded_name)
+                f.write(struct.pack("<QBQ", start, encoding, len(data)))
+                f.write(data)
+    os.rename(tmp_path, path)
+
+
+class BackgroundSnapshot(object):
+    """
+    Writes a snapshot in a background thread while the memory keeps inserting. The snapshot holds the arrays
+    as they were when it started: Inserts call `preserve` with the rows they are about to overwrite, and rows
+    the thread has not written yet are copied before they are overwritten (copy-on-write).
+    """
+    def __init__(self, path, metadata, arrays, compression=None, lock=None):
+        """
+        Args:
+            path (str): File to write.
+            metadata (dict): JSON-serializable scalars, see `write_snapshot`.
+            arrays (dict): Name -> array. Arrays referencing memory storage must only be modified after
+                `preserve` was called with the modified rows.
+            compression (Optional[str]): Snapshot compression, see `write_snapshot`.
+            lock (Lock): Lock held by inserts while they call `preserve` and overwrite rows.
+        """
+        self.arrays = arrays
+        self.lock = lock
+        # Array name -> first row not written yet.
+        self.written_rows = {name: 0 for name in arrays}
+        # Array name -> row -> value of the row when the snapshot started.
+        self.preserved_rows = {name: {} for name in arrays}
+        self.thread = Thread(target=write_snapshot, args=(path, metadata, arrays, compression, self.read_chunk))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def preserve(self, name, rows):
+        """
+        Copies rows of an array which are about to be overwritten, unless they were already written. Must be
+        called while holding `lock`.
+
+        Args:
+            name (str): Array name.
+            rows (Union[int, slice, ndarray]): Rows about to be overwritten.
+        """
+        if name not in self.arrays:
+            return
+        array = self.arrays[name]
+        num_rows = len(array)
+        if isinstance(rows, slice):
+            rows = np.arange(rows.start, rows.stop)
+        rows = np.atleast_1d(rows)
+        preserved_rows = self.preserved_rows[name]
+        for row in rows[(rows >= self.written_rows[name]) & (rows < num_rows)]:
+            row = int(row)
+            if row not in preserved_rows:
+                value = array[row]
+                # Values of object arrays (e.g. compressed states) are immutable.
+                preserved_rows[row] = np.array(value) if isinstance(value, np.ndarray) else value
+
+    def read_chunk(self, name, array, start, stop):
+        # Called by the writer thread.
+        with self.lock:
+            chunk = np.array(array[start:stop])
+            preserved_rows = self.preserved_rows[name]
+            for row in range(start, stop):
+                if row in preserved_rows:
+                    chunk[row - start] = preserved_rows.pop(row)
+            self.written_rows[name] = stop
+        return chunk
+
+    def join(self, timeout=None):
+        self.thread.join(timeout)
+
+    def is_alive(self):
+        return self.thread.is_alive()
+
+
+def read_snapshot(path):
+    """
+    Opens a snapshot written by `write_snapshot`.
+
+    Args:
+        path (str): Snapshot file.
+
+    Returns:
+        Tuple[dict, dict, generator]: Metadata, name -> (dtype, shape) of each array and a generator yielding
+            (name, start row, chunk) tuples. The chunks can be copied into preallocated (e.g. disk-backed)
+            storage, so the snapshot does not need to fit into memory.
+    """
+    f = open(path, "rb")
+    if f.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+        f.close()
+        raise RLGraphError("ERROR: {} is not a memory snapshot.".format(path))
+    header_len = struct.unpack("<Q", f.read(8))[0]
+    header = json.loads(f.read(header_len).decode("utf-8"))
+    decompress = _get_decompressor(header["compression"])
+    arrays = {name: (np.dtype(dtype), tuple(shape)) for name, (dtype, shape) in header["arrays"].items()}
+
+    chunk_header_size = struct.calcsize("<QBQ")
+
+    def chunks():
+        with f:
+            while True:
+                name_length = f.read(2)
+                if not name_length:
+                    return
+                name = f.read(struct.unpack("<H", name_length)[0]).decode("utf-8")
+                start, encoding, length = struct.unpack("<QBQ", f.read(chunk_header_size))
+                if name not in arrays:
+                    raise RLGraphError("ERROR: Snapshot {} has a chunk of unknown array '{}'.".format(path, name))
+                chunk = _decode_chunk(encoding, decompress(f.read(length)))
+                yield name, start, chunk
+
+    return header["metadata"], arrays, chunks()
+
+
+def load_snapshot(path):
+    """
+    Reads a snapshot written by `write_snapshot` into memory.
+
+    Args:
+        path (str): Snapshot file.
+
+    Returns:
+        Tuple[dict, dict]: Metadata and name -> array.
+    """
+    metadata, array_specs, chunks = read_snapshot(path)
+    arrays = {name: np.empty(shape, dtype=dtype) for name, (dtype, shape) in array_specs.items()}
+    for name, start, chunk in chunks:
+        arrays[name][start:start + len(chunk)] = chunk
+    return metadata, arrays
+
+
+def _encode_chunk(name, chunk):
+    """
+    Encodes a chunk in the `.npy` format without pickling.
+
+    Returns:
+        Tuple[int, bytes]: Chunk encoding and data.
+    """
+    buffer = io.BytesIO()
+    if chunk.dtype != object:
+        encoding = CHUNK_ARRAY
+        np.lib.format.write_array(buffer, chunk, allow_pickle=False)
+    elif chunk.ndim != 1:
+        raise RLGraphError("ERROR: Object array '{}' must have one rank to be written to a snapshot, but has "
+                           "shape {}.".format(name, chunk.shape))
+    elif all(isinstance(value, bytes) for value in chunk.flat):
+        encoding = CHUNK_BYTES_VALUES
+        np.lib.format.write_array(buffer, np.array([len(value) for value in chunk.flat], dtype=np.int64),
+                                  allow_pickle=False)
+        np.lib.format.write_array(buffer, np.frombuffer(b"".join(chunk.flat), dtype=np.uint8),
+                                  allow_pickle=False)
+    else:
+        encoding = CHUNK_STACKED_VALUES
+        try:
+            values = np.stack([np.asarray(value) for value in chunk.flat])
+        except ValueError:
+            raise RLGraphError("ERROR: Object array '{}' can only be written to a snapshot if it holds bytes or "
+                               "equally shaped values.".format(name))
+        if values.dtype == object:
+            raise RLGraphError("ERROR: Object array '{}' holds values of unsupported type {}.".format(
+                name, type(chunk.flat[0])))
+        np.lib.format.write_array(buffer, values, allow_pickle=False)
+    return encoding, buffer.getvalue()
+
+
+def _decode_chunk(encoding, data):
+    """
+    Decodes chunk data written by `_encode_chunk`. Object arrays are restored as 1D object arrays.
+    """
+    buffer = io.BytesIO(data)
+    if encoding == CHUNK_ARRAY:
+        return np.lib.format.read_array(buffer, allow_pickle=False)
+    chunk = None
+    if encoding == CHUNK_BYTES_VALUES:
+        lengths = np.lib.format.read_array(buffer, allow_pickle=False)
+        values = np.lib.format.read_array(buffer, allow_pickle=False).tobytes()
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+        chunk = np.empty(len(lengths), dtype=object)
+        for i in range(len(lengths)):
+            chunk[i] = values[offsets[i]:offsets[i + 1]]
+    elif encoding == CHUNK_STACKED_VALUES:
+        values = np.lib.format.read_array(buffer, allow_pickle=False)
+        chunk = np.empty(len(values), dtype=object)
+        for i in range(len(values)):
+            chunk[i] = values[i]
+    else:
+        raise RLGraphError("ERROR: Unknown snapshot chunk encoding {}.".format(encoding))
+    return chunk
+
+
+def _get_chunk_rows(array):
+    if array.dtype == object or len(array) == 0:
+        return 1024
+    row_bytes = max(1, array.nbytes // len(array))
+    return max(1, CHUNK_BYTES // row_bytes)
+
+
+def _get_compressor(compression):
+    if compression == "lz4":
+        if lz4 is None:
+            raise RLGraphError("ERROR: lz4 snapshot compression requires the lz4 package.")
+        return lz4.frame.compress
+    elif compression == "zlib":
+        return lambda data: zlib.compress(data, 1)
+    elif compression == "none":
+        return lambda data: data
+    raise RLGraphError("ERROR: Snapshot compression must be 'lz4', 'zlib' or 'none' but is {}.".format(compression))
+
+
+def _get_decompressor(compression):
+    if compression == "lz4":
+        if lz4 is None:
+            raise RLGraphError("ERROR: Reading a lz4 compressed snapshot requires the lz4 package.")
+        return lz4.frame.decompress
+    elif compression == "zlib":
+        return zlib.decompress
+    elif compression == "none":
+        return lambda data: data
+    raise RLGraphError("ERROR: Unknown snapshot compression {}.".format(compression))
@@ -17,6 +17,7 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import numpy as np
 import tensorflow as tf
 
 
@@ -112,6 +113,36 @@ class SegmentTree(object):
         with tf.control_dependencies(control_inputs=[assignment]):
             return tf.no_op()
 
+    def insert_batch(self, indices, elements, insert_op=tf.add):
+        """
+        Inserts a batch of elements. Instead of walking the tree once per element, all parents of a
+        tree level are recomputed at once: one gather of their children and one scatter per level, so the
+        update takes log2(capacity) scatters independent of the batch size.
+
+        Args:
+            indices (tf.Tensor): Int32 insertion indices. If an index occurs more than once, the element
+                written is undefined.
+            elements (Union[tf.Tensor, float]): Elements to insert, a scalar is inserted at all indices.
+            insert_op (Union(tf.add, tf.minimum, tf, maximum)): Insert operation on the tree.
+
+        Returns:
+            tf.Operation: The update of the root, depending on all previous updates.
+        """
+        elements = elements * tf.ones(shape=tf.shape(indices), dtype=tf.float32)
+        indices = indices + self.capacity
+        assignment = tf.scatter_update(ref=self.values, indices=indices, updates=elements)
+
+        # Tree depth is static, so the level loop is unrolled.
+        for _ in range(int(np.log2(self.capacity))):
+            # Read children only after the previous level was written.
+            with tf.control_dependencies(control_inputs=[assignment]):
+                indices, _ = tf.unique(x=tf.div(x=indices, y=2))
+                update = insert_op(tf.gather(params=self.values, indices=2 * indices),
+                                   tf.gather(params=self.values, indices=2 * indices + 1))
+                assignment = tf.scatter_update(ref=self.values, indices=indices, updates=update)
+        with tf.control_dependencies(control_inputs=[assignment]):
+            return tf.no_op()
+
     def get(self, index):
         """
         Reads an item from the segment tree.
@@ -173,6 +204,38 @@ class SegmentTree(object):
 
         return index - self.capacity
 
+    def index_of_prefixsum_batch(self, prefix_sums):
+        """
+        Batched version of `index_of_prefixsum`: Descends the tree for all prefix sums at once,
+        with one gather per tree level instead of a `tf.while_loop` per prefix sum.
+
+        Args:
+            prefix_sums (tf.Tensor): 1D float tensor of prefix sums.
+
+        Returns:
+            tf.Tensor: Int32 indices satisfying the prefix sum condition.
+        """
+        indices = tf.ones(shape=tf.shape(prefix_sums), dtype=tf.int32)
+        for _ in range(int(np.log2(self.capacity))):
+            left_values = tf.gather(params=self.values, indices=2 * indices)
+            # Go left if the left subtree exceeds the prefix sum, else use it up and go right.
+            go_left = tf.greater(x=left_values, y=prefix_sums)
+            indices = tf.where(condition=go_left, x=2 * indices, y=2 * indices + 1)
+            prefix_sums = tf.where(condition=go_left, x=prefix_sums, y=prefix_sums - left_values)
+        return indices - self.capacity
+
+    def get_batch(self, indices):
+        """
+        Reads a batch of items from the segment tree.
+
+        Args:
+            indices (tf.Tensor): Int32 indices.
+
+        Returns:
+            tf.Tensor: The elements.
+        """
+        return tf.gather(params=self.values, indices=indices + self.capacity)
+
     def reduce(self, start, limit, reduce_op=tf.add):
         """
         Applies an operation to specified segment.
@@ -17,15 +17,19 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+from threading import Lock
+
 import numpy as np
-import operator
-from six.moves import xrange as range_
 
 from rlgraph import get_backend
 from rlgraph.utils.util import SMALL_NUMBER, get_rank, dtype as dtype_
 from rlgraph.components.memories.memory import Memory
-from rlgraph.components.helpers.mem_segment_tree import MemSegmentTree, MinSumSegmentTree
+from rlgraph.components.helpers.mem_frame_buffer import MemFrameBuffer
+from rlgraph.components.helpers.mem_map_storage import MemMapStorage
+from rlgraph.components.helpers.mem_segment_tree import NumpyMinSumSegmentTree
+from rlgraph.components.helpers.mem_snapshot import BackgroundSnapshot, read_snapshot, write_snapshot
 from rlgraph.utils.decorators import rlgraph_api
+from rlgraph.utils.rlgraph_errors import RLGraphError
 from rlgraph.spaces import Dict
 
 if get_backend() == "pytorch":
@@ -39,10 +43,32 @@ class MemPrioritizedReplay(Memory):
     API:
         update_records(indices, update) -> Updates the given indices with the given priority scores.
     """
-    def __init__(self, capacity=1000, next_states=True, alpha=1.0, beta=0.0):
+    def __init__(self, capacity=1000, next_states=True, alpha=1.0, beta=0.0, storage="columnar", frame_stack=4,
+                 frame_capacity=None, n_step_adjustment=1, memmap_dir=None):
+        """
+        Args:
+            capacity (int): Maximum capacity of the memory.
+            next_states (bool): Whether records contain next states.
+            alpha (float): Degree to which prioritization is applied.
+            beta (float): Importance sampling correction exponent.
+            storage (str): Record storage layout. "columnar" keeps one preallocated array per flattened record
+                space key, so a batch is inserted with one array assignment per key. "list" keeps a list of
+                per-record dicts. "frames" additionally
+                stores "states" and "next_states" in a `MemFrameBuffer` so every observation frame of a
+                frame-stacked state is only kept once. "memmap" stores every flattened record space key in a
+                disk-backed `np.memmap` file in `memmap_dir`, priorities stay in memory.
+            frame_stack (int): Number of frames stacked in the last rank of states for "frames" storage.
+            frame_capacity (Optional[int]): Number of frames in the frame ring for "frames" storage.
+                Records referencing overwritten frames are removed from sampling. Defaults to 1.25 * capacity.
+            n_step_adjustment (int): Offset between states and next states of inserted trajectories, used to
+                share frames between them in "frames" storage.
+            memmap_dir (Optional[str]): Directory of the record files for "memmap" storage. Defaults to a
+                temporary directory.
+        """
         super(MemPrioritizedReplay, self).__init__()
 
         self.memory_values = []
+        self.record_space_flat = None
         self.index = 0
         self.capacity = capacity
 
@@ -55,6 +81,30 @@ class MemPrioritizedReplay(Memory):
 
         self.default_new_weight = np.power(self.max_priority, self.alpha)
 
+        assert storage in ["columnar", "list", "frames", "memmap"], \
+            "ERROR: Storage must be 'columnar', 'list', 'frames' or 'memmap' but is {}.".format(storage)
+        self.storage = storage
+        self.memmap_dir = memmap_dir
+        self.record_storage = None
+        # Flattened record space key -> array of shape (capacity,) + value shape for columnar and memmap storage.
+        self.record_columns = None
+        # Held while records are written once a background snapshot was started, see `save`. Created lazily,
+        # as components must remain deep-copyable.
+        self.lock = None
+        # Background snapshot being written, preserves rows before inserts overwrite them.
+        self.snapshot = None
+        self.frame_buffer = None
+        if self.storage == "frames":
+            assert self.next_states, "ERROR: Frame storage requires next states in records."
+            if frame_capacity is None:
+                frame_capacity = capacity + capacity // 4
+            self.frame_buffer = MemFrameBuffer(frame_capacity, frame_stack, n_step_adjustment)
+            # Newest state frame position per record, total number of inserted records and oldest one
+            # not referencing overwritten frames.
+            self.frame_positions = np.zeros(capacity, dtype=np.int64)
+            self.num_inserted = 0
+            self.oldest_valid = 0
+
     def create_variables(self, input_spaces, action_space=None):
         # Store our record-space for convenience.
         self.record_space = input_spaces["records"]
@@ -66,16 +116,17 @@ class MemPrioritizedReplay(Memory):
             self.priority_capacity *= 2
 
         # Create segment trees, initialize with neutral elements.
-        sum_values = [0.0 for _ in range_(2 * self.priority_capacity)]
-        sum_segment_tree = MemSegmentTree(sum_values, self.priority_capacity, operator.add)
-        min_values = [float('inf') for _ in range_(2 * self.priority_capacity)]
-        min_segment_tree = MemSegmentTree(min_values, self.priority_capacity, min)
+        self.merged_segment_tree = NumpyMinSumSegmentTree(self.priority_capacity)
 
-        self.merged_segment_tree = MinSumSegmentTree(
-            sum_tree=sum_segment_tree,
-            min_tree=min_segment_tree,
-            capacity=self.priority_capacity
-        )
+        if self.storage == "columnar":
+            self.record_columns = {}
+            for name, space in self.record_space_flat.items():
+                self.record_columns[name] = np.zeros((self.capacity,) + space.shape, dtype=dtype_(space.dtype, "np"))
+        elif self.storage == "memmap":
+            self.record_storage = MemMapStorage(self.capacity, directory=self.memmap_dir)
+            for name, space in self.record_space_flat.items():
+                self.record_storage.create_column(name, space.shape, dtype_(space.dtype, "np"))
+            self.record_columns = self.record_storage.columns
 
     def _read_records(self, indices):
         """
@@ -87,6 +138,16 @@ class MemPrioritizedReplay(Memory):
         Returns:
              dict: Record value dict.
         """
+        if self.record_columns is not None and self.size > 0:
+            if self.storage == "memmap":
+                records = self.record_storage.read(np.asarray(indices), list(self.record_space_flat.keys()))
+            else:
+                records = {name: self.record_columns[name][indices] for name in self.record_space_flat.keys()}
+            if get_backend() == "pytorch":
+                for name, values in records.items():
+                    records[name] = torch.squeeze(torch.from_numpy(values))
+            return records
+
         records = {}
         for name in self.record_space_flat.keys():
             records[name] = []
@@ -107,10 +168,19 @@ class MemPrioritizedReplay(Memory):
                 else:
                     records[name] = np.zeros(self.record_space_flat[name].shape)
 
+        frame_keys = []
+        if self.storage == "frames" and self.size > 0:
+            frame_keys = ["states", "next_states"]
+            for name in frame_keys:
+                records[name] = self.frame_buffer.get_stacks(np.asarray(records[name]).reshape(-1))
+                if get_backend() == "pytorch":
+                    records[name] = torch.tensor(records[name])
+
         # Convert if necessary: list of tensors fails at space inference otherwise.
         if get_backend() == "pytorch":
             for name in self.record_space_flat.keys():
-                records[name] = torch.squeeze(torch.stack(records[name]))
+                if name not in frame_keys:
+                    records[name] = torch.squeeze(torch.stack(records[name]))
 
         return records
 
@@ -118,9 +188,33 @@ class MemPrioritizedReplay(Memory):
     def _graph_fn_insert_records(self, records):
         if records is None or get_rank(records['rewards']) == 0:
             return
+        if self.lock is None:
+            self._insert_records(records)
+        else:
+            with self.lock:
+                self._insert_records(records)
+
+    def _insert_records(self, records):
         num_records = len(records['rewards'])
+        if self.storage == "frames":
+            records = self._insert_frames(records)
 
-        if num_records == 1:
+        if self.record_columns is not None:
+            insert_indices = np.arange(start=self.index, stop=self.index + num_records) % self.capacity
+            # One slice or gather assignment per key, one batched tree update.
+            if self.index + num_records <= self.capacity:
+                column_indices = slice(self.index, self.index + num_records)
+            else:
+                column_indices = insert_indices
+            snapshot = self.snapshot if self.snapshot is not None and self.snapshot.is_alive() else None
+            for name, value in records.items():
+                if get_backend() == "pytorch" and isinstance(value, torch.Tensor):
+                    value = value.numpy()
+                if snapshot is not None:
+                    snapshot.preserve("columns/" + name, column_indices)
+                self.record_columns[name][column_indices] = value
+            self.merged_segment_tree.insert_batch(insert_indices, self.default_new_weight)
+        elif num_records == 1:
             if self.index >= self.size:
                 self.memory_values.append(records)
             else:
@@ -128,9 +222,9 @@ class MemPrioritizedReplay(Memory):
             self.merged_segment_tree.insert(self.index, self.default_new_weight)
         else:
             insert_indices = np.arange(start=self.index, stop=self.index + num_records) % self.capacity
+            self.merged_segment_tree.insert_batch(insert_indices, self.default_new_weight)
             i = 0
             for insert_index in insert_indices:
-                self.merged_segment_tree.insert(insert_index, self.default_new_weight)
                 record = dict()
                 for name, record_values in records.items():
                     record[name] = record_values[i]
@@ -144,36 +238,179 @@ class MemPrioritizedReplay(Memory):
         self.index = (self.index + num_records) % self.capacity
         self.size = min(self.size + num_records, self.capacity)
 
+        if self.storage == "frames":
+            self.num_inserted += num_records
+            self._remove_stale_records()
+
+    def _insert_frames(self, records):
+        """
+        Writes the frames of states and next states to the frame buffer.
+
+        Returns:
+            dict: Records with states and next states replaced by their newest-frame positions.
+        """
+        frame_values = []
+        for name in ["states", "next_states"]:
+            value = records[name]
+            if get_backend() == "pytorch" and isinstance(value, torch.Tensor):
+                value = value.numpy()
+            frame_values.append(np.asarray(value))
+        state_positions, next_state_positions = self.frame_buffer.insert(*frame_values)
+
+        insert_indices = np.arange(start=self.index, stop=self.index + len(state_positions)) % self.capacity
+        self.frame_positions[insert_indices] = state_positions
+        return dict(records, states=state_positions, next_states=next_state_positions)
+
+    def _remove_stale_records(self):
+        """
+        Removes the oldest records whose frames were overwritten in the frame ring from sampling.
+        """
+        start = max(self.oldest_valid, self.num_inserted - self.size)
+        self.oldest_valid = self.frame_buffer.find_stale(self.frame_positions, start, self.num_inserted)
+        if self.oldest_valid > start:
+            self.merged_segment_tree.remove_batch(np.arange(start, self.oldest_valid) % self.capacity)
+
     @rlgraph_api
     def _graph_fn_get_records(self, num_records=1):
-        indices = []
         prob_sum = self.merged_segment_tree.sum_segment_tree.get_sum(0, self.size - 1)
         samples = np.random.random(size=(num_records,)) * prob_sum
-        for sample in samples:
-            indices.append(self.merged_segment_tree.sum_segment_tree.index_of_prefixsum(prefix_sum=sample))
+        indices = self.merged_segment_tree.sample_batch(samples)
 
         sum_prob = self.merged_segment_tree.sum_segment_tree.get_sum() + SMALL_NUMBER
         min_prob = self.merged_segment_tree.min_segment_tree.get_min_value() / sum_prob
         max_weight = (min_prob * self.size) ** (-self.beta)
-        weights = []
-        for index in indices:
-            sample_prob = self.merged_segment_tree.sum_segment_tree.get(index) / sum_prob
-            weight = (sample_prob * self.size) ** (-self.beta)
-            weights.append(weight / max_weight)
+        sample_probs = self.merged_segment_tree.get_batch(indices) / sum_prob
+        weights = (sample_probs * self.size) ** (-self.beta) / max_weight
 
         if get_backend() == "pytorch":
             indices = torch.tensor(indices)
             weights = torch.tensor(weights)
-        else:
-            indices = np.asarray(indices)
-            weights = np.asarray(weights)
         return self._read_records(indices=indices), indices, weights
 
     @rlgraph_api(must_be_complete=False)
     def _graph_fn_update_records(self, indices, update):
         if len(indices) > 0 and indices[0]:
-            for index, loss in zip(indices, update):
-                priority = np.power(loss, self.alpha)
-                self.merged_segment_tree.insert(index, priority)
-                self.max_priority = max(self.max_priority, priority)
+            if get_backend() == "pytorch":
+                indices = indices.numpy() if isinstance(indices, torch.Tensor) else indices
+                update = update.detach().numpy() if isinstance(update, torch.Tensor) else update
+            if self.storage == "frames":
+                # Do not re-insert priorities of records removed since sampling.
+                valid = self.frame_positions[indices] >= self.frame_buffer.get_valid_start()
+                indices, update = np.asarray(indices)[valid], np.asarray(update)[valid]
+            priorities = np.power(np.asarray(update), self.alpha)
+            self.merged_segment_tree.insert_batch(indices, priorities)
+            self.max_priority = max(self.max_priority, np.max(priorities))
+
+    def save(self, path, background=False, compression=None):
+        """
+        Writes a snapshot of records, priorities, index/size and max-priority, see `write_snapshot`.
+
+        Args:
+            path (str): Snapshot file.
+            background (bool): If True, writes the snapshot in a background thread. Only index, size and
+                priorities are copied up front. Records are copied chunk by chunk while holding `self.lock`, and
+                inserts copy rows not written yet before overwriting them, so the snapshot holds the memory as
+                of the call. Not supported for "frames" storage, whose frame ring is overwritten by inserts.
+            compression (Optional[str]): Snapshot compression, see `write_snapshot`.
+
+        Returns:
+            Union[BackgroundSnapshot, None]: The snapshot being written if written in the background.
+        """
+        if background:
+            if self.storage == "frames":
+                raise RLGraphError("ERROR: Background snapshots are not supported for 'frames' storage.")
+            if self.lock is None:
+                self.lock = Lock()
+        if self.lock is None:
+            metadata, arrays = self._get_snapshot_state()
+        else:
+            # Index, size and priorities of the same insert.
+            with self.lock:
+                assert self.snapshot is None or not self.snapshot.is_alive(), \
+                    "ERROR: A background snapshot of this memory is still being written."
+                metadata, arrays = self._get_snapshot_state()
+                if background:
+                    self.snapshot = BackgroundSnapshot(path, metadata, arrays, compression, self.lock)
+                    return self.snapshot
+        write_snapshot(path, metadata, arrays, compression)
+
+    def _get_snapshot_state(self):
+        """
+        Returns:
+            Tuple[dict, dict]: Snapshot metadata and arrays, see `write_snapshot`. Priorities are copied, record
+                columns are views into the storage.
+        """
+        metadata = dict(capacity=self.capacity, storage=self.storage, index=self.index, size=self.size,
+                        max_priority=float(self.max_priority))
+        leaves = self.merged_segment_tree.sum_segment_tree.values
+        arrays = dict(priorities=np.array(leaves[self.priority_capacity:self.priority_capacity + self.size]))
+
+        for name in self.record_space_flat.keys():
+            if self.record_columns is not None:
+                arrays["columns/" + name] = self.record_columns[name][:self.size]
+            else:
+                values = np.empty(self.size, dtype=object)
+                for i, record in enumerate(self.memory_values):
+                    value = record[name]
+                    values[i] = value.numpy() if get_backend() == "pytorch" and \
+                        isinstance(value, torch.Tensor) else np.asarray(value)
+                arrays["columns/" + name] = values
+
+        if self.storage == "frames":
+            metadata.update(num_inserted=self.num_inserted, oldest_valid=self.oldest_valid)
+            frame_metadata, frame_arrays = self.frame_buffer.get_state()
+            metadata["frame_buffer"] = frame_metadata
+            arrays["frame_positions"] = self.frame_positions
+            arrays.update({"frame_buffer/" + name: value for name, value in frame_arrays.items()})
+        return metadata, arrays
+
+    def load(self, path):
+        """
+        Restores a snapshot written by `save`. Must be called after variables were created.
+
+        Args:
+            path (str): Snapshot file.
+        """
+        assert self.record_space_flat is not None, "ERROR: Memory variables must be created before loading."
+        assert self.snapshot is None or not self.snapshot.is_alive(), \
+            "ERROR: Cannot load while a background snapshot of this memory is being written."
+        metadata, array_specs, chunks = read_snapshot(path)
+        assert metadata["capacity"] == self.capacity and metadata["storage"] == self.storage, \
+            "ERROR: Snapshot of {} memory with capacity {} cannot be loaded into {} memory with capacity " \
+            "{}.".format(metadata["storage"], metadata["capacity"], self.storage, self.capacity)
+
+        targets = {}
+        for name, (dtype, shape) in array_specs.items():
+            if name.startswith("columns/") and self.record_columns is not None:
+                targets[name] = self.record_columns[name[len("columns/"):]]
+            else:
+                targets[name] = np.empty(shape, dtype=dtype)
+        for name, start, chunk in chunks:
+            targets[name][start:start + len(chunk)] = chunk
+
+        self.index = metadata["index"]
+        self.size = metadata["size"]
+        self.max_priority = metadata["max_priority"]
+        if self.record_columns is None:
+            self.memory_values = []
+            for i in range(self.size):
+                record = {}
+                for name in self.record_space_flat.keys():
+                    value = targets["columns/" + name][i]
+                    record[name] = torch.from_numpy(np.asarray(value)) if get_backend() == "pytorch" else value
+                self.memory_values.append(record)
+
+        self.merged_segment_tree = NumpyMinSumSegmentTree(self.priority_capacity)
+        priorities = targets["priorities"]
+        indices = np.arange(self.size)
+        self.merged_segment_tree.insert_batch(indices[priorities > 0], priorities[priorities > 0])
+
+        if self.storage == "frames":
+            self.num_inserted = metadata["num_inserted"]
+            self.oldest_valid = metadata["oldest_valid"]
+            self.frame_positions = targets["frame_positions"]
+            self.frame_buffer.set_state(metadata["frame_buffer"], {
+                name[len("frame_buffer/"):]: value for name, value in targets.items()
+                if name.startswith("frame_buffer/")
+            })
 
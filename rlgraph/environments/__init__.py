@@ -24,6 +24,8 @@ from rlgraph.environments.openai_gym import OpenAIGymEnv
 from rlgraph.environments.random_env import RandomEnv
 from rlgraph.environments.vector_env import VectorEnv
 from rlgraph.environments.sequential_vector_env import SequentialVectorEnv
+from rlgraph.environments.process_vector_env import ProcessVectorEnv
+from rlgraph.environments.grid_world_vector_env import GridWorldVectorEnv
 
 
 Environment.__lookup_classes__ = dict(
@@ -36,7 +38,11 @@ Environment.__lookup_classes__ = dict(
     randomenv=RandomEnv,
     random=RandomEnv,
     sequentialvector=SequentialVectorEnv,
-    sequentialvectorenv=SequentialVectorEnv
+    sequentialvectorenv=SequentialVectorEnv,
+    processvector=ProcessVectorEnv,
+    processvectorenv=ProcessVectorEnv,
+    gridworldvector=GridWorldVectorEnv,
+    gridworldvectorenv=GridWorldVectorEnv
 )
 
 try:
@@ -209,25 +209,8 @@ class GridWorld(Environment):
         next_state_idx = np.random.choice(len(probs), p=probs)
         self.discrete_pos = possible_next_positions[next_state_idx][0]
 
-        next_x = self.discrete_pos // self.n_col
-        next_y = self.discrete_pos % self.n_col
-
         # determine reward and done flag
-        next_state_type = self.world[next_y, next_x]
-        if next_state_type == "H":
-            self.is_terminal = True
-            self.reward = -5 if self.reward_function == "sparse" else -10
-        elif next_state_type == "F":
-            self.is_terminal = False
-            self.reward = -3 if self.reward_function == "sparse" else -10
-        elif next_state_type in [" ", "S"]:
-            self.is_terminal = False
-            self.reward = -1
-        elif next_state_type == "G":
-            self.is_terminal = True
-            self.reward = 1 if self.reward_function == "sparse" else 50
-        else:
-            raise NotImplementedError
+        self.reward, self.is_terminal = self.get_reward_and_terminal(self.discrete_pos)
 
         self.refresh_state()
 
@@ -292,6 +275,30 @@ class GridWorld(Environment):
         else:
             return [(next_pos, 1.)]
 
+    def get_reward_and_terminal(self, discrete_pos):
+        """
+        Returns the reward for moving into a discrete position and whether this terminates the episode.
+
+        Args:
+            discrete_pos (int): The discrete position moved into.
+
+        Returns:
+            Tuple[float,bool]: The reward and the terminal flag.
+        """
+        x = discrete_pos // self.n_col
+        y = discrete_pos % self.n_col
+        state_type = self.world[y, x]
+        if state_type == "H":
+            return (-5 if self.reward_function == "sparse" else -10), True
+        elif state_type == "F":
+            return (-3 if self.reward_function == "sparse" else -10), False
+        elif state_type in [" ", "S"]:
+            return -1, False
+        elif state_type == "G":
+            return (1 if self.reward_function == "sparse" else 50), True
+        else:
+            raise NotImplementedError
+
     def update_cam_pixels(self):
         # Init camera?
         if self.camera_pixels is None:
@@ -0,0 +1,170 @@
+# Copyright 2018 The RLgraph authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+from six.moves import xrange as range_
+
+from rlgraph.environments import VectorEnv, Environment
+from rlgraph.environments.grid_world import GridWorld
+from rlgraph.environments.reset_pool import ResetMetrics
+from rlgraph.utils.rlgraph_errors import RLGraphError
+
+
+class GridWorldVectorEnv(VectorEnv):
+    """
+    Multi-environment class stepping N copies of a `GridWorld` at once with array operations.
+
+    The positions of all worlds are kept in one array. Transitions, rewards and terminals of the world are
+    tabulated once per (position, action) from the `GridWorld` itself, so a step of all worlds is a few
+    array lookups and results match stepping the `GridWorld`s one by one. States, rewards and terminals are
+    returned as arrays over the stepped worlds.
+    """
+    def __init__(self, num_envs, env_spec):
+        """
+        Args:
+            num_envs (int): Number of worlds.
+            env_spec (Union[callable, dict]): Spec dict of a `GridWorld`, or a callable returning one. Only this
+                single instance is created to read the map, spaces and rewards.
+        """
+        if isinstance(env_spec, dict):
+            self.grid_world = Environment.from_spec(env_spec)
+        elif hasattr(env_spec, '__call__'):
+            self.grid_world = env_spec()
+        else:
+            raise ValueError("Env_spec must be either a dict containing an environment spec or a callable"
+                             "returning a new environment object.")
+        if not isinstance(self.grid_world, GridWorld):
+            raise RLGraphError("ERROR: GridWorldVectorEnv requires a GridWorld, got {}.".format(self.grid_world))
+        if self.grid_world.n_row != self.grid_world.n_col:
+            raise RLGraphError("ERROR: GridWorldVectorEnv requires a square world, world has shape {}.".format(
+                self.grid_world.world.shape))
+        Environment.__init__(self, state_space=self.grid_world.state_space,
+                             action_space=self.grid_world.action_space)
+        self.num_envs = num_envs
+        self.environments = list()
+        self.reset_metrics = ResetMetrics()
+
+        num_positions = self.grid_world.n_row * self.grid_world.n_col
+        # (position, action) -> next position.
+        self.transitions = np.zeros((num_positions, self.action_space.num_categories), dtype=np.int64)
+        # Position moved into -> reward and terminal.
+        self.position_rewards = np.zeros(num_positions, dtype=np.float32)
+        self.position_terminals = np.zeros(num_positions, dtype=np.bool_)
+        for pos in range_(num_positions):
+            for action in range_(self.action_space.num_categories):
+                # All transitions of a `GridWorld` are deterministic.
+                next_positions = self.grid_world.get_possible_next_positions(pos, action)
+                self.transitions[pos, action] = next_positions[0][0]
+            # Walls cannot be moved into.
+            if self.grid_world.world[pos % self.grid_world.n_col, pos // self.grid_world.n_col] != "W":
+                self.position_rewards[pos], self.position_terminals[pos] = \
+                    self.grid_world.get_reward_and_terminal(pos)
+
+        # Camera states are the static world image plus the pawn in the 3rd channel.
+        self.camera_pixels = None
+        if self.grid_world.state_representation != "discr":
+            self.grid_world.update_cam_pixels()
+            self.camera_pixels = np.array(self.grid_world.camera_pixels)
+            self.camera_pixels[:, :, 2] = 0
+
+        self.positions = np.full(num_envs, self.grid_world.default_start_pos, dtype=np.int64)
+        # Group of env indices -> actions of a step started via `step_async`.
+        self.pending_steps = dict()
+
+    def get_env(self):
+        """
+        Returns the `GridWorld` instance the worlds are tabulated from. It is not stepped with the others.
+
+        Returns:
+            Environment: Environment instance.
+        """
+        return self.grid_world
+
+    def render(self):
+        # Paints the first world.
+        self.grid_world.discrete_pos = int(self.positions[0])
+        self.grid_world.render()
+
+    def seed(self, seed=None):
+        # Transitions are deterministic, so this only seeds numpy as `GridWorld` does.
+        return [self.grid_world.seed(seed)] * self.num_envs
+
+    def reset_all(self):
+        self.positions[:] = self.grid_world.default_start_pos
+        for _ in range_(self.num_envs):
+            self.reset_metrics.record()
+        return self._get_states(self.positions)
+
+    def reset(self, index=0):
+        self.positions[index] = self.grid_world.default_start_pos
+        self.reset_metrics.record()
+        return self._get_states(self.positions[index:index + 1])[0]
+
+    def get_reset_metrics(self):
+        return self.reset_metrics.get_metrics()
+
+    def step(self, actions):
+        return self._step_envs(actions, None)
+
+    def step_async(self, actions, indices=None):
+        group = self._get_group(indices)
+        assert group not in self.pending_steps, "ERROR: Environments {} already have a step in flight.".format(group)
+        self.pending_steps[group] = actions
+
+    def step_wait(self, indices=None):
+        group = self._get_group(indices)
+        actions = self.pending_steps.pop(group)
+        return self._step_envs(actions, None if len(group) == self.num_envs else list(group))
+
+    def _step_envs(self, actions, indices):
+        """
+        Steps a number of worlds.
+
+        Args:
+            actions (any): Actions, one per stepped world.
+            indices (Optional[list]): Worlds to step, in the order of `actions`. None steps all worlds.
+
+        Returns:
+            tuple: States, rewards, terminals and infos of the stepped worlds.
+        """
+        actions = np.asarray(actions, dtype=np.int64)
+        if indices is None:
+            positions = self.transitions[self.positions, actions]
+            self.positions[:] = positions
+        else:
+            positions = self.transitions[self.positions[indices], actions]
+            self.positions[indices] = positions
+        return self._get_states(positions), self.position_rewards[positions], self.position_terminals[positions], \
+            [None] * len(positions)
+
+    def _get_states(self, positions):
+        """
+        Returns:
+            np.ndarray: States of worlds at the given positions.
+        """
+        if self.camera_pixels is None:
+            return np.array(positions)
+        states = np.repeat(self.camera_pixels[np.newaxis], len(positions), axis=0)
+        # Pawn at row y, column x of the world.
+        y, x = positions % self.grid_world.n_col, positions // self.grid_world.n_col
+        states[np.arange(len(positions)), y, x, 2] = 255
+        return states
+
+    def __str__(self):
+        return "GridWorldVectorEnv({} x {})".format(self.num_envs, self.grid_world)
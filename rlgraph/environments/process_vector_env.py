@@ -0,0 +1,295 @@
+# Copyright 2018 The RLgraph authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from collections import deque
+import multiprocessing
+import time
+import traceback
+
+import numpy as np
+from six.moves import xrange as range_
+
+from rlgraph.environments import VectorEnv, Environment
+from rlgraph.environments.reset_pool import ResetMetrics
+from rlgraph.spaces import ContainerSpace
+from rlgraph.utils.rlgraph_errors import RLGraphError
+
+
+class ProcessVectorEnv(VectorEnv):
+    """
+    Multi-environment class which steps its environments in parallel in worker processes, each running a
+    contiguous group of the environments.
+
+    Observations are written by the worker processes into one preallocated shared-memory array of shape
+    (num_envs,) + state shape, so only actions, rewards, terminals and infos are sent between processes.
+    `step`, `reset` and `reset_all` return views into this array, which are overwritten by the next call to
+    any of them. Callers keeping states across steps must copy them.
+    """
+    # States returned by `step` and `reset` are views into a buffer which is overwritten by the next call.
+    returns_state_views = True
+
+    def __init__(self, num_envs, env_spec, num_processes=None, async_reset=False, start_method="spawn"):
+        """
+        Args:
+            num_envs (int): Number of environments.
+            env_spec (Union[callable, dict]): Environment spec dict, or a picklable callable returning a new
+                environment.
+            num_processes (Optional[int]): Number of worker processes. Defaults to one per environment, capped
+                at the number of CPUs.
+            async_reset (bool): If True, worker processes reset terminated environments right after returning
+                their step results, so a following `reset` returns the prepared state without waiting.
+            start_method (str): Multiprocessing start method.
+        """
+        # Only one environment lives in this process, e.g. to read spaces. It is not stepped.
+        if isinstance(env_spec, dict):
+            self.local_env = Environment.from_spec(env_spec)
+        elif hasattr(env_spec, '__call__'):
+            self.local_env = env_spec()
+        else:
+            raise ValueError("Env_spec must be either a dict containing an environment spec or a callable"
+                             "returning a new environment object.")
+        Environment.__init__(self, state_space=self.local_env.state_space, action_space=self.local_env.action_space)
+        if isinstance(self.state_space, ContainerSpace):
+            raise RLGraphError("ERROR: ProcessVectorEnv requires a non-container state space, state space is "
+                               "{}.".format(self.state_space))
+        self.num_envs = num_envs
+        self.environments = list()
+        self.async_reset = async_reset
+        self.reset_metrics = ResetMetrics()
+
+        # Shared state buffer.
+        states_shape = (num_envs,) + tuple(self.state_space.shape)
+        states_dtype = np.dtype(self.state_space.dtype).str
+        context = multiprocessing.get_context(start_method)
+        num_bytes = int(np.prod(states_shape)) * np.dtype(states_dtype).itemsize
+        self.raw_states = context.RawArray("b", max(num_bytes, 1))
+        self.states = np.frombuffer(self.raw_states, dtype=states_dtype, count=int(np.prod(states_shape))).\
+            reshape(states_shape)
+
+        num_processes = min(num_processes or multiprocessing.cpu_count(), num_envs)
+        self.env_groups = [list(group) for group in np.array_split(np.arange(num_envs), num_processes)]
+        # Env index -> index of its process.
+        self.env_processes = dict()
+        self.connections = []
+        self.processes = []
+        # Per process: Ids of requests sent, but whose replies were not received yet.
+        self.pending_requests = []
+        # Request id -> reply received, but not yet waited on.
+        self.replies = dict()
+        self.num_requests = 0
+        # Group of env indices -> (process index, request id, env indices) for a step started via `step_async`.
+        self.pending_steps = dict()
+        for process_index, env_indices in enumerate(self.env_groups):
+            for env_index in env_indices:
+                self.env_processes[env_index] = process_index
+            connection, child_connection = context.Pipe()
+            process = context.Process(target=run_env_process, args=(
+                child_connection, env_spec, env_indices, self.raw_states, states_shape, states_dtype, async_reset
+            ))
+            process.daemon = True
+            process.start()
+            child_connection.close()
+            self.connections.append(connection)
+            self.processes.append(process)
+            self.pending_requests.append(deque())
+
+    def get_env(self):
+        """
+        Returns an environment instance living in this process. It is not stepped with the others.
+
+        Returns:
+            Environment: Environment instance.
+        """
+        return self.local_env
+
+    def get_env_groups(self, num_groups):
+        # Groups of whole processes, so groups do not queue behind each other in the same process.
+        if len(self.env_groups) < num_groups:
+            return super(ProcessVectorEnv, self).get_env_groups(num_groups)
+        process_groups = np.array_split(np.arange(len(self.env_groups)), num_groups)
+        return [tuple(int(i) for process_index in process_indices for i in self.env_groups[process_index])
+                for process_indices in process_groups]
+
+    def render(self):
+        raise RLGraphError("ERROR: Environments stepped in worker processes cannot be rendered.")
+
+    def seed(self, seed=None):
+        requests = [self._send(process_index, "seed", seed) for process_index in range_(len(self.connections))]
+        seeds = []
+        for process_index, request in enumerate(requests):
+            seeds.extend(self._wait(process_index, request))
+        return seeds
+
+    def reset_all(self):
+        requests = [self._send(process_index, "reset", env_indices)
+                    for process_index, env_indices in enumerate(self.env_groups)]
+        for process_index, request in enumerate(requests):
+            self._wait(process_index, request)
+        return self.states
+
+    def reset(self, index=0):
+        start = time.perf_counter()
+        process_index = self.env_processes[index]
+        self._wait(process_index, self._send(process_index, "reset", [index]))
+        self.reset_metrics.record(stall_time=time.perf_counter() - start)
+        return self.states[index]
+
+    def get_reset_metrics(self):
+        return self.reset_metrics.get_metrics()
+
+    def step(self, actions):
+        self.step_async(actions)
+        return self.step_wait()
+
+    def step_async(self, actions, indices=None):
+        group = self._get_group(indices)
+        assert group not in self.pending_steps, "ERROR: Environments {} already have a step in flight.".format(group)
+        # Process index -> (env index, action) pairs. All actions are sent first so the processes step in parallel.
+        process_actions = dict()
+        for env_index, action in zip(group, actions):
+            process_actions.setdefault(self.env_processes[env_index], []).append((env_index, action))
+        self.pending_steps[group] = [
+            (process_index, self._send(process_index, "step", env_actions), [i for i, _ in env_actions])
+            for process_index, env_actions in process_actions.items()
+        ]
+
+    def step_wait(self, indices=None):
+        group = self._get_group(indices)
+        rewards, terminals, infos = dict(), dict(), dict()
+        for process_index, request, env_indices in self.pending_steps.pop(group):
+            process_rewards, process_terminals, process_infos = self._wait(process_index, request)
+            for i, env_index in enumerate(env_indices):
+                rewards[env_index] = process_rewards[i]
+                terminals[env_index] = process_terminals[i]
+                infos[env_index] = process_infos[i]
+        states = self.states if len(group) == self.num_envs else self.states[list(group)]
+        return states, [rewards[i] for i in group], [terminals[i] for i in group], [infos[i] for i in group]
+
+    def terminate(self):
+        for connection in self.connections:
+            try:
+                connection.send(("close", None))
+            except (BrokenPipeError, EOFError, OSError):
+                pass
+        for process in self.processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self.local_env.terminate()
+
+    def _send(self, process_index, command, data):
+        """
+        Sends a command to a worker process.
+
+        Args:
+            process_index (int): Index of the process.
+            command (str): Command name.
+            data (any): Command data.
+
+        Returns:
+            int: Request id to wait on via `_wait`.
+        """
+        self.num_requests += 1
+        self.connections[process_index].send((command, data))
+        self.pending_requests[process_index].append(self.num_requests)
+        return self.num_requests
+
+    def _wait(self, process_index, request):
+        """
+        Waits for the reply to a request. Processes reply to their requests in order, so replies to earlier
+        requests, e.g. to steps of another group still in flight, are received first and kept until waited on.
+
+        Args:
+            process_index (int): Index of the process.
+            request (int): Request id returned by `_send`.
+
+        Returns:
+            any: Reply data.
+        """
+        while request not in self.replies:
+            received_request = self.pending_requests[process_index].popleft()
+            success, result = self.connections[process_index].recv()
+            if not success:
+                raise RLGraphError("ERROR: Environment worker process failed:\n{}".format(result))
+            self.replies[received_request] = result
+        return self.replies.pop(request)
+
+    def __str__(self):
+        return "ProcessVectorEnv({} x {})".format(self.num_envs, self.local_env)
+
+
+def run_env_process(connection, env_spec, env_indices, raw_states, states_shape, states_dtype, async_reset):
+    """
+    Runs a group of environments in a worker process of a `ProcessVectorEnv`, writing their states into
+    the shared state buffer.
+
+    Args:
+        connection (multiprocessing.Connection): Pipe to the vector env receiving (command, data) tuples. Step
+            commands carry (env index, action) pairs, so a subset of the environments can be stepped.
+        env_spec (Union[callable, dict]): Environment spec.
+        env_indices (list): Indices of the environments of this process in the vector.
+        raw_states (multiprocessing.RawArray): Shared state buffer.
+        states_shape (tuple): Shape of the state buffer.
+        states_dtype (str): Dtype of the state buffer.
+        async_reset (bool): Whether to reset terminated environments right after replying to a step.
+    """
+    states = np.frombuffer(raw_states, dtype=states_dtype, count=int(np.prod(states_shape))).reshape(states_shape)
+    environments = dict()
+    # Env index -> state of an environment reset in the background.
+    reset_states = dict()
+    try:
+        for env_index in env_indices:
+            environments[env_index] = Environment.from_spec(env_spec) if isinstance(env_spec, dict) else env_spec()
+
+        while True:
+            command, data = connection.recv()
+            if command == "step":
+                rewards, terminals, infos = [], [], []
+                for env_index, action in data:
+                    # Stepping without a reset continues from the background reset.
+                    reset_states.pop(env_index, None)
+                    state, reward, terminal, info = environments[env_index].step(action)
+                    states[env_index] = state
+                    rewards.append(reward)
+                    terminals.append(terminal)
+                    infos.append(info)
+                connection.send((True, (rewards, terminals, infos)))
+                if async_reset:
+                    for (env_index, _), terminal in zip(data, terminals):
+                        if terminal:
+                            reset_states[env_index] = environments[env_index].reset()
+            elif command == "reset":
+                for env_index in data:
+                    if env_index in reset_states:
+                        states[env_index] = reset_states.pop(env_index)
+                    else:
+                        states[env_index] = environments[env_index].reset()
+                connection.send((True, None))
+            elif command == "seed":
+                connection.send((True, [environments[env_index].seed(data) for env_index in env_indices]))
+            elif command == "close":
+                for env in environments.values():
+                    env.terminate()
+                break
+    except KeyboardInterrupt:
+        pass
+    except Exception:
+        connection.send((False, traceback.format_exc()))
+    finally:
+        connection.close()
@@ -0,0 +1,209 @@
+# Copyright 2018 The RLgraph authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from threading import Lock, Thread
+import time
+
+from six.moves import queue
+from six.moves import xrange as range_
+
+from rlgraph.environments.environment import Environment
+from rlgraph.utils.rlgraph_errors import RLGraphError
+
+
+class ResetMetrics(object):
+    """
+    Counts environment resets and the time callers stalled waiting on them.
+    """
+    def __init__(self):
+        self.lock = Lock()
+        self.num_resets = 0
+        # Resets which had to wait for an environment to be reset.
+        self.num_reset_stalls = 0
+        self.reset_stall_time = 0.0
+        self.max_reset_stall_time = 0.0
+
+    def record(self, stall_time=None):
+        """
+        Records a reset.
+
+        Args:
+            stall_time (Optional[float]): Time in seconds the caller waited on the reset, None if it did not wait.
+        """
+        with self.lock:
+            self.num_resets += 1
+            if stall_time is not None:
+                self.num_reset_stalls += 1
+                self.reset_stall_time += stall_time
+                self.max_reset_stall_time = max(self.max_reset_stall_time, stall_time)
+
+    def get_metrics(self):
+        """
+        Returns:
+            dict: Number of resets, number of resets which stalled the caller, and total, mean and max stall time.
+        """
+        with self.lock:
+            return dict(
+                resets=self.num_resets,
+                reset_stalls=self.num_reset_stalls,
+                reset_stall_time=self.reset_stall_time,
+                mean_reset_stall_time=self.reset_stall_time / self.num_resets if self.num_resets > 0 else 0.0,
+                max_reset_stall_time=self.max_reset_stall_time
+            )
+
+
+class Resetter(object):
+    """
+    Resets environments synchronously in the calling thread.
+    """
+    def __init__(self):
+        self.metrics = ResetMetrics()
+
+    def swap(self, env):
+        """
+        Trades an environment in need of reset for a ready to use environment.
+
+        Args:
+            env (Environment): Environment object.
+
+        Returns:
+            any, Environment: State and ready to use environment.
+        """
+        start = time.perf_counter()
+        state = env.reset()
+        self.metrics.record(stall_time=time.perf_counter() - start)
+        return state, env
+
+    def get_metrics(self):
+        """
+        Returns:
+            dict: Reset metrics, see `ResetMetrics.get_metrics`.
+        """
+        return self.metrics.get_metrics()
+
+    def terminate(self):
+        pass
+
+    @staticmethod
+    def continues_episode(env):
+        """
+        Checks if a reset continues the running game instead of starting a new one, e.g. after a lost life of an
+        `OpenAIGymEnv` with `episodic_life`. Such environments cannot be swapped for another environment.
+
+        Args:
+            env (Environment): Environment object.
+
+        Returns:
+            bool: True if the environment must be reset itself.
+        """
+        return getattr(env, "episodic_life", False) is True and not env.true_terminal
+
+
+class ResetPool(Resetter):
+    """
+    Keeps a number of spare environments reset in a pool of background threads. Environments in need of a reset
+    are swapped for a spare one and reset in the background, so the full reset sequence of an environment,
+    e.g. no-op starts and firing for `OpenAIGymEnv`, does not stall the stepping of the other environments.
+    An environment whose reset fails is replaced by a new one, and the error is raised by the next swap.
+
+    n.b. mechanism originally seen in RLlib, since removed.
+    """
+    def __init__(self, env_spec, num_spare_envs=1, num_threads=1, timeout=None):
+        """
+        Args:
+            env_spec (Union[callable, dict]): Environment spec dict, or a callable returning a new environment.
+            num_spare_envs (int): Number of environments reset ahead of time. Swaps only stall if all of them are
+                still being reset.
+            num_threads (int): Number of threads resetting environments.
+            timeout (Optional[float]): Max time in seconds a swap waits for a reset environment. None waits
+                indefinitely.
+        """
+        super(ResetPool, self).__init__()
+        assert num_spare_envs >= 1, "ERROR: Reset pool requires at least one spare environment."
+        assert num_threads >= 1, "ERROR: Reset pool requires at least one thread."
+        self.env_spec = env_spec
+        self.timeout = timeout
+        self.in_need_reset = queue.Queue()
+        self.out_ready = queue.Queue()
+
+        # Spare environments are reset by the pool threads.
+        for _ in range_(num_spare_envs):
+            self.in_need_reset.put(self._create_env())
+
+        self.threads = []
+        for _ in range_(num_threads):
+            thread = Thread(target=self._run)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def swap(self, env):
+        if self.continues_episode(env):
+            return super(ResetPool, self).swap(env)
+
+        start = time.perf_counter()
+        stalled = self.out_ready.empty()
+        # `env` is only handed to the pool once a reset environment was received, so it stays with the caller
+        # if this raises.
+        try:
+            state, ready_to_use_env = self.out_ready.get(timeout=self.timeout)
+        except queue.Empty:
+            raise RLGraphError("ERROR: No reset environment ready after {} s, consider more spare environments "
+                               "or reset threads.".format(self.timeout))
+        if isinstance(ready_to_use_env, Exception):
+            raise ready_to_use_env
+        self.in_need_reset.put(env)
+        self.metrics.record(stall_time=time.perf_counter() - start if stalled else None)
+        return state, ready_to_use_env
+
+    def terminate(self):
+        # Stop threads, then close the spare environments.
+        for _ in self.threads:
+            self.in_need_reset.put(None)
+        for thread in self.threads:
+            thread.join(timeout=5)
+        while not self.out_ready.empty():
+            _, env = self.out_ready.get()
+            if isinstance(env, Environment):
+                env.terminate()
+
+    def _create_env(self):
+        return Environment.from_spec(self.env_spec) if isinstance(self.env_spec, dict) else self.env_spec()
+
+    def _run(self):
+        # Keeps resetting environments as they come in.
+        while True:
+            env = self.in_need_reset.get()
+            if env is None:
+                break
+            try:
+                state = env.reset()
+                self.out_ready.put((state, env))
+            except Exception as e:
+                # Raised in the thread swapping.
+                self.out_ready.put((None, e))
+                # Replace the failed environment so the pool keeps its size.
+                try:
+                    env.terminate()
+                except Exception:
+                    pass
+                try:
+                    self.in_need_reset.put(self._create_env())
+                except Exception as create_error:
+                    self.out_ready.put((None, create_error))
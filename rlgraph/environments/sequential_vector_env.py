@@ -17,10 +17,8 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
-from queue import Queue
-from threading import Thread
-
-from rlgraph.environments import VectorEnv, Environment
+from rlgraph.environments import VectorEnv
+from rlgraph.environments.reset_pool import Resetter, ResetPool
 from six.moves import xrange as range_
 
 
@@ -28,19 +26,28 @@ class SequentialVectorEnv(VectorEnv):
     """
     Sequential multi-environment class which iterates over a list of environments
     to step them.
+
+    Steps started via `step_async` are executed in `step_wait`, so they do not overlap with the caller.
     """
-    def __init__(self, num_envs, env_spec, num_background_envs=1, async_reset=False):
+    def __init__(self, num_envs, env_spec, num_background_envs=1, async_reset=False, num_reset_threads=1,
+                 reset_timeout=None):
         """
             num_background_envs (Optional([int]): Number of environments asynchronously
                 reset in the background. Need to be calibrated depending on reset cost.
-            async_reset (Optional[bool]): If true, resets envs asynchronously in another thread.
+            async_reset (Optional[bool]): If true, resets envs asynchronously in a `ResetPool`.
+            num_reset_threads (int): Number of threads resetting environments if `async_reset` is True.
+            reset_timeout (Optional[float]): Max time in seconds to wait for a reset environment if `async_reset`
+                is True. None waits indefinitely.
         """
         super(SequentialVectorEnv, self).__init__(num_envs, env_spec)
         self.async_reset = async_reset
         if self.async_reset:
-            self.resetter = ThreadedResetter(env_spec, num_background_envs)
+            self.resetter = ResetPool(env_spec, num_spare_envs=num_background_envs, num_threads=num_reset_threads,
+                                      timeout=reset_timeout)
         else:
             self.resetter = Resetter()
+        # Group of env indices -> actions of a step started via `step_async`.
+        self.pending_steps = dict()
 
     def seed(self, seed=None):
         return [env.seed(seed) for env in self.environments]
@@ -58,10 +65,30 @@ class SequentialVectorEnv(VectorEnv):
         self.environments[index] = env
         return state
 
+    def get_reset_metrics(self):
+        return self.resetter.get_metrics()
+
+    def terminate(self):
+        self.resetter.terminate()
+        for env in self.environments:
+            env.terminate()
+
     def step(self, actions):
+        return self._step_envs(actions, range_(self.num_envs))
+
+    def step_async(self, actions, indices=None):
+        group = self._get_group(indices)
+        assert group not in self.pending_steps, "ERROR: Environments {} already have a step in flight.".format(group)
+        self.pending_steps[group] = actions
+
+    def step_wait(self, indices=None):
+        group = self._get_group(indices)
+        return self._step_envs(self.pending_steps.pop(group), group)
+
+    def _step_envs(self, actions, indices):
         states, rewards, terminals, infos = [], [], [], []
-        for i in range_(self.num_envs):
-            state, reward, terminal, info = self.environments[i].step(actions[i])
+        for i, action in zip(indices, actions):
+            state, reward, terminal, info = self.environments[i].step(action)
             states.append(state)
             rewards.append(reward)
             terminals.append(terminal)
@@ -70,51 +97,3 @@ class SequentialVectorEnv(VectorEnv):
 
     def __str__(self):
         return [str(env) for env in self.environments]
-
-
-class Resetter(object):
-
-    def swap(self, env):
-        return env.reset(), env
-
-
-class ThreadedResetter(Thread):
-    """
-    Keeps resetting environments in a queue,
-
-    n.b. mechanism originally seen ins RLlib, since removed.
-    """
-
-    def __init__(self, env_spec, num_environments):
-        super(ThreadedResetter, self).__init__()
-        self.daemon = True
-        self.in_need_reset = Queue()
-        self.out_ready = Queue()
-
-        # Create a set of environments ready to use.
-        for _ in range_(num_environments):
-            env = Environment.from_spec(env_spec)
-            state = env.reset()
-            self.out_ready.put((state, env))
-
-        self.start()
-
-    def swap(self, env):
-        """
-        Trade environment in need of reset for ready to use environment.
-        Args:
-            env (Environment): Environment object.
-
-        Returns:
-            any, Environment: State and ready to use environment.
-        """
-        self.in_need_reset.put(env)
-        state, ready_to_use_env = self.out_ready.get(timeout=30)
-        return state, ready_to_use_env
-
-    def run(self):
-        # Keeps resetting environments as they come in.
-        while True:
-            env = self.in_need_reset.get()
-            state = env.reset()
-            self.out_ready.put((state, env))
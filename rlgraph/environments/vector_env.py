@@ -17,9 +17,10 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import numpy as np
+from six.moves import xrange as range_
 
 from rlgraph.environments import Environment
-from six.moves import xrange as range_
 
 
 class VectorEnv(Environment):
@@ -27,6 +28,9 @@ class VectorEnv(Environment):
     Abstract multi-environment class to support stepping multiple environments
     at once.
     """
+    # Whether states returned by `step` and `reset` are views into a buffer overwritten by the next call.
+    returns_state_views = False
+
     def __init__(self, num_envs, env_spec):
         """
         Args:
@@ -92,5 +96,55 @@ class VectorEnv(Environment):
         """
         raise NotImplementedError
 
+    def step_async(self, actions, indices=None):
+        """
+        Starts stepping environments without waiting for the results, which are returned by `step_wait`.
+        Each group of environments can have at most one step in flight, but different groups can be stepped
+        concurrently.
+
+        Args:
+            actions (any): Actions, one per stepped environment.
+            indices (Optional[Sequence[int]]): Environments to step. Defaults to all.
+        """
+        raise NotImplementedError
+
+    def step_wait(self, indices=None):
+        """
+        Waits for the step started by `step_async` with the same indices.
+
+        Args:
+            indices (Optional[Sequence[int]]): Environments stepped. Defaults to all.
+
+        Returns:
+            tuple: States, rewards, terminals and infos of the stepped environments, in the order of `indices`.
+        """
+        raise NotImplementedError
+
+    def get_reset_metrics(self):
+        """
+        Returns:
+            dict: Number of resets and the time spent waiting on them, see `ResetMetrics.get_metrics`.
+        """
+        raise NotImplementedError
+
+    def get_env_groups(self, num_groups):
+        """
+        Splits the environments into contiguous groups to be stepped independently via `step_async`.
+
+        Args:
+            num_groups (int): Number of groups.
+
+        Returns:
+            list: Tuples of environment indices.
+        """
+        return [tuple(int(i) for i in group) for group in np.array_split(np.arange(self.num_envs), num_groups)]
+
+    def _get_group(self, indices):
+        """
+        Returns:
+            tuple: The given environment indices, or all indices if None.
+        """
+        return tuple(range_(self.num_envs)) if indices is None else tuple(indices)
+
     def __str__(self):
         return [str(env) for env in self.environments]
@@ -18,13 +18,22 @@ from __future__ import division
 from __future__ import print_function
 
 from rlgraph.execution.environment_sample import EnvironmentSample
+from rlgraph.execution.metrics import RingBuffer, MetricsSink, JsonLinesSink, CsvSink, PrometheusSink
 from rlgraph.execution.worker import Worker
 from rlgraph.execution.single_threaded_worker import SingleThreadedWorker
 
-__all__ = ["Worker", "SingleThreadedWorker", "EnvironmentSample"]
+__all__ = ["Worker", "SingleThreadedWorker", "EnvironmentSample", "RingBuffer", "MetricsSink", "JsonLinesSink",
+           "CsvSink", "PrometheusSink"]
 
 Worker.__lookup_classes__ = dict(
    single=SingleThreadedWorker,
    singlethreadedworker=SingleThreadedWorker,
    singlethreaded=SingleThreadedWorker
-)
\ No newline at end of file
+)
+
+MetricsSink.__lookup_classes__ = dict(
+    jsonl=JsonLinesSink,
+    jsonlines=JsonLinesSink,
+    csv=CsvSink,
+    prometheus=PrometheusSink
+)
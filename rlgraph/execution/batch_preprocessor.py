@@ -0,0 +1,173 @@
+# Copyright 2018 The RLgraph authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from copy import deepcopy
+
+import cv2
+import numpy as np
+from six.moves import xrange as range_
+
+from rlgraph.components.layers.preprocessing import PreprocessLayer, GrayScale, ImageResize, ConvertType, \
+    Multiply, Divide, Clip, Sequence
+from rlgraph.utils import util
+from rlgraph.utils.rlgraph_errors import RLGraphError
+
+# Max number of channels of an image passed to `cv2.resize`, which is 4 for all interpolations in OpenCV 5.
+CV2_MAX_CHANNELS = 4
+
+
+class BatchPreprocessor(object):
+    """
+    Python preprocessing of the states of all environments of a worker at once, as an alternative to one
+    Python `PreprocessorStack` per environment.
+
+    Takes the same preprocessing spec and produces the same outputs, but every layer processes the batch of
+    states in one call: Images of all environments are gray-scaled in a single cv2 call, single-channel images
+    are resized 4 at a time as the channels of one image, and the `Sequence` state of all environments lives in
+    one ring buffer of shape (num_envs, sequence_length, ...) which is reset per environment.
+    """
+    def __init__(self, preprocessing_spec, num_envs):
+        """
+        Args:
+            preprocessing_spec (list): Preprocessing layer specs, as for a `PreprocessorStack`. Supported layers
+                are grayscale, image_resize, convert_type, multiply, divide, clip and sequence.
+            num_envs (int): Number of environments.
+        """
+        self.num_envs = num_envs
+        self.layers = []
+        for spec in deepcopy(preprocessing_spec):
+            spec["backend"] = "python"
+            layer = PreprocessLayer.from_spec(spec)
+            if not isinstance(layer, (GrayScale, ImageResize, ConvertType, Multiply, Divide, Clip, Sequence)):
+                raise RLGraphError("ERROR: Preprocessing layer {} is not supported by batch preprocessing.".format(
+                    type(layer).__name__))
+            self.layers.append(layer)
+
+        sequences = [layer for layer in self.layers if isinstance(layer, Sequence)]
+        assert len(sequences) <= 1, "ERROR: Batch preprocessing supports at most one sequence layer."
+        self.sequence = sequences[0] if sequences else None
+        # Ring buffer of the last `sequence_length` inputs of the sequence layer per environment, created on
+        # the first call.
+        self.sequence_buffer = None
+        # Per environment: Position the next input is written to.
+        self.sequence_positions = np.zeros(num_envs, dtype=np.int64)
+        # Per environment: Whether the sequence was reset and must be filled with the next input.
+        self.sequence_reset = np.ones(num_envs, dtype=np.bool_)
+
+    def reset(self, env_indices=None):
+        """
+        Resets the sequence state of environments. Their next input fills the entire sequence.
+
+        Args:
+            env_indices (Optional[Sequence[int]]): Environments to reset. Defaults to all.
+        """
+        if env_indices is None:
+            self.sequence_reset[:] = True
+        else:
+            self.sequence_reset[list(env_indices)] = True
+
+    def preprocess(self, states, env_indices=None):
+        """
+        Preprocesses states of a number of environments.
+
+        Args:
+            states (np.ndarray): Batch of states, one per environment in `env_indices`.
+            env_indices (Optional[Sequence[int]]): Environments the states belong to. Defaults to all.
+
+        Returns:
+            np.ndarray: Batch of preprocessed states.
+        """
+        env_indices = np.arange(self.num_envs) if env_indices is None else np.asarray(env_indices, dtype=np.int64)
+        states = np.asarray(states)
+        for layer in self.layers:
+            if isinstance(layer, GrayScale):
+                states = self._grayscale(states, layer)
+            elif isinstance(layer, ImageResize):
+                states = self._resize(states, layer)
+            elif isinstance(layer, ConvertType):
+                states = states.astype(util.dtype(layer.to_dtype, to="np"))
+            elif isinstance(layer, Multiply):
+                states = states * layer.factor
+            elif isinstance(layer, Divide):
+                states = states / layer.divisor
+            elif isinstance(layer, Clip):
+                states = np.clip(states, a_min=layer.min, a_max=layer.max)
+            elif isinstance(layer, Sequence):
+                states = self._sequence(states, env_indices, layer)
+        return states
+
+    @staticmethod
+    def _grayscale(images, layer):
+        # Stacks all images vertically into one image.
+        num_images, height = images.shape[0], images.shape[1]
+        grayscaled = cv2.cvtColor(np.ascontiguousarray(images).reshape((num_images * height,) + images.shape[2:]),
+                                  cv2.COLOR_RGB2GRAY)
+        grayscaled = grayscaled.reshape(images.shape[:-1])
+        if layer.keep_rank:
+            grayscaled = grayscaled[..., np.newaxis]
+        return grayscaled
+
+    @staticmethod
+    def _resize(images, layer):
+        # Resizes chunks of images as the channels of one image, so single-channel images are resized 4 at a time.
+        num_images, height, width, num_channels = images.shape
+        images_per_chunk = max(1, CV2_MAX_CHANNELS // num_channels)
+        resized = np.empty((num_images, layer.height, layer.width, num_channels), dtype=images.dtype)
+        for start in range_(0, num_images, images_per_chunk):
+            chunk = images[start:start + images_per_chunk]
+            num_chunk_images = len(chunk)
+            channels = np.ascontiguousarray(chunk.transpose((1, 2, 0, 3))).reshape(
+                (height, width, num_chunk_images * num_channels))
+            resized_channels = cv2.resize(channels, dsize=(layer.width, layer.height),
+                                          interpolation=layer.cv2_interpolation)
+            resized[start:start + num_chunk_images] = resized_channels.reshape(
+                (layer.height, layer.width, num_chunk_images, num_channels)).transpose((2, 0, 1, 3))
+        return resized
+
+    def _sequence(self, inputs, env_indices, layer):
+        sequence_length = layer.sequence_length
+        if self.sequence_buffer is None:
+            self.sequence_buffer = np.zeros((self.num_envs, sequence_length) + inputs.shape[1:], dtype=inputs.dtype)
+
+        # Fills the sequences of reset environments with their input.
+        reset = self.sequence_reset[env_indices]
+        if np.any(reset):
+            reset_indices = env_indices[reset]
+            self.sequence_buffer[reset_indices] = inputs[reset][:, np.newaxis]
+            self.sequence_positions[reset_indices] = 0
+            self.sequence_reset[reset_indices] = False
+
+        positions = self.sequence_positions[env_indices]
+        self.sequence_buffer[env_indices, positions] = inputs
+        positions = (positions + 1) % sequence_length
+        self.sequence_positions[env_indices] = positions
+
+        # Oldest input first.
+        order = (positions[:, np.newaxis] + np.arange(sequence_length)) % sequence_length
+        sequences = self.sequence_buffer[env_indices[:, np.newaxis], order]
+        if layer.add_rank:
+            sequences = np.moveaxis(sequences, 1, -1)
+        else:
+            # Concatenates the sequence within the last rank.
+            sequences = np.moveaxis(sequences, 1, -2)
+            sequences = sequences.reshape(sequences.shape[:-2] + (-1,))
+
+        if layer.in_data_format == "channels_last" and layer.out_data_format == "channels_first":
+            sequences = sequences.transpose((0, 3, 2, 1))
+        return sequences
@@ -0,0 +1,417 @@
+# Copyright 2018 The RLgraph authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import multiprocessing
+import os
+import time
+from copy import deepcopy
+
+import numpy as np
+
+from rlgraph.execution.environment_sample import EnvironmentSample
+from rlgraph.execution.local.shared_ring_buffer import SharedRingBuffer
+from rlgraph.execution.local.shared_weights import SharedWeights
+from rlgraph.execution.ray.apex.apex_executor import UpdateWorker
+from rlgraph.execution.ray.apex.ray_memory_actor import RayMemoryActor
+from rlgraph.execution.ray.ray_executor import RayExecutor
+from rlgraph.execution.ray.ray_util import worker_exploration
+from rlgraph.execution.ray.ray_worker import RayWorker
+from rlgraph.execution.ray.weight_sync import FlatWeights
+from rlgraph.utils.rlgraph_errors import RLGraphError
+
+# Layout of the per-worker statistics array.
+WORKER_STATS = ["steps", "episodes", "ops_per_second", "env_frames_per_second", "min_reward", "max_reward",
+                "mean_reward", "final_reward"]
+
+
+class LocalApexExecutor(RayExecutor):
+    """
+    Runs Ape-X on a single node without Ray: Sample workers and replay memories run in separate processes,
+    the learner in a thread of the driver process. Transitions, sampled batches and priority updates move
+    through shared-memory ring buffers instead of pickled messages, policy weights through a shared,
+    versioned buffer.
+
+    Takes the same agent config (including "ray_spec") as the `ApexExecutor` and implements the same
+    `execute_workload` contract. Sample workers and replay memories run the `RayWorker` and
+    `RayMemoryActor` logic as plain objects.
+    """
+    def __init__(self, environment_spec, agent_config):
+        """
+        Args:
+            environment_spec (dict): Environment spec. Each sample worker process will instantiate
+                an environment using this spec.
+            agent_config (dict): Config dict containing agent and execution specs.
+        """
+        ray_spec = agent_config["execution_spec"].pop("ray_spec")
+        self.apex_replay_spec = ray_spec.pop("apex_replay_spec")
+        self.worker_spec = ray_spec.pop("worker_spec")
+        # States are passed as raw arrays through shared memory.
+        self.worker_spec["codec"] = None
+        self.apex_replay_spec["codec"] = "none"
+        super(LocalApexExecutor, self).__init__(executor_spec=ray_spec.pop("executor_spec"),
+                                                environment_spec=environment_spec,
+                                                worker_spec=self.worker_spec)
+
+        # Must specify an agent type.
+        assert "type" in agent_config
+        self.agent_config = agent_config
+
+        self.replay_batch_size = self.agent_config["update_spec"]["batch_size"]
+        self.weight_sync_steps = self.executor_spec["weight_sync_steps"]
+        self.worker_sample_size = self.executor_spec["num_worker_samples"] + self.worker_spec["n_step_adjustment"] - 1
+        # Ring buffer slots between each worker and its replay memory, and between each memory and the learner.
+        self.sample_ring_slots = self.executor_spec.get("env_interaction_task_depth", 1) + 1
+        self.batch_ring_slots = self.executor_spec.get("replay_sampling_task_depth", 1) + 1
+        # Max time in seconds the driver loop blocks on the learner per iteration if no batch is ready.
+        self.poll_timeout = self.executor_spec.get("poll_timeout", 0.01)
+        # Start method of the worker processes. Forking a process which already built a graph is not safe.
+        self.context = multiprocessing.get_context(self.executor_spec.get("start_method", "spawn"))
+
+        self.weight_syncs_executed = 0
+        self.steps_since_weights_synced = 0
+        self.worker_steps = None
+
+        assert not ray_spec, "ERROR: ray_spec still contains items: {}".format(ray_spec)
+        self.logger.info("Setting up execution for local Apex executor.")
+        self.setup_execution()
+
+    def setup_execution(self):
+        # Create local learner agent according to spec.
+        environment = RayExecutor.build_env_from_config(self.environment_spec)
+        self.agent_config["state_space"] = environment.state_space
+        self.agent_config["action_space"] = environment.action_space
+        environment.terminate()
+        self.local_agent = self.build_agent_from_config(self.agent_config)
+
+        self.update_worker = UpdateWorker(
+            agent=self.local_agent,
+            in_queue_size=self.executor_spec["learn_queue_size"],
+            num_loader_threads=self.executor_spec.get("num_learner_loader_threads", 1)
+        )
+        self.num_replay_workers = self.executor_spec["num_replay_workers"]
+        self.num_sample_workers = self.executor_spec["num_sample_workers"]
+
+        # Split memory capacity and min sample size across replay processes.
+        self.apex_replay_spec["memory_spec"]["capacity"] = int(
+            self.apex_replay_spec["memory_spec"]["capacity"] / self.num_replay_workers
+        )
+        self.apex_replay_spec["min_sample_memory_size"] = int(
+            self.apex_replay_spec["min_sample_memory_size"] / self.num_replay_workers
+        )
+        self.apex_replay_spec["sample_batch_size"] = self.replay_batch_size
+        self.worker_spec["worker_sample_size"] = self.worker_sample_size
+
+        # Ring buffers.
+        state_space = self.local_agent.preprocessed_state_space
+        action_space = self.local_agent.action_space
+        sample_fields = dict(
+            states=(state_space.shape, state_space.dtype),
+            actions=(action_space.shape, action_space.dtype),
+            rewards=((), np.float32),
+            terminals=((), np.bool_),
+            next_states=(state_space.shape, state_space.dtype),
+            importance_weights=((), np.float32)
+        )
+        batch_fields = dict(sample_fields, indices=((), np.int64))
+        priority_fields = dict(indices=((), np.int64), loss=((), np.float32))
+
+        self.sample_rings = [
+            SharedRingBuffer(sample_fields, self.sample_ring_slots, self.worker_sample_size, self.context)
+            for _ in range(self.num_sample_workers)
+        ]
+        self.batch_rings = [
+            SharedRingBuffer(batch_fields, self.batch_ring_slots, self.replay_batch_size, self.context)
+            for _ in range(self.num_replay_workers)
+        ]
+        # Coalesced priority updates can span several batches.
+        self.priority_rings = [
+            SharedRingBuffer(priority_fields, 4 * self.executor_spec["learn_queue_size"] + 4,
+                             self.replay_batch_size, self.context)
+            for _ in range(self.num_replay_workers)
+        ]
+        # Workers start with version 0, so they pull the initial weights.
+        self.shared_weights = SharedWeights(
+            FlatWeights.from_weights(self.local_agent.get_policy_weights(), version=1), self.context
+        )
+        self.worker_stats = [self.context.RawArray("d", len(WORKER_STATS)) for _ in range(self.num_sample_workers)]
+        self.replay_stats = [self.context.RawArray("q", 3) for _ in range(self.num_replay_workers)]
+        self.stop_event = self.context.Event()
+
+        # Start processes. Worker i sends its samples to replay memory i mod num_replay_workers.
+        self.replay_processes = []
+        for i in range(self.num_replay_workers):
+            process = self.context.Process(target=run_replay_process, args=(
+                self.apex_replay_spec, self.sample_rings[i::self.num_replay_workers], self.batch_rings[i],
+                self.priority_rings[i], self.replay_stats[i], self.stop_event
+            ))
+            process.daemon = True
+            process.start()
+            self.replay_processes.append(process)
+
+        self.logger.info("Starting {} sample worker processes, sample size: {}".format(
+            self.num_sample_workers, self.worker_sample_size))
+        self.sample_processes = []
+        ray_constant_exploration = self.worker_spec.get("ray_constant_exploration", False)
+        for i in range(self.num_sample_workers):
+            worker_spec = deepcopy(self.worker_spec)
+            if ray_constant_exploration is True:
+                worker_spec["ray_exploration"] = worker_exploration(i, self.num_sample_workers)
+            process = self.context.Process(target=run_sample_process, args=(
+                deepcopy(self.agent_config), worker_spec, self.environment_spec, self.worker_frameskip,
+                self.sample_rings[i], self.shared_weights, self.worker_stats[i], self.stop_event
+            ))
+            process.daemon = True
+            process.start()
+            self.sample_processes.append(process)
+            self.worker_ids[process] = "worker_{}".format(i)
+        # Read by `execute_workload`.
+        self.ray_env_sample_workers = self.sample_processes
+        self.init_tasks()
+
+    def init_tasks(self):
+        # Start learner thread.
+        self.update_worker.start()
+        self.worker_steps = self._get_worker_steps()
+
+    def _execute_step(self):
+        """
+        Moves sampled batches to the learner, sends the learner's priority updates back to the replay
+        processes and publishes new weights to the sample workers.
+        """
+        self._check_processes()
+        update_steps = 0
+
+        # 1. Move ready batches to the learner.
+        batch_received = False
+        for replay_index, batch_ring in enumerate(self.batch_rings):
+            batch = batch_ring.get(timeout=0)
+            if batch is not None:
+                self.update_worker.input_queue.put((replay_index, batch))
+                batch_received = True
+
+        # 2. Coalesce priority updates per replay process.
+        if not batch_received:
+            # Nothing to pass on, wait for the learner instead of spinning.
+            time.sleep(self.poll_timeout)
+        shard_updates = dict()
+        while not self.update_worker.output_queue.empty():
+            replay_index, indices, loss_per_item = self.update_worker.output_queue.get()
+            if replay_index not in shard_updates:
+                shard_updates[replay_index] = ([], [])
+            shard_updates[replay_index][0].append(indices)
+            shard_updates[replay_index][1].append(loss_per_item)
+            update_steps += len(indices)
+        for replay_index, (indices, loss_per_item) in shard_updates.items():
+            self.priority_rings[replay_index].put(dict(indices=np.concatenate(indices),
+                                                       loss=np.concatenate(loss_per_item)))
+
+        # 3. Count env steps and publish weights.
+        worker_steps = self._get_worker_steps()
+        env_steps = int(worker_steps - self.worker_steps)
+        self.worker_steps = worker_steps
+        self.steps_since_weights_synced += env_steps
+        if self.steps_since_weights_synced >= self.weight_sync_steps and self.update_worker.update_done:
+            self.update_worker.update_done = False
+            self.shared_weights.publish(FlatWeights.from_weights(
+                self.local_agent.get_policy_weights(), self.shared_weights.raw_version.value + 1
+            ))
+            self.weight_syncs_executed += 1
+            self.steps_since_weights_synced = 0
+
+        return env_steps, update_steps
+
+    def get_aggregate_worker_results(self):
+        stats = np.array([np.frombuffer(worker_stats, dtype=np.float64) for worker_stats in self.worker_stats])
+        stats = {name: stats[:, i] for i, name in enumerate(WORKER_STATS)}
+        # Workers without finished episodes report NaN rewards.
+        return dict(
+            min_reward=np.nanmin(stats["min_reward"]),
+            max_reward=np.nanmax(stats["max_reward"]),
+            mean_reward=np.nanmean(stats["mean_reward"]),
+            mean_final_reward=np.nanmean(stats["final_reward"]),
+            min_worker_episodes=np.min(stats["episodes"]),
+            max_worker_episodes=np.max(stats["episodes"]),
+            mean_worker_episodes=np.mean(stats["episodes"]),
+            total_episodes_executed=np.sum(stats["episodes"]),
+            steps_executed=int(np.sum(stats["steps"])),
+            mean_worker_op_throughput=np.mean(stats["ops_per_second"]),
+            min_worker_op_throughput=np.min(stats["ops_per_second"]),
+            max_worker_op_throughput=np.max(stats["ops_per_second"]),
+            mean_worker_env_frame_throughput=np.mean(stats["env_frames_per_second"])
+        )
+
+    def get_live_metrics(self):
+        learner_metrics = self.update_worker.get_metrics()
+        return dict(
+            learner_updates=learner_metrics["updates"],
+            learner_idle_fraction=learner_metrics["idle_fraction"],
+            learner_input_queue_depth=learner_metrics["input_queue_depth"],
+            learner_ready_queue_depth=learner_metrics["ready_queue_depth"],
+            replay_memory_size=int(sum(replay_stats[2] for replay_stats in self.replay_stats)),
+            weights_version=self.shared_weights.raw_version.value
+        )
+
+    def poll_worker_metrics(self):
+        # Worker processes continuously update their statistics in shared memory.
+        snapshots = dict()
+        for i, worker_stats in enumerate(self.worker_stats):
+            stats = dict(zip(WORKER_STATS, np.frombuffer(worker_stats, dtype=np.float64).tolist()))
+            snapshots["worker_{}".format(i)] = dict(
+                worker_steps=int(stats["steps"]),
+                episodes_executed=int(stats["episodes"]),
+                recent_ops_per_second=stats["ops_per_second"],
+                recent_mean_episode_reward=None if np.isnan(stats["mean_reward"]) else stats["mean_reward"]
+            )
+        return snapshots
+
+    def get_replay_metrics(self):
+        """
+        Returns:
+            list: Per replay process, the number of inserted records, sampled batches and the memory size.
+        """
+        return [dict(zip(["records_inserted", "batches_sampled", "memory_size"],
+                         np.frombuffer(replay_stats, dtype=np.int64).tolist()))
+                for replay_stats in self.replay_stats]
+
+    def get_learner_metrics(self):
+        """
+        Returns:
+            dict: Learner metrics, see `UpdateWorker.get_metrics`.
+        """
+        return self.update_worker.get_metrics()
+
+    def terminate(self):
+        """
+        Stops and joins all worker processes.
+        """
+        self.stop_event.set()
+        for process in self.sample_processes + self.replay_processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+
+    def _get_worker_steps(self):
+        return sum(worker_stats[0] for worker_stats in self.worker_stats)
+
+    def _check_processes(self):
+        for process in self.sample_processes + self.replay_processes:
+            if not process.is_alive():
+                self.terminate()
+                raise RLGraphError("ERROR: Worker process {} terminated with exit code {}.".format(
+                    process.name, process.exitcode))
+
+
+def run_sample_process(agent_config, worker_spec, env_spec, frameskip, sample_ring, shared_weights, stats,
+                       stop_event):
+    """
+    Sample worker process: Runs a `RayWorker` and writes its samples into a ring buffer.
+
+    Args:
+        agent_config (dict): Agent config.
+        worker_spec (dict): Worker spec.
+        env_spec (dict): Environment spec.
+        frameskip (int): Worker frameskip.
+        sample_ring (SharedRingBuffer): Ring buffer to the replay process.
+        shared_weights (SharedWeights): Policy weights published by the learner.
+        stats (RawArray): Worker statistics, see `WORKER_STATS`.
+        stop_event (Event): Set to stop the process.
+    """
+    parent_pid = os.getppid()
+    worker = RayWorker(agent_config, worker_spec, env_spec, frameskip, auto_build=True)
+    stats = np.frombuffer(stats, dtype=np.float64)
+    stats[:] = np.nan
+    stats[0:2] = 0
+
+    while not _should_stop(stop_event, parent_pid):
+        flat_weights = shared_weights.pull(worker.weights_version)
+        if flat_weights is not None:
+            worker.set_flat_policy_weights(flat_weights)
+
+        sample, batch_size = worker.execute_and_get_with_count()
+        while not sample_ring.put(sample.get_batch(), timeout=0.1):
+            if _should_stop(stop_event, parent_pid):
+                return
+
+        worker_stats = worker.get_workload_statistics()
+        stats[1] = worker_stats["episodes_executed"]
+        stats[2] = worker_stats["mean_worker_ops_per_second"]
+        stats[3] = worker_stats["mean_worker_env_frames_per_second"]
+        if worker_stats["mean_episode_reward"] is not None:
+            stats[4] = worker_stats["min_episode_reward"]
+            stats[5] = worker_stats["max_episode_reward"]
+            stats[6] = worker_stats["mean_episode_reward"]
+            stats[7] = worker_stats["final_episode_reward"]
+        # Steps last, the driver counts env steps from them.
+        stats[0] = worker_stats["worker_steps"]
+
+
+def run_replay_process(apex_replay_spec, sample_rings, batch_ring, priority_ring, stats, stop_event):
+    """
+    Replay process: Runs a `RayMemoryActor`, inserts samples from the workers' ring buffers, samples
+    batches into the learner's ring buffer and applies priority updates.
+
+    Args:
+        apex_replay_spec (dict): Replay spec, see `RayMemoryActor`.
+        sample_rings (list): Ring buffers from the sample workers.
+        batch_ring (SharedRingBuffer): Ring buffer to the learner.
+        priority_ring (SharedRingBuffer): Ring buffer of priority updates from the learner.
+        stats (RawArray): Records inserted, batches sampled and memory size.
+        stop_event (Event): Set to stop the process.
+    """
+    parent_pid = os.getppid()
+    memory_actor = RayMemoryActor(apex_replay_spec)
+    stats = np.frombuffer(stats, dtype=np.int64)
+    # Sampled batch waiting for a free slot.
+    pending_batch = None
+
+    while not _should_stop(stop_event, parent_pid):
+        active = False
+        # 1. Apply all pending priority updates.
+        while True:
+            update = priority_ring.get(timeout=0)
+            if update is None:
+                break
+            memory_actor.update_priorities(update["indices"], update["loss"])
+            active = True
+
+        # 2. Insert available samples.
+        for sample_ring in sample_rings:
+            records = sample_ring.get(timeout=0)
+            if records is not None:
+                memory_actor.observe(EnvironmentSample(sample_batch=records))
+                stats[0] += len(records["rewards"])
+                active = True
+
+        # 3. Keep the learner supplied.
+        if pending_batch is None:
+            pending_batch = memory_actor.get_batch()
+            if pending_batch is not None:
+                stats[1] += 1
+        if pending_batch is not None and batch_ring.put(pending_batch, timeout=0):
+            pending_batch = None
+            active = True
+        stats[2] = memory_actor.memory.size
+
+        if not active:
+            time.sleep(0.001)
+
+
+def _should_stop(stop_event, parent_pid):
+    # Also stop if the driver died without setting the event, so workers are not orphaned.
+    return stop_event.is_set() or os.getppid() != parent_pid
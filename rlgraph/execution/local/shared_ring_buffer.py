@@ -0,0 +1,147 @@
+# Copyright 2018 The RLgraph authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import multiprocessing
+
+import numpy as np
+
+from rlgraph.utils.rlgraph_errors import RLGraphError
+
+
+class SharedRingBuffer(object):
+    """
+    Single-producer, single-consumer ring buffer of record batches in shared memory, used to move
+    transitions between processes without pickling them.
+
+    The buffer consists of `num_slots` slots of up to `slot_size` records. Every field (e.g. states) is one
+    shared array of shape (num_slots, slot_size) + field shape, so putting a batch is a copy into shared
+    memory and getting it a copy out of it. Free and filled slots are counted by two semaphores; the write
+    and read positions are private to the producer and the consumer respectively.
+
+    The buffer must be passed to child processes at their creation (e.g. as a `Process` argument).
+    """
+    def __init__(self, field_specs, num_slots, slot_size, context=None):
+        """
+        Args:
+            field_specs (dict): Field name -> (shape, dtype) of one record's value.
+            num_slots (int): Number of slots.
+            slot_size (int): Max number of records per slot. Larger batches occupy several slots.
+            context (Optional[multiprocessing.context.BaseContext]): Multiprocessing context to create
+                the shared arrays and semaphores with.
+        """
+        context = context or multiprocessing
+        self.field_specs = {name: (tuple(shape), np.dtype(dtype).str) for name, (shape, dtype) in
+                            field_specs.items()}
+        self.num_slots = num_slots
+        self.slot_size = slot_size
+
+        self.raw_arrays = {}
+        for name, (shape, dtype) in self.field_specs.items():
+            num_bytes = num_slots * slot_size * int(np.prod(shape)) * np.dtype(dtype).itemsize
+            self.raw_arrays[name] = context.RawArray("b", max(num_bytes, 1))
+        self.raw_slot_sizes = context.RawArray("q", num_slots)
+        self.free_slots = context.Semaphore(num_slots)
+        self.filled_slots = context.Semaphore(0)
+
+        self.write_position = 0
+        self.read_position = 0
+        self._create_views()
+
+    def put(self, values, timeout=None):
+        """
+        Writes a batch of records. Only one process may put into a buffer.
+
+        Args:
+            values (dict): Field name -> array with a leading batch rank. Must contain all fields.
+            timeout (Optional[float]): Max time to wait for a free slot in seconds, blocks if None. A timeout of 0
+                only writes if a slot is free right away.
+
+        Returns:
+            bool: True if the batch was written, False if no slot became free in time. Batches larger
+                than a slot are only written if all their slots are free.
+        """
+        batch_size = len(values[next(iter(self.field_specs))])
+        num_slots = max(1, -(-batch_size // self.slot_size))
+        if num_slots > self.num_slots:
+            raise RLGraphError("ERROR: Batch of {} records exceeds the ring buffer capacity of {} slots of {} "
+                               "records.".format(batch_size, self.num_slots, self.slot_size))
+        acquired = 0
+        while acquired < num_slots:
+            if not self._acquire(self.free_slots, timeout):
+                for _ in range(acquired):
+                    self.free_slots.release()
+                return False
+            acquired += 1
+
+        for start in range(0, max(batch_size, 1), self.slot_size):
+            end = min(start + self.slot_size, batch_size)
+            slot = self.write_position
+            for name, view in self.views.items():
+                view[slot, :end - start] = values[name][start:end]
+            self.slot_sizes[slot] = end - start
+            self.write_position = (slot + 1) % self.num_slots
+            self.filled_slots.release()
+        return True
+
+    def get(self, timeout=None):
+        """
+        Reads the records of the next filled slot. Only one process may get from a buffer.
+
+        Args:
+            timeout (Optional[float]): Max time to wait for a filled slot in seconds, blocks if None. A timeout
+                of 0 only reads if a slot is filled right away.
+
+        Returns:
+            Union[dict, None]: Field name -> array of the slot's records, or None if no slot was filled in time.
+        """
+        if not self._acquire(self.filled_slots, timeout):
+            return None
+        slot = self.read_position
+        size = self.slot_sizes[slot]
+        values = {name: view[slot, :size].copy() for name, view in self.views.items()}
+        self.read_position = (slot + 1) % self.num_slots
+        self.free_slots.release()
+        return values
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # Views are recreated from the shared arrays in the receiving process.
+        del state["views"]
+        del state["slot_sizes"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._create_views()
+
+    def _create_views(self):
+        self.views = {}
+        for name, (shape, dtype) in self.field_specs.items():
+            self.views[name] = np.frombuffer(self.raw_arrays[name], dtype=np.int8)[
+                :self.num_slots * self.slot_size * int(np.prod(shape)) * np.dtype(dtype).itemsize
+            ].view(dtype).reshape((self.num_slots, self.slot_size) + shape)
+        self.slot_sizes = np.frombuffer(self.raw_slot_sizes, dtype=np.int64)
+
+    @staticmethod
+    def _acquire(semaphore, timeout):
+        if timeout is None:
+            return semaphore.acquire()
+        elif timeout <= 0:
+            return semaphore.acquire(False)
+        return semaphore.acquire(True, timeout)
@@ -0,0 +1,69 @@
+# Copyright 2018 The RLgraph authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import multiprocessing
+
+import numpy as np
+
+from rlgraph.execution.ray.weight_sync import FlatWeights
+
+
+class SharedWeights(object):
+    """
+    Versioned policy weights in shared memory: The learner publishes flattened weights (see `FlatWeights`),
+    sample worker processes copy them out only when the version changed.
+
+    Must be passed to child processes at their creation.
+    """
+    def __init__(self, flat_weights, context=None):
+        """
+        Args:
+            flat_weights (FlatWeights): Initial weights, determines the layout of all published weights.
+            context (Optional[multiprocessing.context.BaseContext]): Multiprocessing context to create
+                the shared buffer and lock with.
+        """
+        context = context or multiprocessing
+        self.layout = flat_weights.layout
+        self.raw_buffer = context.RawArray("B", len(flat_weights.buffer))
+        self.raw_version = context.RawValue("q", 0)
+        self.lock = context.Lock()
+        self.publish(flat_weights)
+
+    def publish(self, flat_weights):
+        """
+        Args:
+            flat_weights (FlatWeights): Weights with the layout given at construction.
+        """
+        with self.lock:
+            np.frombuffer(self.raw_buffer, dtype=np.uint8)[:] = flat_weights.buffer
+            self.raw_version.value = flat_weights.version
+
+    def pull(self, version):
+        """
+        Args:
+            version (int): Version held by the caller.
+
+        Returns:
+            Union[FlatWeights, None]: A copy of the weights if they are newer than `version`, else None.
+        """
+        if self.raw_version.value <= version:
+            return None
+        with self.lock:
+            return FlatWeights(self.layout, np.frombuffer(self.raw_buffer, dtype=np.uint8).copy(),
+                               self.raw_version.value)
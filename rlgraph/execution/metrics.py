@@ -0,0 +1,183 @@
+# Copyright 2018 The RLgraph authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import csv
+import json
+import numbers
+import os
+import re
+
+import numpy as np
+
+from rlgraph.utils.specifiable import Specifiable
+
+
+class RingBuffer(object):
+    """
+    Fixed-size buffer of the most recent values of a metric, so long running workers keep a bounded
+    history instead of ever-growing lists. Also counts all values ever appended.
+    """
+    def __init__(self, capacity, dtype=np.float64):
+        """
+        Args:
+            capacity (int): Max number of values kept.
+            dtype (np.dtype): Value dtype.
+        """
+        self.capacity = capacity
+        self.buffer = np.zeros(capacity, dtype=dtype)
+        self.index = 0
+        self.count = 0
+
+    def append(self, value):
+        self.buffer[self.index] = value
+        self.index = (self.index + 1) % self.capacity
+        self.count += 1
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def values(self):
+        """
+        Returns:
+            ndarray: The kept values, oldest first.
+        """
+        if self.count < self.capacity:
+            return self.buffer[:self.count].copy()
+        return np.roll(self.buffer, -self.index)
+
+    def last(self):
+        """
+        Returns:
+            Union[any, None]: The most recent value or None if empty.
+        """
+        if self.count == 0:
+            return None
+        return self.buffer[self.index - 1]
+
+    def mean(self):
+        """
+        Returns:
+            Union[float, None]: Mean over the kept values or None if empty.
+        """
+        if self.count == 0:
+            return None
+        return float(np.mean(self.buffer[:len(self)]))
+
+
+class MetricsSink(Specifiable):
+    """
+    Exports records of live metrics, e.g. one record per reporting iteration of an executor.
+    """
+    def __init__(self, path):
+        """
+        Args:
+            path (str): Output file path.
+        """
+        super(MetricsSink, self).__init__()
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+    def write(self, record):
+        """
+        Args:
+            record (dict): Flat dict of metric name -> value.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class JsonLinesSink(MetricsSink):
+    """
+    Appends each record as one JSON line.
+    """
+    def __init__(self, path):
+        super(JsonLinesSink, self).__init__(path)
+        self.file = open(path, "a")
+
+    def write(self, record):
+        self.file.write(json.dumps(record, default=_to_builtin) + "\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class CsvSink(MetricsSink):
+    """
+    Appends each record as one CSV row. The columns are the keys of the first record written.
+    """
+    def __init__(self, path):
+        super(CsvSink, self).__init__(path)
+        self.file = open(path, "a")
+        self.writer = None
+
+    def write(self, record):
+        if self.writer is None:
+            self.writer = csv.DictWriter(self.file, fieldnames=list(record.keys()), restval="",
+                                         extrasaction="ignore")
+            if self.file.tell() == 0:
+                self.writer.writeheader()
+        self.writer.writerow({key: _to_builtin(value) for key, value in record.items()})
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class PrometheusSink(MetricsSink):
+    """
+    Writes the numeric values of the latest record as gauges in the Prometheus text format, e.g. for the
+    textfile collector of a node exporter. The file is replaced atomically on every write.
+    """
+    def __init__(self, path, prefix="rlgraph", labels=None):
+        """
+        Args:
+            path (str): Output file path, should end in ".prom".
+            prefix (str): Prefix of all metric names.
+            labels (Optional[dict]): Labels added to all metrics, e.g. to identify a run.
+        """
+        super(PrometheusSink, self).__init__(path)
+        self.prefix = prefix
+        self.labels = ""
+        if labels:
+            self.labels = "{" + ",".join('{}="{}"'.format(key, value) for key, value in sorted(labels.items())) + "}"
+
+    def write(self, record):
+        lines = []
+        for key, value in record.items():
+            if isinstance(value, bool) or not isinstance(value, numbers.Number):
+                continue
+            name = re.sub("[^a-zA-Z0-9_]", "_", "{}_{}".format(self.prefix, key))
+            lines.append("# TYPE {} gauge".format(name))
+            lines.append("{}{} {}".format(name, self.labels, float(value)))
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.rename(temp_path, self.path)
+
+
+def _to_builtin(value):
+    # Numpy scalars are not JSON serializable.
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
@@ -17,9 +17,25 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+from rlgraph.execution.ray.codecs import Codec, NoCompressionCodec, LZ4Codec, ZstdCodec, ArrowLZ4Base64Codec
+from rlgraph.execution.ray.placement import ActorPlacement
 from rlgraph.execution.ray.ray_executor import RayExecutor
 from rlgraph.execution.ray.ray_worker import RayWorker
+from rlgraph.execution.ray.weight_sync import FlatWeights, WeightPublisher
 
 from rlgraph.execution.ray.apex import ApexExecutor, ApexMemory, RayMemoryActor
+from rlgraph.execution.ray.impala import IMPALAExecutor, RayIMPALAActor
 
-__all__ = ["RayExecutor", "RayWorker", "ApexExecutor", "ApexMemory", "RayMemoryActor"]
+Codec.__lookup_classes__ = dict(
+    none=NoCompressionCodec,
+    nocompression=NoCompressionCodec,
+    lz4=LZ4Codec,
+    lz4codec=LZ4Codec,
+    zstd=ZstdCodec,
+    zstdcodec=ZstdCodec,
+    arrowlz4base64=ArrowLZ4Base64Codec
+)
+Codec.__default_constructor__ = LZ4Codec
+
+__all__ = ["RayExecutor", "RayWorker", "ApexExecutor", "ApexMemory", "RayMemoryActor", "Codec",
+           "FlatWeights", "WeightPublisher", "ActorPlacement", "IMPALAExecutor", "RayIMPALAActor"]
@@ -20,5 +20,6 @@ from __future__ import print_function
 from rlgraph.execution.ray.apex.apex_executor import ApexExecutor
 from rlgraph.execution.ray.apex.apex_memory import ApexMemory
 from rlgraph.execution.ray.apex.ray_memory_actor import RayMemoryActor
+from rlgraph.execution.ray.apex.sharded_replay_coordinator import ShardedReplayCoordinator
 
-__all__ = ["ApexExecutor", "ApexMemory", "RayMemoryActor"]
+__all__ = ["ApexExecutor", "ApexMemory", "RayMemoryActor", "ShardedReplayCoordinator"]
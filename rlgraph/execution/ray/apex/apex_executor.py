@@ -17,17 +17,25 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import os
 import time
 import random
+
+import numpy as np
 from six.moves import queue
-from threading import Thread
+from threading import Lock, Thread
 
 from rlgraph import get_distributed_backend
 from rlgraph.agents import Agent
 from rlgraph.execution.ray import RayWorker
 from rlgraph.execution.ray.apex.ray_memory_actor import RayMemoryActor
+from rlgraph.execution.ray.apex.sharded_replay_coordinator import ShardedReplayCoordinator
+from rlgraph.execution.ray.placement import ActorPlacement
 from rlgraph.execution.ray.ray_executor import RayExecutor
-from rlgraph.execution.ray.ray_util import create_colocated_ray_actors, RayTaskPool
+from rlgraph.execution.ray.ray_util import create_ray_actors_on_hosts, get_actor_hosts, LatencyHistogram, \
+    RayTaskPool
+from rlgraph.execution.ray.weight_sync import WeightPublisher
+from rlgraph.spaces import ContainerSpace
 
 if get_distributed_backend() == "ray":
     import ray
@@ -50,6 +58,9 @@ class ApexExecutor(RayExecutor):
         ray_spec = agent_config["execution_spec"].pop("ray_spec")
         self.apex_replay_spec = ray_spec.pop("apex_replay_spec")
         self.worker_spec = ray_spec.pop("worker_spec")
+        # Workers compress states with the codec the replay memories use to decompress them.
+        self.worker_spec["codec"] = self.apex_replay_spec.get("codec", "lz4")
+        self.worker_spec["compress_chunks"] = self.apex_replay_spec.get("compress_chunks", False)
         super(ApexExecutor, self).__init__(executor_spec=ray_spec.pop("executor_spec"),
                                            environment_spec=environment_spec,
                                            worker_spec=self.worker_spec)
@@ -65,6 +76,20 @@ class ApexExecutor(RayExecutor):
         self.replay_batch_size = self.agent_config["update_spec"]["batch_size"]
         self.num_cpus_per_replay_actor = self.executor_spec.get("num_cpus_per_replay_actor",
                                                                 self.replay_sampling_task_depth)
+        # If True, replay shards are sampled proportionally to their priority mass and normalize importance
+        # weights with global priority statistics. Otherwise, each shard is sampled and normalized separately.
+        self.sharded_replay = self.executor_spec.get("sharded_replay", True)
+        self.replay_coordinator = None
+        # Where replay shards are placed: "driver" co-locates all shards with the driver, "workers" packs
+        # shards onto the nodes of the sample workers, each worker inserting into a shard on its own node.
+        placement_spec = dict(self.executor_spec.get("placement_spec", {}))
+        self.placement_mode = placement_spec.pop("mode", "driver")
+        assert self.placement_mode in ["driver", "workers"], \
+            "ERROR: Placement mode must be 'driver' or 'workers', is {}.".format(self.placement_mode)
+        self.placement_max_attempts = placement_spec.pop("max_attempts", 10)
+        self.placement = None
+        if self.placement_mode == "workers":
+            self.placement = ActorPlacement(**placement_spec)
 
         # How often weights are synced to remote workers.
         self.weight_sync_steps = self.executor_spec["weight_sync_steps"]
@@ -72,9 +97,15 @@ class ApexExecutor(RayExecutor):
         # Necessary for target network updates.
         self.weight_syncs_executed = 0
         self.steps_since_weights_synced = dict()
+        # Publishes versioned, flattened policy weights to the sample workers.
+        self.weight_publisher = WeightPublisher()
 
         # These are the tasks actually interacting with the environment.
         self.env_sample_tasks = RayTaskPool()
+        # Max time in seconds the driver loop waits on pending tasks per iteration.
+        self.ray_wait_timeout = self.executor_spec.get("ray_wait_timeout", 0.01)
+        self.stage_latencies = {stage: LatencyHistogram() for stage in
+                                ["wait", "fetch", "samples", "replay", "priorities", "loop"]}
         self.env_interaction_task_depth = self.executor_spec["env_interaction_task_depth"]
         self.worker_sample_size = self.executor_spec["num_worker_samples"] + self.worker_spec["n_step_adjustment"] - 1
 
@@ -97,13 +128,54 @@ class ApexExecutor(RayExecutor):
         # Set up worker thread for performing updates.
         self.update_worker = UpdateWorker(
             agent=self.local_agent,
-            in_queue_size=self.executor_spec["learn_queue_size"]
+            in_queue_size=self.executor_spec["learn_queue_size"],
+            num_loader_threads=self.executor_spec.get("num_learner_loader_threads", 1)
         )
 
         # Create remote sample workers based on ray cluster spec.
         self.num_replay_workers = self.executor_spec["num_replay_workers"]
         self.num_sample_workers = self.executor_spec["num_sample_workers"]
 
+        # Set sample batch size:
+        self.apex_replay_spec["sample_batch_size"] = self.agent_config["update_spec"]["batch_size"]
+        self.logger.info("Sampling batch size {}".format(self.apex_replay_spec["sample_batch_size"]))
+
+        if self.placement is None:
+            self.create_replay_memories({os.uname()[1]: self.num_replay_workers})
+            self.create_sample_workers()
+        else:
+            # Workers first, so the shards can be packed onto their nodes.
+            self.create_sample_workers()
+            worker_hosts = get_actor_hosts(self.ray_env_sample_workers)
+            shard_hosts = self.create_replay_memories(self.placement.get_num_shards_per_host(worker_hosts))
+            for ray_memory, host in zip(self.ray_local_replay_memories, shard_hosts):
+                self.placement.add_shard(ray_memory, host)
+            for ray_worker, host in zip(self.ray_env_sample_workers, worker_hosts):
+                self.placement.add_worker(ray_worker, host)
+            self.logger.info("Placed replay shards per host: {}, workers per shard: {}.".format(
+                self.placement.get_num_shards_per_host(worker_hosts),
+                self.placement.get_metrics()["workers_per_shard"]))
+
+        if self.sharded_replay:
+            self.replay_coordinator = ShardedReplayCoordinator(
+                shards=self.ray_local_replay_memories,
+                shard_capacity=self.apex_replay_spec["memory_spec"]["capacity"],
+                alpha=self.apex_replay_spec["memory_spec"].get("alpha", 1.0)
+            )
+        self.init_tasks()
+
+    def create_replay_memories(self, host_counts):
+        """
+        Creates the replay memory shards on the given hosts. The total replay capacity and min sample size
+        are split evenly between shards.
+
+        Args:
+            host_counts (dict): Host name -> number of shards to create on that host.
+
+        Returns:
+            list: Host of each created shard.
+        """
+        self.num_replay_workers = sum(host_counts.values())
         self.logger.info("Initializing {} local replay memories.".format(self.num_replay_workers))
         # Update memory size for num of workers
         shard_size = int(self.apex_replay_spec["memory_spec"]["capacity"] / self.num_replay_workers)
@@ -113,16 +185,16 @@ class ApexExecutor(RayExecutor):
         self.apex_replay_spec["min_sample_memory_size"] = int(min_sample_size / self.num_replay_workers)
         self.logger.info("Sampling for learning starts at: {}".format( self.apex_replay_spec["min_sample_memory_size"]))
 
-        # Set sample batch size:
-        self.apex_replay_spec["sample_batch_size"] = self.agent_config["update_spec"]["batch_size"]
-        self.logger.info("Sampling batch size {}".format(self.apex_replay_spec["sample_batch_size"]))
-
-        self.ray_local_replay_memories = create_colocated_ray_actors(
+        memories_and_hosts = create_ray_actors_on_hosts(
             cls=RayMemoryActor.as_remote(num_cpus=self.num_cpus_per_replay_actor),
             config=self.apex_replay_spec,
-            num_agents=self.num_replay_workers
+            host_counts=host_counts,
+            max_attempts=self.placement_max_attempts
         )
+        self.ray_local_replay_memories = [ray_memory for ray_memory, _ in memories_and_hosts]
+        return [host for _, host in memories_and_hosts]
 
+    def create_sample_workers(self):
         # Create remote workers for data collection.
         self.worker_spec["worker_sample_size"] = self.worker_sample_size
         self.logger.info("Initializing {} remote data collection agents, sample size: {}".format(
@@ -132,7 +204,6 @@ class ApexExecutor(RayExecutor):
             # *args
             self.worker_spec, self.environment_spec, self.worker_frameskip
         )
-        self.init_tasks()
 
     def test_worker_init(self):
         """
@@ -153,19 +224,18 @@ class ApexExecutor(RayExecutor):
         for ray_memory in self.ray_local_replay_memories:
             for _ in range(self.replay_sampling_task_depth):
                 # This initializes remote tasks to sample from the prioritized replay memories of each worker.
-                self.prioritized_replay_tasks.add_task(ray_memory, ray_memory.get_batch.remote())
+                self._schedule_replay_task(ray_memory)
 
         # Env interaction tasks via RayWorkers which each
         # have a local agent.
-        weights = self.local_agent.get_policy_weights()
+        self.weight_publisher.publish(self.local_agent.get_policy_weights())
         for ray_worker in self.ray_env_sample_workers:
-            ray_worker.set_policy_weights.remote(weights)
+            self.weight_publisher.sync(ray_worker)
             self.steps_since_weights_synced[ray_worker] = 0
 
             self.logger.info("Synced worker {} weights, initializing sample tasks.".format(
                 self.worker_ids[ray_worker]))
-            for _ in range(self.env_interaction_task_depth):
-                self.env_sample_tasks.add_task(ray_worker, ray_worker.execute_and_get_with_count.remote())
+            self._schedule_sample_tasks(ray_worker)
 
     def _execute_step(self):
         """
@@ -176,80 +246,239 @@ class ApexExecutor(RayExecutor):
         - Insert these into the local memory
         - Have a separate learn thread sample batches from the memory and compute updates
         - Sync weights to the shared model so remot eworkers can update their weights.
+
+        Each step is one iteration of a pipelined event loop: A single `ray.wait` with a small timeout
+        over all pending sample and replay tasks, a single `ray.get` of all ready results and one priority
+        update call per replay shard. Stage latencies are recorded in `stage_latencies`.
         """
         # Env steps done during this rollout.
         env_steps = 0
         update_steps = 0
-        weights = None
-
-        # 1. Fetch results from RayWorkers.
-        completed_sample_tasks = list(self.env_sample_tasks.get_completed())
-        sample_batch_sizes = ray.get([task[1][1] for task in completed_sample_tasks])
+        loop_start = time.monotonic()
+
+        # 1. Wait on all pending tasks at once.
+        pending = self.env_sample_tasks.get_pending() + self.prioritized_replay_tasks.get_pending()
+        ready = []
+        if pending:
+            ready, _ = ray.wait(pending, num_returns=len(pending), timeout=self.ray_wait_timeout)
+        completed_sample_tasks = self.env_sample_tasks.pop_ready(ready)
+        completed_replay_tasks = self.prioritized_replay_tasks.pop_ready(ready)
+        wait_end = time.monotonic()
+        self.stage_latencies["wait"].record(wait_end - loop_start)
+
+        # 2. Fetch sample sizes and sampled replay batches in one call.
+        results = []
+        if completed_sample_tasks or completed_replay_tasks:
+            results = ray.get([task[1][1] for task in completed_sample_tasks] +
+                              [task[1] for task in completed_replay_tasks])
+        sample_batch_sizes = results[:len(completed_sample_tasks)]
+        sampled_batches = results[len(completed_sample_tasks):]
+        fetch_end = time.monotonic()
+        self.stage_latencies["fetch"].record(fetch_end - wait_end)
+
+        # 3. Route env samples to replay memories, sync weights and reschedule sampling.
         for i, (ray_worker, (env_sample_obj_id, sample_size)) in enumerate(completed_sample_tasks):
-            # Randomly add env sample to a local replay actor.
-            random.choice(self.ray_local_replay_memories).observe.remote(env_sample_obj_id)
             sample_steps = sample_batch_sizes[i]
+            self.worker_scheduler.task_completed(ray_worker, sample_steps, fetch_end)
+            # Workers insert into the shard on their node if placed, else shards are balanced or chosen randomly.
+            ray_memory = self.placement.get_shard(ray_worker) if self.placement is not None else None
+            if self.replay_coordinator is not None:
+                ray_memory = self.replay_coordinator.route_records(sample_steps, shard=ray_memory)
+            elif ray_memory is None:
+                # Randomly add env sample to a local replay actor.
+                ray_memory = random.choice(self.ray_local_replay_memories)
+            ray_memory.observe.remote(env_sample_obj_id)
             env_steps += sample_steps
 
             self.steps_since_weights_synced[ray_worker] += sample_steps
             if self.steps_since_weights_synced[ray_worker] >= self.weight_sync_steps:
-                if weights is None or self.update_worker.update_done:
+                # Publish a new weights version only if the learner updated since the last one.
+                if self.update_worker.update_done:
                     self.update_worker.update_done = False
-                    weights = ray.put(self.local_agent.get_policy_weights())
-                # self.logger.debug("Syncing weights for worker {}".format(self.worker_ids[ray_worker]))
-                # self.logger.debug("Weights type: {}, weights = {}".format(type(weights), weights))
-                ray_worker.set_policy_weights.remote(weights)
-                self.weight_syncs_executed += 1
+                    self.weight_publisher.publish(self.local_agent.get_policy_weights())
+                if self.weight_publisher.sync(ray_worker):
+                    self.weight_syncs_executed += 1
                 self.steps_since_weights_synced[ray_worker] = 0
 
-            # Reschedule environment samples.
-            self.env_sample_tasks.add_task(ray_worker, ray_worker.execute_and_get_with_count.remote())
-
-        # 2. Fetch completed replay priority sampling task, move to worker, reschedule.
-        for ray_memory, replay_remote_task in self.prioritized_replay_tasks.get_completed():
-            # Immediately schedule new batch sampling tasks on these workers.
-            self.prioritized_replay_tasks.add_task(ray_memory, ray_memory.get_batch.remote())
-
-            # Retrieve results via id.
-            # self.logger.info("replay task obj id {}".format(replay_remote_task))
-            sampled_batch = ray.get(object_ids=replay_remote_task)
-            # if sampled_batch is not None:
-            #     self.logger.info("Received result of replay task: {}".format(len(sampled_batch["terminals"])))
-            #     self.logger.info("Received result of replay task: {}".format(len(sampled_batch["indices"])))
+            # Reschedule environment samples up to the worker's current task depth.
+            self._schedule_sample_tasks(ray_worker)
+        samples_end = time.monotonic()
+        self.stage_latencies["samples"].record(samples_end - fetch_end)
+
+        # 4. Move sampled replay batches to the update worker and reschedule sampling.
+        for (ray_memory, _), sampled_batch in zip(completed_replay_tasks, sampled_batches):
+            if self.replay_coordinator is not None:
+                sampled_batch, shard_stats = sampled_batch
+                self.replay_coordinator.update_shard_stats(ray_memory, shard_stats)
+                # Sample the next shard by priority mass, so the total number of tasks stays constant.
+                self._schedule_replay_task(self.replay_coordinator.sample_shard())
+            else:
+                # Immediately schedule new batch sampling tasks on these workers.
+                self._schedule_replay_task(ray_memory)
 
             # Pass to the agent doing the actual updates.
             # The ray worker is passed along because we need to update its priorities later in the subsequent
             # task (see loop below).
             self.update_worker.input_queue.put((ray_memory, sampled_batch))
+        replay_end = time.monotonic()
+        self.stage_latencies["replay"].record(replay_end - samples_end)
 
-        # 3. Update priorities on priority sampling workers using loss values produced by update worker.
+        # 5. Update priorities on priority sampling workers using loss values produced by update worker.
+        # Updates for the same shard are coalesced into a single call.
+        shard_updates = dict()
         while not self.update_worker.output_queue.empty():
             ray_memory, indices, loss_per_item = self.update_worker.output_queue.get()
-            # self.logger.info('indices = {}'.format(batch["indices"]))
-            # self.logger.info('loss = {}'.format(loss_per_item))
-
-            ray_memory.update_priorities.remote(indices, loss_per_item)
+            if ray_memory not in shard_updates:
+                shard_updates[ray_memory] = ([], [])
+            shard_updates[ray_memory][0].append(indices)
+            shard_updates[ray_memory][1].append(loss_per_item)
             # len of loss per item is update count.
             update_steps += len(indices)
+        for ray_memory, (indices, loss_per_item) in shard_updates.items():
+            if len(indices) == 1:
+                ray_memory.update_priorities.remote(indices[0], loss_per_item[0])
+            else:
+                ray_memory.update_priorities.remote(np.concatenate(indices), np.concatenate(loss_per_item))
+        loop_end = time.monotonic()
+        self.stage_latencies["priorities"].record(loop_end - replay_end)
+        self.stage_latencies["loop"].record(loop_end - loop_start)
 
         return env_steps, update_steps
 
+    def get_live_metrics(self):
+        learner_metrics = self.update_worker.get_metrics()
+        return dict(
+            learner_updates=learner_metrics["updates"],
+            learner_idle_fraction=learner_metrics["idle_fraction"],
+            learner_input_queue_depth=learner_metrics["input_queue_depth"],
+            learner_ready_queue_depth=learner_metrics["ready_queue_depth"],
+            pending_sample_tasks=len(self.env_sample_tasks.get_pending()),
+            pending_replay_tasks=len(self.prioritized_replay_tasks.get_pending()),
+            weights_version=self.weight_publisher.version
+        )
+
+    def get_learner_metrics(self):
+        """
+        Returns:
+            dict: Learner metrics, see `UpdateWorker.get_metrics`.
+        """
+        return self.update_worker.get_metrics()
+
+    def get_stage_latencies(self):
+        """
+        Returns latency statistics of the driver loop stages:
+
+        - wait: Waiting on pending sample and replay tasks.
+        - fetch: Fetching results of completed tasks.
+        - samples: Routing env samples to replay shards, syncing weights and rescheduling sample tasks.
+        - replay: Passing sampled batches to the update worker and rescheduling replay tasks. Includes time
+            blocked on a full learner queue.
+        - priorities: Sending coalesced priority updates.
+        - loop: Full loop iteration.
+
+        Returns:
+            dict: Stage name -> latency statistics, see `LatencyHistogram.get_stats`.
+        """
+        return {stage: histogram.get_stats() for stage, histogram in self.stage_latencies.items()}
+
+    def get_replay_metrics(self):
+        """
+        Fetches ingestion, sampling and queue-depth metrics of all replay shards.
+
+        Returns:
+            list: One metrics dict per replay shard, see `RayMemoryActor.get_metrics`.
+        """
+        return ray.get([ray_memory.get_metrics.remote() for ray_memory in self.ray_local_replay_memories])
+
+    def save_replay(self, directory, background=True, compression=None):
+        """
+        Writes a snapshot of every replay shard, e.g. to resume a run without refilling the memories.
+
+        Args:
+            directory (str): Snapshot directory, shard i is written to "replay_shard_<i>.snapshot".
+            background (bool): If True, shards continue to insert and sample while their snapshots are
+                written.
+            compression (Optional[str]): Snapshot compression, see `write_snapshot`.
+        """
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        ray.get([ray_memory.save.remote(self._get_shard_snapshot_path(directory, i), background, compression)
+                 for i, ray_memory in enumerate(self.ray_local_replay_memories)])
+
+    def load_replay(self, directory):
+        """
+        Restores every replay shard from snapshots written by `save_replay`.
+
+        Args:
+            directory (str): Snapshot directory.
+        """
+        ray.get([ray_memory.load.remote(self._get_shard_snapshot_path(directory, i))
+                 for i, ray_memory in enumerate(self.ray_local_replay_memories)])
+
+    @staticmethod
+    def _get_shard_snapshot_path(directory, shard_index):
+        return os.path.join(directory, "replay_shard_{}.snapshot".format(shard_index))
+
+    def replace_worker(self, worker, num_environments=None):
+        # Tasks pending on the old worker are dropped, the new one receives the latest weights.
+        self.env_sample_tasks.remove_worker_tasks(worker)
+        self.weight_publisher.remove_worker(worker)
+        del self.steps_since_weights_synced[worker]
+        new_worker = super(ApexExecutor, self).replace_worker(worker, num_environments)
+        if self.placement is not None:
+            self.placement.remove_worker(worker)
+            self.placement.add_worker_pending(new_worker, new_worker.get_host.remote())
+
+        self.weight_publisher.sync(new_worker)
+        self.steps_since_weights_synced[new_worker] = 0
+        self._schedule_sample_tasks(new_worker)
+        return new_worker
+
+    def _schedule_sample_tasks(self, ray_worker):
+        """
+        Schedules sample tasks on a worker until its current task depth is reached.
+
+        Args:
+            ray_worker (RayWorker): Remote worker to sample on.
+        """
+        for _ in range(self.worker_scheduler.get_num_tasks_to_schedule(ray_worker)):
+            self.env_sample_tasks.add_task(ray_worker, ray_worker.execute_and_get_with_count.remote())
+            self.worker_scheduler.task_scheduled(ray_worker)
+
+    def _schedule_replay_task(self, ray_memory):
+        """
+        Schedules a batch sampling task on a replay memory actor.
+
+        Args:
+            ray_memory (RayMemoryActor): Replay memory actor to sample from.
+        """
+        if self.replay_coordinator is not None:
+            task = ray_memory.get_batch_with_stats.remote(self.replay_coordinator.get_global_stats())
+        else:
+            task = ray_memory.get_batch.remote()
+        self.prioritized_replay_tasks.add_task(ray_memory, task)
+
 
 class UpdateWorker(Thread):
     """
     Executes learning separate from the main event loop as described in the Ape-X paper.
     Communicates with the main thread via a queue.
+
+    Optionally, loader threads convert incoming sample batches into contiguous arrays of the
+    agent's input dtypes ahead of the learner, so batch preparation is not on the critical path
+    between updates.
     """
 
-    def __init__(self, agent, in_queue_size):
+    def __init__(self, agent, in_queue_size, num_loader_threads=0):
         """
         Initializes the worker with a RLGraph agent and queues for
 
         Args:
             agent (Agent): RLGraph agent used to execute local updates.
-            input_queue (queue.Queue): Input queue the worker will use to poll samples.
-            output_queue (queue.Queue): Output queue the worker will use to push results of local
-                update computations.
+            in_queue_size (int): Size of the input queue the worker will use to poll samples, and of
+                the queue of prepared batches.
+            num_loader_threads (int): Number of threads preparing batches. If 0, batches are passed to
+                the agent as received.
         """
         super(UpdateWorker, self).__init__()
 
@@ -258,23 +487,102 @@ class UpdateWorker(Thread):
         self.input_queue = queue.Queue(maxsize=in_queue_size)
         self.output_queue = queue.Queue()
 
+        self.loader_threads = []
+        for _ in range(num_loader_threads):
+            loader_thread = Thread(target=self._load)
+            loader_thread.daemon = True
+            self.loader_threads.append(loader_thread)
+        # Batches ready to be fed to the agent.
+        self.ready_queue = queue.Queue(maxsize=in_queue_size) if self.loader_threads else self.input_queue
+        self.field_dtypes = self._get_field_dtypes(agent)
+
         # Terminate when host process terminates.
         self.daemon = True
 
         # Flag for main thread.
         self.update_done = False
 
+        # Learner metrics.
+        self.metrics_lock = Lock()
+        self.updates = 0
+        self.idle_time = 0.0
+        self.compute_time = 0.0
+        self.load_time = 0.0
+
     def run(self):
+        for loader_thread in self.loader_threads:
+            loader_thread.start()
         while True:
             self.step()
 
     def step(self):
         # Fetch input for update:
         # Replay memory used.
-        memory_actor, sample_batch = self.input_queue.get()
+        wait_start = time.monotonic()
+        memory_actor, sample_batch = self.ready_queue.get()
+        update_start = time.monotonic()
+        self.idle_time += update_start - wait_start
 
         if sample_batch is not None:
             loss, loss_per_item = self.agent.update(batch=sample_batch)
+            self.compute_time += time.monotonic() - update_start
+            self.updates += 1
             # Just pass back indices for updating.
             self.output_queue.put((memory_actor, sample_batch["indices"], loss_per_item))
             self.update_done = True
+
+    def get_metrics(self):
+        """
+        Returns:
+            dict: Number of updates, time the learner spent waiting on batches (idle) and in updates (compute)
+                and their fractions of the total, total batch preparation time of the loader threads and queue
+                depths.
+        """
+        with self.metrics_lock:
+            load_time = self.load_time
+        total_time = self.idle_time + self.compute_time
+        return dict(
+            updates=self.updates,
+            idle_time=self.idle_time,
+            compute_time=self.compute_time,
+            idle_fraction=self.idle_time / total_time if total_time > 0 else 0.0,
+            compute_fraction=self.compute_time / total_time if total_time > 0 else 0.0,
+            mean_update_time=self.compute_time / self.updates if self.updates > 0 else 0.0,
+            load_time=load_time,
+            input_queue_depth=self.input_queue.qsize(),
+            ready_queue_depth=self.ready_queue.qsize()
+        )
+
+    def _load(self):
+        while True:
+            memory_actor, sample_batch = self.input_queue.get()
+            if sample_batch is not None:
+                load_start = time.monotonic()
+                sample_batch = self.prepare_batch(sample_batch)
+                with self.metrics_lock:
+                    self.load_time += time.monotonic() - load_start
+                self.ready_queue.put((memory_actor, sample_batch))
+
+    def prepare_batch(self, sample_batch):
+        """
+        Converts a sample batch into contiguous arrays of the agent's input dtypes.
+
+        Args:
+            sample_batch (dict): Sample batch as returned by a replay memory.
+
+        Returns:
+            dict: Batch of contiguous arrays.
+        """
+        return {name: np.ascontiguousarray(value, dtype=self.field_dtypes.get(name))
+                for name, value in sample_batch.items()}
+
+    @staticmethod
+    def _get_field_dtypes(agent):
+        field_dtypes = dict(rewards=np.float32, terminals=np.bool_, importance_weights=np.float32)
+        state_space = getattr(agent, "preprocessed_state_space", None)
+        if state_space is not None and not isinstance(state_space, ContainerSpace):
+            field_dtypes["states"] = field_dtypes["next_states"] = np.dtype(state_space.dtype)
+        action_space = getattr(agent, "action_space", None)
+        if action_space is not None and not isinstance(action_space, ContainerSpace):
+            field_dtypes["actions"] = np.dtype(action_space.dtype)
+        return field_dtypes
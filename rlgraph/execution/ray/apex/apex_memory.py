@@ -17,32 +17,66 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+from threading import RLock
+
 import numpy as np
-import operator
-from six.moves import xrange as range_
 
 from rlgraph.utils import SMALL_NUMBER
 from rlgraph.utils.specifiable import Specifiable
-from rlgraph.components.helpers.mem_segment_tree import MemSegmentTree, MinSumSegmentTree
-from rlgraph.execution.ray.ray_util import ray_decompress
+from rlgraph.components.helpers.mem_frame_buffer import MemFrameBuffer
+from rlgraph.components.helpers.mem_map_storage import MemMapStorage
+from rlgraph.components.helpers.mem_segment_tree import NumpyMinSumSegmentTree
+from rlgraph.components.helpers.mem_snapshot import BackgroundSnapshot, read_snapshot, write_snapshot
+from rlgraph.utils.rlgraph_errors import RLGraphError
+from rlgraph.execution.ray.codecs import Codec
 
 
 class ApexMemory(Specifiable):
     """
     Apex prioritized replay implementing compression.
     """
-    def __init__(self, capacity=1000, alpha=1.0, beta=1.0, n_step_adjustment=1):
+    # Order of fields in a record tuple, followed by the (optional) priority weight.
+    record_fields = ("states", "actions", "rewards", "terminals", "next_states")
+
+    def __init__(self, capacity=1000, alpha=1.0, beta=1.0, n_step_adjustment=1, storage="columnar",
+                 frame_stack=4, frame_capacity=None, codec="lz4", memmap_dir=None, memmap_max_bytes=None):
         """
-        TODO: documentation.
         Args:
-            capacity ():
-            alpha ():
-            beta ():
-            n_step_adjustment ():
+            capacity (int): Maximum number of records in the memory. Older records are overwritten first.
+            alpha (float): Degree to which prioritization is applied, 0.0 implies no
+                prioritization (uniform), 1.0 full prioritization.
+            beta (float): Importance weight factor, 0.0 for no importance correction, 1.0
+                for full correction.
+            n_step_adjustment (int): Offset between a transition's state and next state in a trajectory, 1
+                corresponds to the direct next state. Only used by "frames" storage to find next states among
+                the states of an inserted batch.
+            storage (str): Record storage layout. "columnar" keeps one preallocated array per record field
+                (sized on the first insert from the shapes and dtypes of the inserted fields), "list" keeps
+                a list of per-record tuples. "frames" stores states and next states in a `MemFrameBuffer`
+                so every observation frame of a frame-stacked state is only kept once. Other fields are
+                stored columnar. "memmap" keeps each field in a disk-backed `np.memmap` file in `memmap_dir`,
+                priorities stay in memory.
+            frame_stack (int): Number of frames stacked in the last rank of states for "frames" storage.
+            frame_capacity (Optional[int]): Number of frames in the frame ring for "frames" storage.
+                Transitions referencing overwritten frames are removed from sampling. Defaults to
+                1.25 * capacity.
+            codec (Union[str, dict, Codec]): Spec of the codec used to decompress states and next states. Must
+                match the codec of the sample workers. States of chunks compressed as one block are
+                re-encoded per state on insert.
+            memmap_dir (Optional[str]): Directory of the record files for "memmap" storage. Defaults to a
+                temporary directory.
+            memmap_max_bytes (Optional[int]): Maximum size of a compressed state for "memmap" storage. Defaults
+                to the worst-case compressed size of the codec for the state shape of the first insert.
         """
         super(ApexMemory, self).__init__()
 
+        assert storage in ["columnar", "list", "frames", "memmap"], \
+            "ERROR: Storage must be 'columnar', 'list', 'frames' or 'memmap' but is {}.".format(storage)
+        self.storage = storage
+        self.codec = Codec.from_spec(codec)
         self.memory_values = []
+        # Field name -> preallocated array of shape (capacity,) + field shape for columnar storage.
+        self.record_columns = None
         self.index = 0
         self.capacity = capacity
         self.size = 0
@@ -60,33 +94,187 @@ class ApexMemory(Specifiable):
             self.priority_capacity *= 2
 
         # Create segment trees, initialize with neutral elements.
-        sum_values = [0.0 for _ in range_(2 * self.priority_capacity)]
-        sum_segment_tree = MemSegmentTree(sum_values, self.priority_capacity, operator.add)
-        min_values = [float('inf') for _ in range_(2 * self.priority_capacity)]
-        min_segment_tree = MemSegmentTree(min_values, self.priority_capacity, min)
-        self.merged_segment_tree = MinSumSegmentTree(
-            sum_tree=sum_segment_tree,
-            min_tree=min_segment_tree,
-            capacity=self.priority_capacity
-        )
+        self.merged_segment_tree = NumpyMinSumSegmentTree(self.priority_capacity)
+
+        # Held while records are written, so a background snapshot can copy rows between inserts.
+        self.lock = RLock()
+        # Background snapshot being written, preserves rows before inserts overwrite them.
+        self.snapshot = None
+
+        self.record_storage = None
+        if self.storage == "memmap":
+            self.record_storage = MemMapStorage(capacity, directory=memmap_dir, max_bytes=memmap_max_bytes)
+
+        self.frame_buffer = None
+        if self.storage == "frames":
+            if frame_capacity is None:
+                frame_capacity = capacity + capacity // 4
+            self.frame_buffer = MemFrameBuffer(frame_capacity, frame_stack, n_step_adjustment)
+            # Total number of inserted transitions and oldest one not referencing overwritten frames.
+            self.num_inserted = 0
+            self.oldest_valid = 0
 
     def insert_records(self, record):
-        # TODO: This has the record interface, but actually expects a specific structure anyway, so
-        # may as well change API?
-        if self.index >= self.size:
-            self.memory_values.append(record)
-        else:
-            self.memory_values[self.index] = record
+        with self.lock:
+            # TODO: This has the record interface, but actually expects a specific structure anyway, so
+            # may as well change API?
+            # Compressed values are kept as objects, fixed-width byte arrays would strip trailing null bytes.
+            batched_values = [np.asarray(value)[np.newaxis] if not isinstance(value, bytes) else
+                              np.array([value], dtype=object) for value in record[:5]]
+            if self.storage in ["frames", "memmap"]:
+                self.insert_batch(dict(
+                    zip(self.record_fields, batched_values),
+                    importance_weights=None if record[5] is None else np.asarray([record[5]])
+                ))
+                return
+            elif self.storage == "columnar":
+                if self.record_columns is None:
+                    self._init_columns(batched_values)
+                self._preserve_rows(self.index)
+                for name, value in zip(self.record_fields, record):
+                    self.record_columns[name][self.index] = value
+            elif self.index >= self.size:
+                self.memory_values.append(record)
+            else:
+                self.memory_values[self.index] = record
 
-        # Weights. # TODO this is problematic due to index not existing.
-        if record[5] is not None:
-            self.merged_segment_tree.insert(self.index, record[5] ** self.alpha)
-        else:
-            self.merged_segment_tree.insert(self.index, self.max_priority ** self.alpha)
+            # Weights. # TODO this is problematic due to index not existing.
+            if record[5] is not None:
+                self.merged_segment_tree.insert(self.index, record[5] ** self.alpha)
+            else:
+                self.merged_segment_tree.insert(self.index, self.max_priority ** self.alpha)
+
+            # Update indices.
+            self.index = (self.index + 1) % self.capacity
+            self.size = min(self.size + 1, self.capacity)
+
+    def insert_batch(self, records):
+        """
+        Inserts a chunk of records. For columnar storage, this is a single slice assignment per field
+        and one batched priority insert.
+
+        Args:
+            records (dict): Dict with the keys in `record_fields` and optionally "importance_weights",
+                each mapping to a value array with a leading batch dimension.
+        """
+        with self.lock:
+            num_records = len(records["rewards"])
+            if num_records == 0:
+                return
+            # States compressed as one block per chunk. Chunked compression only applies to the transfer from
+            # the sample workers: blocks are re-encoded per state, so states stay compressed in the memory and
+            # can be read one by one. "frames" storage keeps frames uncompressed.
+            if isinstance(records["states"], bytes):
+                states = self.codec.decompress_batch(records["states"])
+                next_states = self.codec.decompress_batch(records["next_states"])
+                if self.storage != "frames":
+                    states = self.codec.compress_batch(states)
+                    next_states = self.codec.compress_batch(next_states)
+                records = dict(records, states=states, next_states=next_states)
+            weights = records.get("importance_weights", None)
+
+            if self.storage == "list":
+                for i in range(num_records):
+                    self.insert_records(tuple(records[name][i] for name in self.record_fields) +
+                                        (None if weights is None else weights[i],))
+                return
+
+            if self.storage == "frames":
+                records = self._insert_frames(records)
+            if self.record_columns is None:
+                self._init_columns([np.asarray(records[name]) for name in self.record_fields])
+
+            tree_indices = np.arange(self.index, self.index + num_records) % self.capacity
+            if self.index + num_records <= self.capacity:
+                insert_indices = slice(self.index, self.index + num_records)
+            else:
+                insert_indices = tree_indices
+            self._preserve_rows(insert_indices)
+            if self.storage == "memmap":
+                self.record_storage.write(insert_indices, {name: records[name] for name in self.record_fields})
+            else:
+                for name in self.record_fields:
+                    self.record_columns[name][insert_indices] = records[name]
+
+            if weights is not None:
+                priorities = np.power(np.asarray(weights, dtype=np.float64), self.alpha)
+            else:
+                priorities = self.max_priority ** self.alpha
+            self.merged_segment_tree.insert_batch(tree_indices, priorities)
+
+            # Update indices.
+            self.index = (self.index + num_records) % self.capacity
+            self.size = min(self.size + num_records, self.capacity)
+
+            if self.storage == "frames":
+                self.num_inserted += num_records
+                self._remove_stale_records()
 
-        # Update indices.
-        self.index = (self.index + 1) % self.capacity
-        self.size = min(self.size + 1, self.capacity)
+    def _preserve_rows(self, indices):
+        """
+        Lets a background snapshot in progress copy rows before they are overwritten.
+
+        Args:
+            indices (Union[int, slice, ndarray]): Rows about to be overwritten.
+        """
+        if self.snapshot is None:
+            return
+        if not self.snapshot.is_alive():
+            self.snapshot = None
+            return
+        for name in self.record_fields:
+            self.snapshot.preserve("columns/" + name, indices)
+            self.snapshot.preserve("lengths/" + name, indices)
+
+    def _insert_frames(self, records):
+        """
+        Writes the frames of states and next states to the frame buffer.
+
+        Returns:
+            dict: Records with states and next states replaced by their newest-frame positions.
+        """
+        states = records["states"]
+        next_states = records["next_states"]
+        # Frames must be stored uncompressed.
+        if np.asarray(states).dtype.kind in ["S", "O"]:
+            states = self.codec.decompress_batch(states)
+            next_states = self.codec.decompress_batch(next_states)
+        state_positions, next_state_positions = self.frame_buffer.insert(states, next_states)
+        return dict(records, states=state_positions, next_states=next_state_positions)
+
+    def _remove_stale_records(self):
+        """
+        Removes the oldest transitions whose frames were overwritten in the frame ring from sampling.
+        """
+        start = max(self.oldest_valid, self.num_inserted - self.size)
+        self.oldest_valid = self.frame_buffer.find_stale(self.record_columns["states"], start, self.num_inserted)
+        if self.oldest_valid > start:
+            self.merged_segment_tree.remove_batch(np.arange(start, self.oldest_valid) % self.capacity)
+
+    def _init_columns(self, field_values):
+        """
+        Preallocates one array per record field from the shape and dtype of the first inserted values.
+        Byte-string fields (e.g. compressed states) are kept as object arrays so they are not truncated
+        to a fixed width.
+
+        Args:
+            field_values (list): One batched value array per field in `record_fields`.
+        """
+        if self.storage == "memmap":
+            max_bytes = None
+            if self.record_storage.max_bytes is None:
+                # Compressed values of any content must fit the rows.
+                max_bytes = {name: self.codec.get_max_compressed_size(self.codec.decompress(value[0]))
+                             for name, value in zip(self.record_fields, field_values) if value.dtype == object}
+            self.record_storage.create_columns(dict(zip(self.record_fields, field_values)), max_bytes)
+            self.record_columns = self.record_storage.columns
+            return
+        self.record_columns = {}
+        for name, value in zip(self.record_fields, field_values):
+            if value.dtype.kind in ["S", "U", "O"]:
+                self.record_columns[name] = np.empty((self.capacity,) + value.shape[1:], dtype=object)
+            else:
+                self.record_columns[name] = np.zeros((self.capacity,) + value.shape[1:], dtype=value.dtype)
 
     def read_records(self, indices):
         """
@@ -98,6 +286,23 @@ class ApexMemory(Specifiable):
         Returns:
              dict: Record value dict.
         """
+        if self.storage == "memmap":
+            records = self.record_storage.read(indices, self.record_fields)
+            for name, values in records.items():
+                if values.dtype == object:
+                    records[name] = self.codec.decompress_batch(values)
+            return records
+        elif self.storage != "list":
+            records = {}
+            for name in self.record_fields:
+                values = self.record_columns[name][indices]
+                if self.storage == "frames" and name in ["states", "next_states"]:
+                    values = self.frame_buffer.get_stacks(values)
+                elif values.dtype == object:
+                    values = self.codec.decompress_batch(values)
+                records[name] = values
+            return records
+
         states = []
         actions = []
         rewards = []
@@ -105,11 +310,11 @@ class ApexMemory(Specifiable):
         next_states = []
         for index in indices:
             state, action, reward, terminal, next_state, weight = self.memory_values[index]
-            states.append(ray_decompress(state))
+            states.append(self.codec.decompress(state))
             actions.append(action)
             rewards.append(reward)
             terminals.append(terminal)
-            next_states.append(ray_decompress(next_state))
+            next_states.append(self.codec.decompress(next_state))
 
         return dict(
             states=np.array(states),
@@ -119,26 +324,180 @@ class ApexMemory(Specifiable):
             next_states=np.array(next_states)
         )
 
-    def get_records(self, num_records):
-        indices = []
+    def get_records(self, num_records, global_stats=None):
+        """
+        Samples records proportionally to their priorities.
+
+        Args:
+            num_records (int): Number of records to sample.
+            global_stats (Optional[dict]): Priority statistics of a sharded replay this memory is a shard of,
+                see `get_priority_stats`. If given, importance weights are normalized against the global
+                priority sum, min-priority and size instead of this memory's own.
+
+        Returns:
+            Tuple[dict, ndarray, ndarray]: Records, indices and importance weights.
+        """
         prob_sum = self.merged_segment_tree.sum_segment_tree.get_sum(0, self.size)
         samples = np.random.random(size=(num_records,)) * prob_sum
-        for sample in samples:
-            indices.append(self.merged_segment_tree.sum_segment_tree.index_of_prefixsum(prefix_sum=sample))
+        indices = self.merged_segment_tree.sample_batch(samples)
 
         sum_prob = self.merged_segment_tree.sum_segment_tree.get_sum()
-        min_prob = self.merged_segment_tree.min_segment_tree.get_min_value() / sum_prob + SMALL_NUMBER
-        max_weight = (min_prob * self.size) ** (-self.beta)
-        weights = []
-        for index in indices:
-            sample_prob = self.merged_segment_tree.sum_segment_tree.get(index) / sum_prob
-            weight = (sample_prob * self.size) ** (-self.beta)
-            weights.append(weight / max_weight)
+        min_priority = self.merged_segment_tree.min_segment_tree.get_min_value()
+        size = self.size
+        if global_stats is not None:
+            # Global stats may be older than this shard's, so they cannot be smaller than its own.
+            sum_prob = max(sum_prob, global_stats["sum"])
+            min_priority = min(min_priority, global_stats["min"])
+            size = max(size, global_stats["size"])
+        min_prob = min_priority / sum_prob + SMALL_NUMBER
+        max_weight = (min_prob * size) ** (-self.beta)
+        sample_probs = self.merged_segment_tree.get_batch(indices) / sum_prob
+        weights = (sample_probs * size) ** (-self.beta) / max_weight
+
+        return self.read_records(indices=indices), indices, weights
+
+    def get_priority_stats(self):
+        """
+        Returns:
+            dict: Sum and min of the exponentiated priorities ("sum", "min"), the max priority ("max") and the
+                number of records ("size").
+        """
+        return dict(
+            sum=float(self.merged_segment_tree.sum_segment_tree.get_sum()),
+            min=float(self.merged_segment_tree.min_segment_tree.get_min_value()),
+            max=float(self.max_priority),
+            size=self.size
+        )
 
-        return self.read_records(indices=indices), np.array(indices), np.array(weights)
+    def set_max_priority(self, max_priority):
+        """
+        Raises the priority new records are inserted with, e.g. to the max priority across replay shards.
+
+        Args:
+            max_priority (float): Max priority to insert new records with if greater than the current one.
+        """
+        self.max_priority = max(self.max_priority, max_priority)
 
     def update_records(self, indices, update):
-        for index, loss in zip(indices, update):
-            self.merged_segment_tree.insert(index, loss ** self.alpha)
-            self.max_priority = max(self.max_priority, loss)
+        update = np.asarray(update)
+        if self.storage == "frames":
+            # Do not re-insert priorities of records removed since sampling.
+            valid = self.record_columns["states"][indices] >= self.frame_buffer.get_valid_start()
+            indices, update = np.asarray(indices)[valid], update[valid]
+        self.merged_segment_tree.insert_batch(indices, update ** self.alpha)
+        self.max_priority = max(self.max_priority, np.max(update))
+
+    def save(self, path, background=False, compression=None):
+        """
+        Writes a snapshot of records, priorities, index/size and max-priority, see `write_snapshot`.
+
+        Args:
+            path (str): Snapshot file.
+            background (bool): If True, writes the snapshot in a background thread, so inserts and sampling
+                can continue. Only index, size and priorities are copied up front. Records are copied chunk by
+                chunk while holding `self.lock` (straight from the files for "memmap" storage), and inserts
+                copy rows not written yet before overwriting them, so the snapshot holds the memory as of the
+                call. Not supported for "frames" storage, whose frame ring is overwritten by inserts.
+            compression (Optional[str]): Snapshot compression, see `write_snapshot`.
+
+        Returns:
+            Union[BackgroundSnapshot, None]: The snapshot being written if written in the background.
+        """
+        if background and self.storage == "frames":
+            raise RLGraphError("ERROR: Background snapshots are not supported for 'frames' storage.")
+        # Index, size and priorities of the same insert.
+        with self.lock:
+            assert self.snapshot is None or not self.snapshot.is_alive(), \
+                "ERROR: A background snapshot of this memory is still being written."
+            metadata = dict(capacity=self.capacity, storage=self.storage, index=self.index, size=self.size,
+                            max_priority=float(self.max_priority))
+            leaves = self.merged_segment_tree.sum_segment_tree.values
+            arrays = dict(priorities=np.array(leaves[self.priority_capacity:self.priority_capacity + self.size]))
+
+            if self.storage == "list":
+                for i, name in enumerate(self.record_fields):
+                    values = np.empty(self.size, dtype=object)
+                    values[:] = [record[i] for record in self.memory_values]
+                    arrays["columns/" + name] = values
+            elif self.record_columns is not None:
+                for name in self.record_fields:
+                    arrays["columns/" + name] = self.record_columns[name][:self.size]
+                if self.storage == "memmap":
+                    for name, lengths in self.record_storage.byte_lengths.items():
+                        arrays["lengths/" + name] = lengths[:self.size]
+
+            if self.storage == "frames":
+                metadata.update(num_inserted=self.num_inserted, oldest_valid=self.oldest_valid)
+                frame_metadata, frame_arrays = self.frame_buffer.get_state()
+                metadata["frame_buffer"] = frame_metadata
+                arrays.update({"frame_buffer/" + name: value for name, value in frame_arrays.items()})
+
+            if background:
+                self.snapshot = BackgroundSnapshot(path, metadata, arrays, compression, self.lock)
+                return self.snapshot
+        write_snapshot(path, metadata, arrays, compression)
+
+    def load(self, path):
+        """
+        Restores a snapshot written by `save`. Records are streamed into the storage chunk by chunk.
+
+        Args:
+            path (str): Snapshot file.
+        """
+        assert self.snapshot is None or not self.snapshot.is_alive(), \
+            "ERROR: Cannot load while a background snapshot of this memory is being written."
+        metadata, array_specs, chunks = read_snapshot(path)
+        assert metadata["capacity"] == self.capacity and metadata["storage"] == self.storage, \
+            "ERROR: Snapshot of {} memory with capacity {} cannot be loaded into {} memory with capacity " \
+            "{}.".format(metadata["storage"], metadata["capacity"], self.storage, self.capacity)
+
+        # Allocate storage, then copy chunks into it.
+        targets = {}
+        frame_arrays = {}
+        for name, (dtype, shape) in array_specs.items():
+            if name.startswith("columns/") and self.storage != "list":
+                if self.record_columns is None:
+                    self._init_snapshot_columns(array_specs)
+                targets[name] = self.record_columns[name[len("columns/"):]]
+            elif name.startswith("lengths/"):
+                targets[name] = self.record_storage.byte_lengths[name[len("lengths/"):]]
+            else:
+                targets[name] = np.empty(shape, dtype=dtype)
+                if name.startswith("frame_buffer/"):
+                    frame_arrays[name[len("frame_buffer/"):]] = targets[name]
+        for name, start, chunk in chunks:
+            targets[name][start:start + len(chunk)] = chunk
+
+        self.index = metadata["index"]
+        self.size = metadata["size"]
+        self.max_priority = metadata["max_priority"]
+        if self.storage == "list":
+            self.memory_values = [values + (None,) for values in
+                                  zip(*[targets["columns/" + name] for name in self.record_fields])]
+
+        self.merged_segment_tree = NumpyMinSumSegmentTree(self.priority_capacity)
+        priorities = targets["priorities"]
+        indices = np.arange(self.size)
+        self.merged_segment_tree.insert_batch(indices[priorities > 0], priorities[priorities > 0])
+
+        if self.storage == "frames":
+            self.num_inserted = metadata["num_inserted"]
+            self.oldest_valid = metadata["oldest_valid"]
+            self.frame_buffer.set_state(metadata["frame_buffer"], frame_arrays)
+
+    def _init_snapshot_columns(self, array_specs):
+        """
+        Allocates record columns for the fields of a snapshot.
+        """
+        if self.storage == "memmap":
+            for name in self.record_fields:
+                dtype, shape = array_specs["columns/" + name]
+                if "lengths/" + name in array_specs:
+                    self.record_storage.create_byte_column(name, shape[1])
+                else:
+                    self.record_storage.create_column(name, shape[1:], dtype)
+            self.record_columns = self.record_storage.columns
+        else:
+            self._init_columns([np.empty((0,) + array_specs["columns/" + name][1][1:],
+                                         dtype=array_specs["columns/" + name][0]) for name in self.record_fields])
 
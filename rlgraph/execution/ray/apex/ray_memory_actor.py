@@ -17,11 +17,15 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+from threading import Event, Lock, Thread
+
 import numpy as np
-from six.moves import xrange as range_
+from six.moves import queue
+
 from rlgraph import get_distributed_backend
 from rlgraph.execution.ray.apex.apex_memory import ApexMemory
 from rlgraph.execution.ray.ray_actor import RayActor
+from rlgraph.utils.rlgraph_errors import RLGraphError
 
 if get_distributed_backend() == "ray":
     import ray
@@ -30,11 +34,20 @@ if get_distributed_backend() == "ray":
 class RayMemoryActor(RayActor):
     """
     An in-memory prioritized replay worker used to accelerate memory interaction in Ape-X.
+
+    In concurrent mode, a background thread owns the memory: `observe` and `update_priorities` only enqueue
+    their inputs, and the thread inserts records, applies pending priority updates in bulk and samples
+    batches ahead of time into a prefetch queue that `get_batch` serves from. Inserting a large chunk
+    then no longer stalls sampling, and the memory needs no locks since only the thread touches it. Priority
+    statistics are cached by the thread for batches the prefetch queue cannot serve.
     """
     def __init__(self, apex_replay_spec):
         """
         Args:
             apex_replay_spec (dict): Specifies behaviour of this replay actor. Must contain key "memory_spec".
+                Optional keys for concurrent mode: "concurrent" (bool), "prefetch_depth" (number of batches
+                sampled ahead of time), "prefetch_timeout" (seconds `get_batch` waits for a prefetched batch)
+                and "ingest_queue_size" (max number of pending env samples).
         """
         # N.b. The memory spec contains type PrioritizedReplay because that is
         # used for the agent. We hence do not use from_spec but just read the relevant
@@ -42,7 +55,33 @@ class RayMemoryActor(RayActor):
         self.min_sample_memory_size = apex_replay_spec["min_sample_memory_size"]
         self.clip_rewards = apex_replay_spec.get("clip_rewards", True)
         self.sample_batch_size = apex_replay_spec["sample_batch_size"]
-        self.memory = ApexMemory(**apex_replay_spec["memory_spec"])
+        # Codec shared with the sample workers.
+        self.memory = ApexMemory(codec=apex_replay_spec.get("codec", "lz4"), **apex_replay_spec["memory_spec"])
+        # Thread writing the current snapshot in the background.
+        self.snapshot_thread = None
+
+        self.concurrent = apex_replay_spec.get("concurrent", False)
+        self.prefetch_timeout = apex_replay_spec.get("prefetch_timeout", 0.05)
+        self.metrics = dict(records_inserted=0, batches_sampled=0, batches_served=0, prefetch_misses=0,
+                            priority_updates=0, bulk_priority_updates=0)
+        # Counters are incremented by the actor and the memory thread.
+        self.metrics_lock = Lock()
+        if self.concurrent:
+            # Env samples and commands (e.g. snapshots) to process in the memory thread.
+            self.ingest_queue = queue.Queue(maxsize=apex_replay_spec.get("ingest_queue_size", 0))
+            # Pending (indices, loss) priority updates, applied in bulk.
+            self.priority_queue = queue.Queue()
+            # Sampled (batch, stats) tuples.
+            self.prefetch_queue = queue.Queue(maxsize=apex_replay_spec.get("prefetch_depth", 4))
+            # Latest global stats of a sharded replay, used for prefetched batches.
+            self.global_stats = None
+            # Priority stats as of the last memory change, written by the memory thread only.
+            self.priority_stats = self.memory.get_priority_stats()
+            # Exception which terminated the memory thread.
+            self.memory_thread_error = None
+            self.memory_thread = Thread(target=self._run_memory_thread)
+            self.memory_thread.daemon = True
+            self.memory_thread.start()
 
     @classmethod
     def as_remote(cls, num_cpus=None, num_gpus=None):
@@ -56,14 +95,22 @@ class RayMemoryActor(RayActor):
             dict: Sample batch
 
         """
-        if self.memory.size < self.min_sample_memory_size:
-            return None
-        else:
-            batch, indices, weights = self.memory.get_records(self.sample_batch_size)
-            # Merge into one dict to only return one future in ray.
-            batch["indices"] = indices
-            batch["importance_weights"] = weights
-            return batch
+        return self._get_sample(None)[0]
+
+    def get_batch_with_stats(self, global_stats=None):
+        """
+        Samples a batch for a sharded replay and reports this shard's priority statistics.
+
+        Args:
+            global_stats (Optional[dict]): Global priority statistics of all shards (see
+                `ShardedReplayCoordinator.get_global_stats`), used to normalize importance weights and to
+                propagate the global max-priority.
+
+        Returns:
+            Tuple[Union[dict, None], dict]: Sample batch (None if the memory is not filled enough yet) and
+                priority stats of this shard.
+        """
+        return self._get_sample(global_stats)
 
     def observe(self, env_sample):
         """
@@ -71,30 +118,11 @@ class RayMemoryActor(RayActor):
 
         N.b. For performance reason, data layout is slightly different for apex.
         """
-        records = env_sample.get_batch()
-        num_records = len(records['states'])
-
-        # TODO port to tf PR behaviour.
-        if self.clip_rewards:
-            rewards = np.sign(records["rewards"])
+        if self.concurrent:
+            self._check_memory_thread()
+            self.ingest_queue.put(env_sample)
         else:
-            rewards = records["rewards"]
-        for i in range_(num_records):
-            self.memory.insert_records((
-                records["states"][i],
-                records["actions"][i],
-                rewards[i],
-                records["terminals"][i],
-                records["next_states"][i],
-                records["importance_weights"][i]
-            ))
-            # self.memory.insert_records((
-            #     records["states"][i],
-            #     records["actions"][i],
-            #     rewards[i],
-            #     records["terminals"][i],
-            #     records["importance_weights"][i]
-            # ))
+            self._insert(env_sample)
 
     def update_priorities(self, indices, loss):
         """
@@ -105,4 +133,197 @@ class RayMemoryActor(RayActor):
             indices (ndarray): Indices to update in replay memory.
             loss (ndarray):  Loss values for indices.
         """
-        self.memory.update_records(indices, loss)
\ No newline at end of file
+        if self.concurrent:
+            self.priority_queue.put((indices, loss))
+        else:
+            self.memory.update_records(indices, loss)
+            self._count("priority_updates")
+
+    def get_metrics(self):
+        """
+        Returns:
+            dict: Counters of inserted records, sampled and served batches, prefetch misses (`get_batch` calls
+                without a prefetched batch) and priority updates, as well as current queue depths.
+        """
+        with self.metrics_lock:
+            metrics = dict(self.metrics, memory_size=self.memory.size)
+        if self.concurrent:
+            metrics.update(
+                ingest_queue_depth=self.ingest_queue.qsize(),
+                priority_queue_depth=self.priority_queue.qsize(),
+                prefetch_queue_depth=self.prefetch_queue.qsize()
+            )
+        return metrics
+
+    def save(self, path, background=True, compression=None):
+        """
+        Writes a snapshot of the replay memory. A background snapshot lets this actor continue to insert and
+        sample while records are copied chunk by chunk, see `ApexMemory.save`.
+
+        Args:
+            path (str): Snapshot file.
+            background (bool): Whether to write in a background thread.
+            compression (Optional[str]): Snapshot compression, see `write_snapshot`.
+        """
+        # Only one snapshot at a time.
+        self.wait_for_snapshot()
+        self.snapshot_thread = self._run_in_memory_thread(
+            lambda: self.memory.save(path, background=background, compression=compression)
+        )
+
+    def wait_for_snapshot(self):
+        """
+        Blocks until a background snapshot has been written.
+
+        Returns:
+            bool: True once no snapshot is being written.
+        """
+        if self.snapshot_thread is not None:
+            self.snapshot_thread.join()
+            self.snapshot_thread = None
+        return True
+
+    def load(self, path):
+        """
+        Restores the replay memory from a snapshot.
+
+        Args:
+            path (str): Snapshot file.
+        """
+        self.wait_for_snapshot()
+        self._run_in_memory_thread(lambda: self.memory.load(path))
+        if self.concurrent:
+            # Drop batches sampled before loading.
+            while not self.prefetch_queue.empty():
+                self.prefetch_queue.get_nowait()
+
+    def _insert(self, env_sample):
+        records = env_sample.get_batch()
+
+        # TODO port to tf PR behaviour.
+        if self.clip_rewards:
+            records = dict(records, rewards=np.sign(records["rewards"]))
+        self.memory.insert_batch(records)
+        self._count("records_inserted", len(records["rewards"]))
+
+    def _sample(self, global_stats):
+        if global_stats is not None:
+            self.memory.set_max_priority(global_stats["max"])
+        batch = None
+        if self.memory.size >= self.min_sample_memory_size:
+            batch, indices, weights = self.memory.get_records(self.sample_batch_size, global_stats)
+            # Merge into one dict to only return one future in ray.
+            batch["indices"] = indices
+            batch["importance_weights"] = weights
+            self._count("batches_sampled")
+        return batch, self.memory.get_priority_stats()
+
+    def _get_sample(self, global_stats):
+        if not self.concurrent:
+            sample = self._sample(global_stats)
+        else:
+            self._check_memory_thread()
+            if global_stats is not None:
+                self.global_stats = global_stats
+            try:
+                sample = self.prefetch_queue.get(timeout=self.prefetch_timeout)
+            except queue.Empty:
+                self._count("prefetch_misses")
+                # The memory thread may be changing the priorities.
+                return None, self.priority_stats
+        if sample[0] is not None:
+            self._count("batches_served")
+        return sample
+
+    def _count(self, name, value=1):
+        with self.metrics_lock:
+            self.metrics[name] += value
+
+    def _run_in_memory_thread(self, fn):
+        """
+        Runs a function with exclusive access to the memory and returns its result.
+        """
+        if not self.concurrent:
+            return fn()
+        self._check_memory_thread()
+        done = Event()
+        result = []
+        self.ingest_queue.put((fn, done, result))
+        # Commands enqueued after the memory thread terminated are never run.
+        while not done.wait(timeout=1.0):
+            self._check_memory_thread()
+        if isinstance(result[0], Exception):
+            raise result[0]
+        return result[0]
+
+    def _check_memory_thread(self):
+        if self.memory_thread_error is not None:
+            raise RLGraphError("ERROR: Replay memory thread terminated: {}".format(self.memory_thread_error))
+
+    def _run_memory_thread(self):
+        try:
+            self._memory_loop()
+        except Exception as e:
+            self.memory_thread_error = e
+            # Release callers waiting for pending commands.
+            while True:
+                try:
+                    item = self.ingest_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if isinstance(item, tuple):
+                    _, done, result = item
+                    result.append(e)
+                    done.set()
+            raise
+
+    def _memory_loop(self):
+        while True:
+            # 1. Apply all pending priority updates at once.
+            self._apply_priority_updates()
+
+            # 2. Keep the prefetch queue filled.
+            if not self.prefetch_queue.full() and self.memory.size >= self.min_sample_memory_size:
+                sample = self._sample(self.global_stats)
+                self.priority_stats = sample[1]
+                self.prefetch_queue.put(sample)
+                # Interleave sampling with ingestion.
+                try:
+                    item = self.ingest_queue.get_nowait()
+                except queue.Empty:
+                    continue
+            else:
+                # Nothing to sample, wait for input.
+                try:
+                    item = self.ingest_queue.get(timeout=0.01)
+                except queue.Empty:
+                    continue
+
+            # 3. Insert an env sample or run a command.
+            if isinstance(item, tuple):
+                fn, done, result = item
+                # Commands see all priority updates sent before them.
+                self._apply_priority_updates()
+                try:
+                    result.append(fn())
+                except Exception as e:
+                    result.append(e)
+                done.set()
+            else:
+                self._insert(item)
+            self.priority_stats = self.memory.get_priority_stats()
+
+    def _apply_priority_updates(self):
+        updates = []
+        while True:
+            try:
+                updates.append(self.priority_queue.get_nowait())
+            except queue.Empty:
+                break
+        if updates:
+            self.memory.update_records(np.concatenate([np.asarray(indices) for indices, _ in updates]),
+                                       np.concatenate([np.asarray(loss) for _, loss in updates]))
+            with self.metrics_lock:
+                self.metrics["priority_updates"] += len(updates)
+                self.metrics["bulk_priority_updates"] += 1
+            self.priority_stats = self.memory.get_priority_stats()
@@ -0,0 +1,129 @@
+# Copyright 2018 The RLgraph authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+
+
+class ShardedReplayCoordinator(object):
+    """
+    Coordinates a prioritized replay memory split into shards (e.g. one `RayMemoryActor` per node) so that
+    sampling behaves like a single global prioritized replay:
+
+    - Shards are sampled proportionally to their total priority mass. Sampling a shard k with probability
+      S_k / S and then a record i in it with probability p_i / S_k samples i with the global probability p_i / S.
+    - The global priority sum, min-priority and size are passed to shards so importance weights are normalized
+      against the whole replay instead of the sampled shard.
+    - The global max-priority is passed to shards so new records enter every shard with the same priority.
+
+    Shard statistics are reported by the shards with each sampled batch. Between reports, the coordinator
+    estimates the growth of a shard's priority mass from the records it routed to the shard. Records routed to
+    a full shard replace records of the shard's mean priority.
+    """
+    def __init__(self, shards, shard_capacity, alpha=1.0):
+        """
+        Args:
+            shards (list): Replay shards, e.g. `RayMemoryActor` handles. Must be hashable.
+            shard_capacity (int): Capacity of each shard.
+            alpha (float): Priority exponent of the shards, used to estimate the mass of routed records.
+        """
+        self.shards = list(shards)
+        self.shard_indices = {shard: i for i, shard in enumerate(self.shards)}
+        self.shard_capacity = shard_capacity
+        self.alpha = alpha
+
+        num_shards = len(self.shards)
+        # Sum and min of the (exponentiated) priorities in each shard.
+        self.priority_sums = np.zeros(num_shards)
+        self.min_priorities = np.full(num_shards, float("inf"))
+        self.sizes = np.zeros(num_shards, dtype=np.int64)
+        # Number of records routed to each shard.
+        self.num_routed = np.zeros(num_shards, dtype=np.int64)
+        self.max_priority = 1.0
+
+    def route_records(self, num_records, shard=None):
+        """
+        Selects the shard to insert a batch of records into. Batches go to the shard that received
+        the fewest records so shards fill up evenly.
+
+        Args:
+            num_records (int): Number of records in the batch.
+            shard (Optional[any]): Shard the batch is already assigned to, e.g. the shard on the node of
+                the sample worker. Only updates the estimated statistics of this shard if given.
+
+        Returns:
+            any: Shard to insert the records into.
+        """
+        if shard is None:
+            index = int(np.argmin(self.num_routed))
+        else:
+            index = self.shard_indices[shard]
+        self.num_routed[index] += num_records
+
+        # New records enter with the max priority until the shard reports its actual statistics.
+        new_priority = self.max_priority ** self.alpha
+        new_records = min(num_records, self.shard_capacity)
+        free_records = min(new_records, self.shard_capacity - self.sizes[index])
+        self.priority_sums[index] += free_records * new_priority
+        self.sizes[index] += free_records
+
+        # Records beyond the free slots evict old records, which are assumed to hold the shard's mean priority.
+        evicted_records = new_records - free_records
+        if evicted_records > 0:
+            mean_priority = self.priority_sums[index] / self.sizes[index]
+            self.priority_sums[index] += evicted_records * (new_priority - mean_priority)
+        self.min_priorities[index] = min(self.min_priorities[index], new_priority)
+        return self.shards[index]
+
+    def sample_shard(self):
+        """
+        Samples a shard proportionally to its priority mass, or uniformly while no shard holds records.
+
+        Returns:
+            any: Shard to sample a batch from.
+        """
+        total = np.sum(self.priority_sums)
+        if total <= 0.0:
+            return self.shards[np.random.randint(len(self.shards))]
+        return self.shards[np.random.choice(len(self.shards), p=self.priority_sums / total)]
+
+    def update_shard_stats(self, shard, stats):
+        """
+        Updates the statistics of a shard.
+
+        Args:
+            shard (any): Shard that reported the statistics.
+            stats (dict): Priority statistics as returned by `ApexMemory.get_priority_stats`.
+        """
+        index = self.shard_indices[shard]
+        self.priority_sums[index] = stats["sum"]
+        self.min_priorities[index] = stats["min"]
+        self.sizes[index] = stats["size"]
+        self.max_priority = max(self.max_priority, stats["max"])
+
+    def get_global_stats(self):
+        """
+        Returns:
+            dict: Global priority sum, min-priority, max-priority and size over all shards.
+        """
+        return dict(
+            sum=float(np.sum(self.priority_sums)),
+            min=float(np.min(self.min_priorities)),
+            max=self.max_priority,
+            size=int(np.sum(self.sizes))
+        )
@@ -0,0 +1,219 @@
+# Copyright 2018 The RLgraph authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import struct
+
+import numpy as np
+
+from rlgraph.utils.rlgraph_errors import RLGraphError
+from rlgraph.utils.specifiable import Specifiable
+from rlgraph.execution.ray.ray_util import ray_compress, ray_decompress
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class Codec(Specifiable):
+    """
+    Compresses numpy arrays to raw bytes and back, e.g. to move states from sample workers to replay memories.
+
+    Arrays are serialized as a small header (dtype and shape) followed by the array buffer, so no
+    serialization framework is needed. Single arrays and whole chunks (leading batch rank) are supported:
+    compressing a chunk in one block lets the compressor exploit redundancy across frames.
+    """
+    def compress(self, array):
+        """
+        Compresses a single array.
+
+        Args:
+            array (ndarray): Array to compress.
+
+        Returns:
+            bytes: Compressed array.
+        """
+        return self._compress_bytes(self._serialize(np.asarray(array)))
+
+    def decompress(self, data):
+        """
+        Decompresses a single array. Values which are not bytes (i.e. were never compressed) are
+        returned as they are.
+
+        Args:
+            data (Union[bytes, any]): Compressed array.
+
+        Returns:
+            ndarray: Decompressed array.
+        """
+        if isinstance(data, bytes):
+            return self._deserialize(self._decompress_bytes(data))
+        return data
+
+    def compress_batch(self, arrays, chunked=False):
+        """
+        Compresses a batch of arrays.
+
+        Args:
+            arrays (Union[ndarray, list]): Arrays with a leading batch rank or list of arrays.
+            chunked (bool): If True, compresses the entire batch as a single block, otherwise compresses each
+                item separately so items can be decompressed individually.
+
+        Returns:
+            Union[bytes, ndarray]: A single block if chunked, else an object array of compressed items.
+        """
+        if chunked:
+            return self.compress(np.asarray(arrays))
+        compressed = np.empty(len(arrays), dtype=object)
+        for i, array in enumerate(arrays):
+            compressed[i] = self.compress(array)
+        return compressed
+
+    def decompress_batch(self, data):
+        """
+        Decompresses the output of `compress_batch`.
+
+        Args:
+            data (Union[bytes, ndarray]): A single compressed block or an array of compressed items.
+
+        Returns:
+            ndarray: Batch of decompressed arrays.
+        """
+        if isinstance(data, bytes):
+            return self.decompress(data)
+        return np.array([self.decompress(item) for item in data])
+
+    def get_max_compressed_size(self, array):
+        """
+        Returns the maximum size of a compressed array of the shape and dtype of the given one, e.g. to
+        size fixed-width storage of compressed values.
+
+        Args:
+            array (ndarray): Uncompressed example array.
+
+        Returns:
+            int: Maximum length of `compress(array)` for any array content.
+        """
+        return self._get_max_compressed_bytes(len(self._serialize(np.asarray(array))))
+
+    def _compress_bytes(self, data):
+        raise NotImplementedError
+
+    def _decompress_bytes(self, data):
+        raise NotImplementedError
+
+    def _get_max_compressed_bytes(self, num_bytes):
+        raise RLGraphError("ERROR: {} has no bound on the size of compressed values.".format(
+            type(self).__name__))
+
+    @staticmethod
+    def _serialize(array):
+        header = json.dumps([array.dtype.str, array.shape]).encode("utf-8")
+        return struct.pack("<I", len(header)) + header + np.ascontiguousarray(array).tobytes()
+
+    @staticmethod
+    def _deserialize(data):
+        header_len = struct.unpack_from("<I", data)[0]
+        dtype, shape = json.loads(data[4:4 + header_len].decode("utf-8"))
+        return np.frombuffer(data, dtype=np.dtype(dtype), offset=4 + header_len).reshape(shape)
+
+
+class NoCompressionCodec(Codec):
+    """
+    Serializes arrays without compression, e.g. for fast networks or incompressible observations.
+    """
+    def _compress_bytes(self, data):
+        return data
+
+    def _decompress_bytes(self, data):
+        return data
+
+    def _get_max_compressed_bytes(self, num_bytes):
+        return num_bytes
+
+
+class LZ4Codec(Codec):
+    """
+    LZ4 frame compression of raw array bytes.
+    """
+    def __init__(self, compression_level=0):
+        """
+        Args:
+            compression_level (int): LZ4 compression level, 0 is the fast default mode.
+        """
+        super(LZ4Codec, self).__init__()
+        if lz4 is None:
+            raise RLGraphError("ERROR: LZ4Codec requires the lz4 package. Install via `pip install lz4`.")
+        self.compression_level = compression_level
+
+    def _compress_bytes(self, data):
+        return lz4.frame.compress(data, compression_level=self.compression_level)
+
+    def _decompress_bytes(self, data):
+        return lz4.frame.decompress(data)
+
+    def _get_max_compressed_bytes(self, num_bytes):
+        # LZ4 block bound, plus frame header, end mark and checksum and a header per 64KB block.
+        return num_bytes + num_bytes // 255 + 16 + 32 + 4 * (num_bytes // 65536 + 1)
+
+
+class ZstdCodec(Codec):
+    """
+    Zstandard compression of raw array bytes. Usually compresses better than LZ4 at a higher CPU cost.
+    """
+    def __init__(self, compression_level=1):
+        """
+        Args:
+            compression_level (int): Zstandard compression level.
+        """
+        super(ZstdCodec, self).__init__()
+        if zstandard is None:
+            raise RLGraphError("ERROR: ZstdCodec requires the zstandard package. Install via "
+                               "`pip install zstandard`.")
+        self.compression_level = compression_level
+        self.compressor = zstandard.ZstdCompressor(level=compression_level)
+        self.decompressor = zstandard.ZstdDecompressor()
+
+    def _compress_bytes(self, data):
+        return self.compressor.compress(data)
+
+    def _decompress_bytes(self, data):
+        return self.decompressor.decompress(data)
+
+    def _get_max_compressed_bytes(self, num_bytes):
+        # ZSTD_COMPRESSBOUND, plus the frame header.
+        small_input_margin = ((128 << 10) - num_bytes) >> 11 if num_bytes < (128 << 10) else 0
+        return num_bytes + (num_bytes >> 8) + small_input_margin + 18
+
+
+class ArrowLZ4Base64Codec(Codec):
+    """
+    Legacy codec of `ray_compress`/`ray_decompress`: pyarrow serialization, LZ4 and base64 encoding.
+    """
+    def compress(self, array):
+        return ray_compress(array)
+
+    def decompress(self, data):
+        return ray_decompress(data)
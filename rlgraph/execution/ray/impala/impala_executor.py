@@ -0,0 +1,323 @@
+# Copyright 2018 The RLgraph authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from collections import deque
+from copy import deepcopy
+from threading import Lock, Thread
+import time
+
+from six.moves import queue
+
+from rlgraph import get_distributed_backend
+from rlgraph.agents.impala_agent import IMPALAAgent
+from rlgraph.execution.ray.impala.ray_impala_actor import RayIMPALAActor
+from rlgraph.execution.ray.ray_executor import RayExecutor
+from rlgraph.execution.ray.ray_util import RayTaskPool
+from rlgraph.execution.ray.weight_sync import WeightPublisher
+
+if get_distributed_backend() == "ray":
+    import ray
+
+
+class IMPALAExecutor(RayExecutor):
+    """
+    Runs IMPALA on a Ray cluster instead of a static distributed TF cluster, as described in:
+
+    https://arxiv.org/abs/1802.01561
+
+    Remote actors step their environments with the behaviour policy and return fixed-length trajectories. The
+    driver puts them on a shared trajectory queue, from which loader threads insert them into the learner's
+    FIFOQueue. A learner thread keeps updating from batches of trajectories. New policy weights are published
+    to the actors asynchronously, so the actors' policies lag behind the learner's, which V-trace corrects for.
+    """
+    def __init__(self, environment_spec, agent_config):
+        """
+        Args:
+            environment_spec (dict): Environment spec. Each actor in the cluster will instantiate
+                an environment using this spec.
+            agent_config (dict): Config dict containing IMPALA agent and execution specs.
+        """
+        ray_spec = agent_config["execution_spec"].pop("ray_spec")
+        self.worker_spec = ray_spec.pop("worker_spec")
+        super(IMPALAExecutor, self).__init__(executor_spec=ray_spec.pop("executor_spec"),
+                                             environment_spec=environment_spec,
+                                             worker_spec=self.worker_spec)
+
+        # Must specify an agent type.
+        assert "type" in agent_config
+        self.agent_config = agent_config
+
+        # The learner's FIFOQueue must be able to hold a full batch of trajectories.
+        batch_size = self.agent_config["update_spec"]["batch_size"]
+        fifo_queue_spec = self.agent_config.get("fifo_queue_spec") or dict()
+        fifo_queue_spec["capacity"] = fifo_queue_spec.get("capacity", 2 * batch_size)
+        assert fifo_queue_spec["capacity"] >= batch_size, \
+            "ERROR: FIFOQueue capacity ({}) must be at least the update batch size ({}).".format(
+                fifo_queue_spec["capacity"], batch_size)
+        self.agent_config["fifo_queue_spec"] = fifo_queue_spec
+
+        # How many steps an actor samples between weight syncs.
+        self.weight_sync_steps = self.executor_spec["weight_sync_steps"]
+        self.weight_syncs_executed = 0
+        self.steps_since_weights_synced = dict()
+        self.weight_publisher = WeightPublisher()
+
+        # These are the tasks actually interacting with the environment.
+        self.env_sample_tasks = RayTaskPool()
+        # Max time in seconds the driver loop waits on pending tasks per iteration.
+        self.ray_wait_timeout = self.executor_spec.get("ray_wait_timeout", 0.01)
+        # Max time in seconds the driver loop waits for space on the full trajectory queue per iteration.
+        self.trajectory_put_timeout = self.executor_spec.get("trajectory_put_timeout", 0.01)
+        # (actor, trajectory) tuples waiting for space on the trajectory queue, in order of arrival.
+        self.undelivered_trajectories = deque()
+        # Actor -> number of its undelivered trajectories. Actors are not rescheduled until all are delivered.
+        self.num_undelivered = dict()
+
+        assert not ray_spec, "ERROR: ray_spec still contains items: {}".format(ray_spec)
+        self.logger.info("Setting up execution for IMPALA executor.")
+        self.setup_execution()
+
+    def setup_execution(self):
+        # Start Ray cluster and connect to it.
+        self.ray_init()
+
+        # Extract states and actions space.
+        environment = RayExecutor.build_env_from_config(self.environment_spec)
+        self.agent_config["state_space"] = environment.state_space
+        self.agent_config["action_space"] = environment.action_space
+        environment.terminate()
+
+        # The learner runs in the driver, but does not step environments.
+        learner_config = deepcopy(self.agent_config)
+        learner_config.pop("type")
+        learner_config.pop("environment_spec", None)
+        self.local_agent = IMPALAAgent(type="learner", **learner_config)
+
+        self.update_worker = IMPALAUpdateWorker(
+            agent=self.local_agent,
+            in_queue_size=self.executor_spec.get("trajectory_queue_size", 64),
+            num_loader_threads=self.executor_spec.get("num_learner_loader_threads", 1)
+        )
+
+        # Create remote actors for data collection.
+        self.num_sample_workers = self.executor_spec["num_sample_workers"]
+        self.logger.info("Initializing {} remote IMPALA actors.".format(self.num_sample_workers))
+        self.ray_env_sample_workers = self.create_remote_workers(
+            RayIMPALAActor, self.num_sample_workers, self.agent_config,
+            # *args
+            self.worker_spec, self.environment_spec, self.worker_frameskip
+        )
+        self.init_tasks()
+
+    def init_tasks(self):
+        # Start learner thread.
+        self.update_worker.start()
+
+        self.weight_publisher.publish(self.local_agent.get_policy_weights())
+        for ray_worker in self.ray_env_sample_workers:
+            self.weight_publisher.sync(ray_worker)
+            self.steps_since_weights_synced[ray_worker] = 0
+            self._schedule_sample_tasks(ray_worker)
+
+    def _execute_step(self):
+        """
+        Executes one iteration of the driver loop:
+
+        - Wait on pending actor tasks and fetch the trajectories of completed ones.
+        - Publish new learner weights and send them to actors without waiting for them to be set.
+        - Put trajectories on the learner's trajectory queue. While the queue is full, trajectories are held
+          back and their actors are not rescheduled, which throttles the actors to the learner's pace.
+        - Reschedule sampling on the actors whose trajectories were all delivered.
+        """
+        env_steps = 0
+        updates_before = self.update_worker.updates
+
+        pending = self.env_sample_tasks.get_pending()
+        ready = []
+        if pending:
+            ready, _ = ray.wait(pending, num_returns=len(pending), timeout=self.ray_wait_timeout)
+        completed_sample_tasks = self.env_sample_tasks.pop_ready(ready)
+
+        # Fetch trajectories and step counts of all completed tasks in one call.
+        results = []
+        if completed_sample_tasks:
+            results = ray.get([obj_id for _, obj_ids in completed_sample_tasks for obj_id in obj_ids])
+        fetch_end = time.monotonic()
+
+        for i, (ray_worker, _) in enumerate(completed_sample_tasks):
+            trajectories, sample_steps = results[2 * i], results[2 * i + 1]
+            self.worker_scheduler.task_completed(ray_worker, sample_steps, fetch_end)
+            for trajectory in trajectories:
+                self.undelivered_trajectories.append((ray_worker, trajectory))
+            if trajectories:
+                self.num_undelivered[ray_worker] = self.num_undelivered.get(ray_worker, 0) + len(trajectories)
+            env_steps += sample_steps
+
+            self.steps_since_weights_synced[ray_worker] += sample_steps
+            if self.steps_since_weights_synced[ray_worker] >= self.weight_sync_steps:
+                # Publish a new weights version only if the learner updated since the last one.
+                if self.update_worker.update_done:
+                    self.update_worker.update_done = False
+                    self.weight_publisher.publish(self.local_agent.get_policy_weights())
+                if self.weight_publisher.sync(ray_worker):
+                    self.weight_syncs_executed += 1
+                self.steps_since_weights_synced[ray_worker] = 0
+
+            if ray_worker not in self.num_undelivered:
+                self._schedule_sample_tasks(ray_worker)
+
+        self._deliver_trajectories()
+        return env_steps, self.update_worker.updates - updates_before
+
+    def _deliver_trajectories(self):
+        """
+        Puts undelivered trajectories on the learner's trajectory queue in order of arrival until the queue
+        is full, and reschedules actors once all their trajectories are delivered.
+        """
+        while self.undelivered_trajectories:
+            ray_worker, trajectory = self.undelivered_trajectories[0]
+            try:
+                self.update_worker.input_queue.put(trajectory, timeout=self.trajectory_put_timeout)
+            except queue.Full:
+                break
+            self.undelivered_trajectories.popleft()
+            # Replaced actors are no longer tracked.
+            if ray_worker in self.num_undelivered:
+                self.num_undelivered[ray_worker] -= 1
+                if self.num_undelivered[ray_worker] == 0:
+                    del self.num_undelivered[ray_worker]
+                    self._schedule_sample_tasks(ray_worker)
+
+    def get_live_metrics(self):
+        learner_metrics = self.update_worker.get_metrics()
+        return dict(
+            learner_updates=learner_metrics["updates"],
+            learner_trajectories_inserted=learner_metrics["trajectories_inserted"],
+            learner_input_queue_depth=learner_metrics["input_queue_depth"],
+            undelivered_trajectories=len(self.undelivered_trajectories),
+            pending_sample_tasks=len(self.env_sample_tasks.get_pending()),
+            weights_version=self.weight_publisher.version
+        )
+
+    def get_learner_metrics(self):
+        """
+        Returns:
+            dict: Learner thread metrics, see `IMPALAUpdateWorker.get_metrics`.
+        """
+        return self.update_worker.get_metrics()
+
+    def replace_worker(self, worker, num_environments=None):
+        # Tasks pending on the old actor are dropped, the new one receives the latest weights.
+        self.env_sample_tasks.remove_worker_tasks(worker)
+        self.weight_publisher.remove_worker(worker)
+        del self.steps_since_weights_synced[worker]
+        # Trajectories already collected from the old actor are still delivered.
+        self.num_undelivered.pop(worker, None)
+        new_worker = super(IMPALAExecutor, self).replace_worker(worker, num_environments)
+
+        self.weight_publisher.sync(new_worker)
+        self.steps_since_weights_synced[new_worker] = 0
+        self._schedule_sample_tasks(new_worker)
+        return new_worker
+
+    def _schedule_sample_tasks(self, ray_worker):
+        """
+        Schedules trajectory collection tasks on an actor until its current task depth is reached.
+
+        Args:
+            ray_worker (RayIMPALAActor): Remote actor to sample on.
+        """
+        for _ in range(self.worker_scheduler.get_num_tasks_to_schedule(ray_worker)):
+            self.env_sample_tasks.add_task(ray_worker, ray_worker.execute_and_get_trajectories.remote())
+            self.worker_scheduler.task_scheduled(ray_worker)
+
+
+class IMPALAUpdateWorker(Thread):
+    """
+    Runs the IMPALA learner separate from the driver loop. Loader threads move trajectories from the shared
+    trajectory queue into the learner's FIFOQueue, while this thread updates from batches dequeued from it.
+    """
+    def __init__(self, agent, in_queue_size, num_loader_threads=1):
+        """
+        Args:
+            agent (IMPALAAgent): Learner agent.
+            in_queue_size (int): Max number of trajectories waiting to be inserted into the FIFOQueue.
+            num_loader_threads (int): Number of threads inserting trajectories.
+        """
+        super(IMPALAUpdateWorker, self).__init__()
+        assert num_loader_threads >= 1, "ERROR: IMPALA learner requires at least one loader thread."
+
+        self.agent = agent
+        self.input_queue = queue.Queue(maxsize=in_queue_size)
+        self.loader_threads = []
+        for _ in range(num_loader_threads):
+            loader_thread = Thread(target=self._load)
+            loader_thread.daemon = True
+            self.loader_threads.append(loader_thread)
+
+        # Terminate when host process terminates.
+        self.daemon = True
+
+        # Flag for main thread.
+        self.update_done = False
+
+        # Learner metrics.
+        self.metrics_lock = Lock()
+        self.updates = 0
+        self.update_time = 0.0
+        self.trajectories_inserted = 0
+        self.last_loss = None
+
+    def run(self):
+        for loader_thread in self.loader_threads:
+            loader_thread.start()
+        while True:
+            self.step()
+
+    def step(self):
+        # Blocks inside the graph until a batch of trajectories is in the FIFOQueue.
+        update_start = time.monotonic()
+        self.last_loss = self.agent.update()[1]
+        self.update_time += time.monotonic() - update_start
+        self.updates += 1
+        self.update_done = True
+
+    def get_metrics(self):
+        """
+        Returns:
+            dict: Number of updates, time spent in (and waiting on) updates, number of trajectories inserted into
+                the FIFOQueue, the last loss and the depth of the trajectory queue.
+        """
+        with self.metrics_lock:
+            trajectories_inserted = self.trajectories_inserted
+        return dict(
+            updates=self.updates,
+            update_time=self.update_time,
+            mean_update_time=self.update_time / self.updates if self.updates > 0 else 0.0,
+            trajectories_inserted=trajectories_inserted,
+            last_loss=self.last_loss,
+            input_queue_depth=self.input_queue.qsize()
+        )
+
+    def _load(self):
+        while True:
+            trajectory = self.input_queue.get()
+            self.agent.insert_records(trajectory)
+            with self.metrics_lock:
+                self.trajectories_inserted += 1
@@ -0,0 +1,181 @@
+# Copyright 2018 The RLgraph authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from collections import deque
+from copy import deepcopy
+import time
+
+import numpy as np
+from six.moves import xrange as range_
+
+from rlgraph import get_distributed_backend
+from rlgraph.agents.impala_agent import IMPALAAgent
+from rlgraph.execution.metrics import RingBuffer
+from rlgraph.execution.ray.ray_actor import RayActor
+
+if get_distributed_backend() == "ray":
+    import ray
+
+
+class RayIMPALAActor(RayActor):
+    """
+    Ray actor running an IMPALA actor agent. The agent steps its environment inside the graph and returns
+    fixed-length trajectories including the behaviour policy's action probabilities, which are sent to
+    the learner.
+    """
+    def __init__(self, agent_config, worker_spec, env_spec, frameskip=1):
+        """
+        Creates the actor agent, the graph is built in `init_agent`.
+
+        Args:
+            agent_config (dict): IMPALA agent configuration dict.
+            worker_spec (dict): Worker parameters.
+            env_spec (dict): Environment config for environment to run.
+            frameskip (int): Frameskip of the worker, only used for reporting.
+        """
+        worker_spec = deepcopy(worker_spec)
+        self.env_frame_skip = env_spec.get("frameskip", 1)
+        self.worker_frameskip = frameskip
+        # Number of trajectories to collect per sample task.
+        self.num_trajectories = worker_spec.pop("num_trajectories_per_task", 1)
+        episode_history_size = worker_spec.pop("episode_history_size", 1000)
+        metrics_window_size = worker_spec.pop("metrics_window_size", 100)
+
+        agent_config = deepcopy(agent_config)
+        agent_config.pop("type", None)
+        agent_config["environment_spec"] = env_spec
+        self.agent = IMPALAAgent(type="actor", auto_build=False, **agent_config)
+        self.worker_sample_size = self.agent.worker_sample_size
+        self.weights_version = 0
+
+        self.finished_episode_rewards = deque(maxlen=episode_history_size)
+        self.finished_episode_timesteps = deque(maxlen=episode_history_size)
+        self.recent_episode_rewards = RingBuffer(metrics_window_size)
+        self.recent_sample_throughputs = RingBuffer(metrics_window_size)
+        self.episode_reward = 0.0
+        self.episode_timesteps = 0
+
+        self.total_worker_steps = 0
+        self.episodes_executed = 0
+        self.total_sample_time = 0.0
+        self.total_sample_steps = 0
+
+    @classmethod
+    def as_remote(cls, num_cpus=None, num_gpus=None):
+        assert get_distributed_backend() == "ray"
+        return ray.remote(num_cpus=num_cpus, num_gpus=num_gpus)(cls)
+
+    def init_agent(self):
+        """
+        Builds the agent and resets its environment. This is done as a separate task because meta graph
+        generation can take long.
+        """
+        self.agent.build()
+        self.agent.call_api_method("reset")
+        return True
+
+    def execute_and_get_trajectories(self):
+        """
+        Collects `num_trajectories_per_task` trajectories of `worker_sample_size` steps each.
+
+        Returns:
+            tuple:
+                - list: Trajectory records, see `IMPALAAgent.perform_n_steps`.
+                - int: Number of env steps taken.
+        """
+        start = time.perf_counter()
+        trajectories = []
+        for _ in range_(self.num_trajectories):
+            trajectory = self.agent.perform_n_steps()
+            trajectories.append(trajectory)
+            # The first record of a trajectory is the last of the previous one.
+            self._update_episode_stats(trajectory["terminals"][1:], trajectory["states"]["previous_reward"][1:])
+
+        num_steps = self.num_trajectories * self.worker_sample_size
+        sample_time = time.perf_counter() - start
+        self.total_worker_steps += num_steps
+        self.total_sample_time += sample_time
+        self.total_sample_steps += num_steps
+        self.recent_sample_throughputs.append(num_steps / (sample_time or 1e-10))
+        return trajectories, num_steps
+
+    if get_distributed_backend() == "ray":
+        execute_and_get_trajectories = ray.method(num_return_vals=2)(execute_and_get_trajectories)
+
+    def _update_episode_stats(self, terminals, rewards):
+        for terminal, reward in zip(np.reshape(terminals, (-1,)), np.reshape(rewards, (-1,))):
+            self.episode_reward += float(reward)
+            self.episode_timesteps += 1
+            if terminal:
+                self.finished_episode_rewards.append(self.episode_reward)
+                self.finished_episode_timesteps.append(self.episode_timesteps)
+                self.recent_episode_rewards.append(self.episode_reward)
+                self.episodes_executed += 1
+                self.episode_reward = 0.0
+                self.episode_timesteps = 0
+
+    def set_flat_policy_weights(self, flat_weights):
+        """
+        Sets policy weights published by a `WeightPublisher`, unless this actor already holds
+        the same or a newer version.
+
+        Args:
+            flat_weights (FlatWeights): Flattened, versioned weights.
+        """
+        if flat_weights.version > self.weights_version:
+            self.agent.set_policy_weights(flat_weights.to_weights())
+            self.weights_version = flat_weights.version
+
+    def get_workload_statistics(self):
+        """
+        Returns performance results for this actor, see `RayWorker.get_workload_statistics`.
+
+        Returns:
+            dict: Performance metrics.
+        """
+        sample_time = self.total_sample_time or 1e-10
+        rewards = list(self.finished_episode_rewards)
+        return dict(
+            episode_timesteps=[list(self.finished_episode_timesteps)],
+            episode_rewards=[rewards],
+            min_episode_reward=np.min(rewards) if rewards else None,
+            max_episode_reward=np.max(rewards) if rewards else None,
+            mean_episode_reward=np.mean(rewards) if rewards else None,
+            final_episode_reward=rewards[-1] if rewards else None,
+            episodes_executed=self.episodes_executed,
+            worker_steps=self.total_worker_steps,
+            mean_worker_ops_per_second=self.total_sample_steps / sample_time,
+            mean_worker_env_frames_per_second=self.total_sample_steps * self.worker_frameskip *
+            self.env_frame_skip / sample_time
+        )
+
+    def get_metrics_snapshot(self):
+        """
+        Returns:
+            dict: Live metrics, see `RayWorker.get_metrics_snapshot`.
+        """
+        return dict(
+            worker_steps=self.total_worker_steps,
+            episodes_executed=self.episodes_executed,
+            recent_ops_per_second=self.recent_sample_throughputs.mean(),
+            mean_worker_ops_per_second=self.total_sample_steps / (self.total_sample_time or 1e-10),
+            recent_mean_episode_reward=self.recent_episode_rewards.mean(),
+            last_episode_reward=self.recent_episode_rewards.last(),
+            weights_version=self.weights_version
+        )
@@ -0,0 +1,138 @@
+# Copyright 2018 The RLgraph authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from collections import OrderedDict
+
+from rlgraph import get_distributed_backend
+
+if get_distributed_backend() == "ray":
+    import ray
+
+
+class ActorPlacement(object):
+    """
+    Packs replay shards onto the nodes running sample workers and assigns each worker a shard on its own
+    node, so sample batches are inserted into replay without crossing the network.
+
+    Every node gets one shard per `workers_per_replay_shard` workers on it. Workers on nodes without a shard
+    (e.g. replacements started on a new node) are assigned to the shard with the fewest workers.
+    """
+    def __init__(self, workers_per_replay_shard=4):
+        """
+        Args:
+            workers_per_replay_shard (int): Max number of sample workers writing to one replay shard.
+        """
+        assert workers_per_replay_shard >= 1, "ERROR: Workers per replay shard must be >= 1, is {}.".format(
+            workers_per_replay_shard)
+        self.workers_per_replay_shard = workers_per_replay_shard
+
+        # Shard -> host, in creation order.
+        self.shard_hosts = OrderedDict()
+        self.shard_workers = dict()
+        self.worker_hosts = dict()
+        self.assignments = dict()
+        # Worker -> object id of its pending host lookup.
+        self.pending_hosts = dict()
+
+    def get_num_shards_per_host(self, worker_hosts):
+        """
+        Args:
+            worker_hosts (list): Host of each sample worker.
+
+        Returns:
+            OrderedDict: Host -> number of replay shards to place on the host.
+        """
+        num_workers = OrderedDict()
+        for host in worker_hosts:
+            num_workers[host] = num_workers.get(host, 0) + 1
+        return OrderedDict((host, -(-n // self.workers_per_replay_shard)) for host, n in num_workers.items())
+
+    def add_shard(self, shard, host):
+        self.shard_hosts[shard] = host
+        self.shard_workers[shard] = set()
+
+    def add_worker(self, worker, host):
+        """
+        Assigns a worker to the shard with the fewest workers on its host, or to the shard with the
+        fewest workers overall if its host has no shard.
+
+        Args:
+            worker (any): Worker handle.
+            host (str): Host the worker runs on.
+
+        Returns:
+            any: The assigned shard.
+        """
+        assert self.shard_hosts, "ERROR: Shards must be added before assigning workers."
+        self.pending_hosts.pop(worker, None)
+        local_shards = [shard for shard, shard_host in self.shard_hosts.items() if shard_host == host]
+        candidates = local_shards or list(self.shard_hosts.keys())
+        shard = min(candidates, key=lambda candidate: len(self.shard_workers[candidate]))
+
+        self.worker_hosts[worker] = host
+        self.assignments[worker] = shard
+        self.shard_workers[shard].add(worker)
+        return shard
+
+    def add_worker_pending(self, worker, host_id):
+        """
+        Registers a worker whose host is not known yet, e.g. a replacement still building its agent. The worker
+        is assigned once the host lookup completed, without blocking on it.
+
+        Args:
+            worker (any): Worker handle.
+            host_id (ray.ObjectID): Pending result of the worker's `get_host` task.
+        """
+        self.pending_hosts[worker] = host_id
+
+    def remove_worker(self, worker):
+        self.pending_hosts.pop(worker, None)
+        self.worker_hosts.pop(worker, None)
+        shard = self.assignments.pop(worker, None)
+        if shard is not None:
+            self.shard_workers[shard].discard(worker)
+
+    def get_shard(self, worker):
+        """
+        Args:
+            worker (any): Worker handle.
+
+        Returns:
+            Union[any, None]: The shard assigned to the worker, or None if its host lookup is still pending.
+        """
+        if worker in self.pending_hosts:
+            host_id = self.pending_hosts[worker]
+            ready, _ = ray.wait([host_id], timeout=0)
+            if not ready:
+                return None
+            self.add_worker(worker, ray.get(host_id))
+        return self.assignments.get(worker)
+
+    def get_metrics(self):
+        """
+        Returns:
+            dict: Number of workers per shard index and number of workers assigned to a shard on their host.
+        """
+        return dict(
+            workers_per_shard=[len(workers) for workers in self.shard_workers.values()],
+            num_local_assignments=sum(
+                1 for worker, shard in self.assignments.items() if self.shard_hosts[shard] == self.worker_hosts[worker]
+            ),
+            num_pending=len(self.pending_hosts)
+        )
@@ -19,7 +19,10 @@ from __future__ import print_function
 
 from copy import deepcopy
 
-from rlgraph.execution.ray.ray_util import worker_exploration
+from rlgraph.execution.metrics import MetricsSink
+from rlgraph.execution.ray.ray_util import worker_exploration, RayMetricsCollector
+from rlgraph.execution.ray.worker_scheduler import WorkerScheduler
+import six
 from six.moves import xrange as range_
 import logging
 import numpy as np
@@ -67,6 +70,33 @@ class RayExecutor(object):
 
         # Map worker objects to host ids.
         self.worker_ids = dict()
+        # Map worker objects to the (class, agent config, worker spec, args) they were created with.
+        self.worker_args = dict()
+        self.num_workers_created = 0
+
+        # Tracks worker throughput, adapts per-worker task depth and identifies stragglers.
+        self.worker_scheduler = WorkerScheduler(
+            max_task_depth=executor_spec.get("env_interaction_task_depth", 1),
+            **executor_spec.get("worker_scheduling_spec", {})
+        )
+        self.iteration_scheduling_metrics = None
+        # Replaced workers must be scheduled by the executor's `replace_worker`.
+        assert self.worker_scheduler.replace_worker_fraction == 0 or \
+            six.get_unbound_function(type(self).replace_worker) is not \
+            six.get_unbound_function(RayExecutor.replace_worker), \
+            "ERROR: {} does not schedule tasks on replaced workers, `replace_worker_fraction` must be 0 but is " \
+            "{}.".format(type(self).__name__, self.worker_scheduler.replace_worker_fraction)
+
+        # Live metrics: Worker snapshots are requested periodically and collected without blocking, each reporting
+        # iteration's metrics are written to the configured sinks.
+        metrics_spec = executor_spec.get("metrics_spec", {})
+        self.worker_metrics_collector = RayMetricsCollector(interval=metrics_spec.get("worker_metrics_interval", 5.0))
+        # Sinks are opened for the duration of each workload.
+        self.metrics_sink_specs = metrics_spec.get("sinks", [])
+        self.metrics_sinks = []
+        # Latest worker snapshots, polled once per step of the workload.
+        self.worker_snapshots = dict()
+        self.live_metrics = None
 
     def ray_init(self):
         """
@@ -111,7 +141,8 @@ class RayExecutor(object):
                 exploration_val = worker_exploration(i, num_actors)
                 worker_spec["ray_exploration"] = exploration_val
             worker = cls_as_remote(deepcopy(agent_config), worker_spec, *args)
-            self.worker_ids[worker] = "worker_{}".format(i)
+            self._register_worker(worker, "worker_{}".format(self.num_workers_created),
+                                  (cls, agent_config, deepcopy(worker_spec), args))
             workers.append(worker)
             build_result = worker.init_agent.remote()
             init_tasks.append(build_result)
@@ -125,6 +156,63 @@ class RayExecutor(object):
 
         return workers
 
+    def replace_worker(self, worker, num_environments=None):
+        """
+        Replaces a sample worker, e.g. a straggler, with a new remote worker created from the same arguments. The
+        old worker is terminated, tasks still pending on it are lost. Does not wait for the new worker's agent to
+        be built, its init task executes before any task scheduled on it afterwards.
+
+        Subclasses replacing workers must override this to schedule tasks on the new worker.
+
+        Args:
+            worker (RayWorker): Remote worker to replace.
+            num_environments (Optional[int]): Number of environments the new worker runs. Defaults to the number
+                of the old worker.
+
+        Returns:
+            RayWorker: The new remote worker.
+        """
+        cls, agent_config, worker_spec, args = self.worker_args[worker]
+        if num_environments is not None:
+            worker_spec = dict(worker_spec, num_worker_environments=num_environments)
+        cls_as_remote = cls.as_remote(num_cpus=self.num_cpus_per_worker, num_gpus=self.num_gpus_per_worker).remote
+        new_worker = cls_as_remote(deepcopy(agent_config), worker_spec, *args)
+        new_worker.init_agent.remote()
+
+        name = self.worker_ids[worker]
+        self.logger.warning("Replacing worker {} running {} environments with a worker running {}.".format(
+            name, self.worker_scheduler.num_environments.get(worker), worker_spec.get("num_worker_environments", 1)
+        ))
+        self._unregister_worker(worker)
+        self.worker_metrics_collector.remove_worker(worker)
+        worker.__ray_terminate__.remote()
+        self._register_worker(new_worker, name, (cls, agent_config, worker_spec, args))
+        self.ray_env_sample_workers[self.ray_env_sample_workers.index(worker)] = new_worker
+        return new_worker
+
+    def update_worker_scheduling(self):
+        """
+        Evaluates worker throughputs, adapts task depths and replaces stragglers. Called once per
+        reporting iteration of `execute_workload`.
+
+        Returns:
+            dict: Scheduling metrics, see `WorkerScheduler.get_metrics`.
+        """
+        for worker, num_environments in self.worker_scheduler.update():
+            self.replace_worker(worker, num_environments)
+        return self.worker_scheduler.get_metrics()
+
+    def _register_worker(self, worker, name, worker_args):
+        self.worker_ids[worker] = name
+        self.worker_args[worker] = worker_args
+        self.worker_scheduler.add_worker(worker, name, worker_args[2].get("num_worker_environments", 1))
+        self.num_workers_created += 1
+
+    def _unregister_worker(self, worker):
+        del self.worker_ids[worker]
+        del self.worker_args[worker]
+        self.worker_scheduler.remove_worker(worker)
+
     def setup_execution(self):
         """
         Creates and initializes all remote agents on the Ray cluster. Does not
@@ -151,6 +239,7 @@ class RayExecutor(object):
         self.sample_iteration_throughputs = list()
         self.update_iteration_throughputs = list()
         self.iteration_times = list()
+        self.iteration_scheduling_metrics = list()
 
         # Assume time step based initially.
         num_timesteps = workload["num_timesteps"]
@@ -163,31 +252,60 @@ class RayExecutor(object):
         iteration_update_steps = list()
 
         start = time.monotonic()
-        # Call _execute_step as many times as required.
-        while timesteps_executed < num_timesteps:
-            iteration_step = 0
-            iteration_updates = 0
-            iteration_start = time.monotonic()
-
-            # Record sampling and learning throughput every interval.
-            while (iteration_step < report_interval) or\
-                    time.monotonic() - iteration_start < report_interval_min_seconds:
-                worker_steps_executed, update_steps = self._execute_step()
-                iteration_step += worker_steps_executed
-                iteration_updates += update_steps
-
-            iteration_end = time.monotonic() - iteration_start
-            timesteps_executed += iteration_step
-
-            # Append raw values, compute stats after experiment is done.
-            self.iteration_times.append(iteration_end)
-            iteration_update_steps.append(iteration_updates)
-            iteration_time_steps.append(iteration_step)
-
-            self.logger.info("Executed {} Ray worker steps, {} update steps, ({} of {} ({} %))".format(
-                iteration_step, iteration_updates, timesteps_executed,
-                num_timesteps, (100 * timesteps_executed / num_timesteps)
-            ))
+        self.metrics_sinks = [MetricsSink.from_spec(sink_spec) for sink_spec in self.metrics_sink_specs]
+        try:
+            # Call _execute_step as many times as required.
+            while timesteps_executed < num_timesteps:
+                iteration_step = 0
+                iteration_updates = 0
+                iteration_start = time.monotonic()
+
+                # Record sampling and learning throughput every interval.
+                while (iteration_step < report_interval) or\
+                        time.monotonic() - iteration_start < report_interval_min_seconds:
+                    worker_steps_executed, update_steps = self._execute_step()
+                    self.worker_snapshots = self.poll_worker_metrics()
+                    iteration_step += worker_steps_executed
+                    iteration_updates += update_steps
+
+                iteration_end = time.monotonic() - iteration_start
+                timesteps_executed += iteration_step
+
+                # Append raw values, compute stats after experiment is done.
+                self.iteration_times.append(iteration_end)
+                iteration_update_steps.append(iteration_updates)
+                iteration_time_steps.append(iteration_step)
+
+                self.logger.info("Executed {} Ray worker steps, {} update steps, ({} of {} ({} %))".format(
+                    iteration_step, iteration_updates, timesteps_executed,
+                    num_timesteps, (100 * timesteps_executed / num_timesteps)
+                ))
+
+                scheduling_metrics = self.update_worker_scheduling()
+                self.iteration_scheduling_metrics.append(scheduling_metrics)
+                self.logger.info("Worker throughputs (steps/s): {}, task depths: {}, replacements: {}".format(
+                    {name: metrics["throughput"] for name, metrics in scheduling_metrics["workers"].items()},
+                    {name: metrics["task_depth"] for name, metrics in scheduling_metrics["workers"].items()},
+                    scheduling_metrics["num_replacements"]
+                ))
+
+                self.live_metrics = dict(
+                    time=time.time(),
+                    iteration=len(self.iteration_times),
+                    timesteps_executed=timesteps_executed,
+                    iteration_sample_throughput=iteration_step / iteration_end,
+                    iteration_update_throughput=iteration_updates / iteration_end,
+                    worker_task_depth_reductions=scheduling_metrics["num_depth_reductions"],
+                    worker_replacements=scheduling_metrics["num_replacements"]
+                )
+                self.live_metrics.update(self.get_live_metrics())
+                self.live_metrics.update(self.aggregate_worker_snapshots(self.worker_snapshots))
+                for sink in self.metrics_sinks:
+                    sink.write(self.live_metrics)
+        finally:
+            for sink in self.metrics_sinks:
+                sink.close()
+            self.metrics_sinks = []
 
         total_time = (time.monotonic() - start) or 1e-10
         self.logger.info("Time steps executed: {} ({} ops/s)".
@@ -229,7 +347,10 @@ class RayExecutor(object):
             max_worker_reward=worker_stats["max_reward"],
             min_worker_reward=worker_stats["min_reward"],
             # This is the mean final episode over all workers.
-            mean_final_reward=worker_stats["mean_final_reward"]
+            mean_final_reward=worker_stats["mean_final_reward"],
+            # Adaptive scheduling.
+            worker_task_depth_reductions=self.worker_scheduler.num_depth_reductions,
+            worker_replacements=self.worker_scheduler.num_replacements
         )
 
     def sample_metrics(self):
@@ -241,6 +362,62 @@ class RayExecutor(object):
     def get_iteration_times(self):
         return self.iteration_times
 
+    def get_live_metrics(self):
+        """
+        Returns executor specific live metrics (e.g. queue depths), added to the metrics record of
+        every reporting iteration.
+
+        Returns:
+            dict: Flat dict of metric name -> value.
+        """
+        return dict()
+
+    def poll_worker_metrics(self):
+        """
+        Returns the latest metrics snapshots of the sample workers without blocking on them.
+
+        Returns:
+            dict: Worker name -> snapshot, see `RayWorker.get_metrics_snapshot`.
+        """
+        snapshots = self.worker_metrics_collector.poll(self.ray_env_sample_workers)
+        return {self.worker_ids[worker]: snapshot for worker, snapshot in snapshots.items()
+                if worker in self.worker_ids}
+
+    @staticmethod
+    def aggregate_worker_snapshots(snapshots):
+        """
+        Aggregates worker snapshots into flat live metrics.
+
+        Args:
+            snapshots (dict): Worker name -> snapshot.
+
+        Returns:
+            dict: Aggregate worker metrics.
+        """
+        def collect(key):
+            return [snapshot[key] for snapshot in snapshots.values() if snapshot.get(key) is not None]
+
+        throughputs = collect("recent_ops_per_second")
+        rewards = collect("recent_mean_episode_reward")
+        return dict(
+            workers_reporting=len(snapshots),
+            worker_steps=sum(collect("worker_steps")),
+            worker_episodes=sum(collect("episodes_executed")),
+            mean_worker_op_throughput=float(np.mean(throughputs)) if throughputs else None,
+            min_worker_op_throughput=float(np.min(throughputs)) if throughputs else None,
+            max_worker_op_throughput=float(np.max(throughputs)) if throughputs else None,
+            mean_worker_reward=float(np.mean(rewards)) if rewards else None,
+            # Total time workers waited on environment resets.
+            worker_reset_stall_time=sum(collect("reset_stall_time"))
+        )
+
+    def get_iteration_scheduling_metrics(self):
+        """
+        Returns:
+            list: Worker scheduling metrics after each reporting iteration, see `WorkerScheduler.get_metrics`.
+        """
+        return self.iteration_scheduling_metrics
+
     def _execute_step(self):
         """
         Actual private implementer of each step of the workload executed.
@@ -313,9 +490,9 @@ class RayExecutor(object):
             list: List dicts with worker results (timesteps and rewards)
         """
         results = list()
-        for ray_worker in self.ray_env_sample_workers:
-            task = ray_worker.get_workload_statistics.remote()
-            metrics = ray.get(task)
+        all_metrics = ray.get([ray_worker.get_workload_statistics.remote() for ray_worker in
+                               self.ray_env_sample_workers])
+        for metrics in all_metrics:
             results.append(dict(
                 episode_rewards=metrics["episode_rewards"],
                 episode_timesteps=metrics["episode_timesteps"],
@@ -350,12 +527,11 @@ class RayExecutor(object):
         episodes_executed = list()
         steps_executed = 0
 
-        for ray_worker in self.ray_env_sample_workers:
-            self.logger.info("Retrieving workload statistics for worker: {}".format(
-                self.worker_ids[ray_worker])
-            )
-            task = ray_worker.get_workload_statistics.remote()
-            metrics = ray.get(task)
+        # Fetch the statistics of all workers with a single call.
+        self.logger.info("Retrieving workload statistics for {} workers.".format(len(self.ray_env_sample_workers)))
+        all_metrics = ray.get([ray_worker.get_workload_statistics.remote() for ray_worker in
+                               self.ray_env_sample_workers])
+        for ray_worker, metrics in zip(self.ray_env_sample_workers, all_metrics):
             if metrics["mean_episode_reward"] is not None:
                 min_rewards.append(metrics["min_episode_reward"])
                 max_rewards.append(metrics["max_episode_reward"])
@@ -19,6 +19,10 @@ from __future__ import print_function
 
 import os
 import base64
+import time
+
+import numpy as np
+
 from rlgraph import get_distributed_backend
 from rlgraph.utils.rlgraph_errors import RLGraphError
 
@@ -56,25 +60,176 @@ class RayTaskPool(object):
         self.ray_tasks[ray_object_id] = worker
         self.ray_objects[ray_object_id] = ray_object_ids
 
-    def get_completed(self):
+    def get_pending(self):
+        """
+        Returns:
+            list: Object ids identifying the pending tasks, i.e. the first object id of each task.
+        """
+        return list(self.ray_tasks)
+
+    def pop_ready(self, ready):
+        """
+        Removes tasks whose object ids were returned as ready by a `ray.wait` on `get_pending` ids,
+        e.g. a single wait over the pending tasks of several pools.
+
+        Args:
+            ready (Union[list, set]): Ready object ids, may contain ids of other pools.
+
+        Returns:
+            list: (worker, ray object ids) tuples of the completed tasks of this pool.
+        """
+        return [(self.ray_tasks.pop(obj_id), self.ray_objects.pop(obj_id))
+                for obj_id in ready if obj_id in self.ray_tasks]
+
+    def remove_worker_tasks(self, worker):
+        """
+        Removes all pending tasks of a worker, e.g. before terminating it.
+
+        Args:
+            worker (any): Worker whose tasks to remove.
+
+        Returns:
+            list: Ray object ids of the removed tasks.
+        """
+        obj_ids = [obj_id for obj_id, task_worker in self.ray_tasks.items() if task_worker == worker]
+        for obj_id in obj_ids:
+            del self.ray_tasks[obj_id]
+        return [self.ray_objects.pop(obj_id) for obj_id in obj_ids]
+
+    def get_completed(self, timeout=10):
         """
         Waits on pending tasks and yields them upon completion.
 
+        Args:
+            timeout (float): Max time to wait on the pending tasks in seconds. Tasks completing later are
+                returned by subsequent calls.
+
         Returns:
             generator: Yields completed tasks.
         """
 
-        pending_tasks = list(self.ray_tasks)
+        pending_tasks = self.get_pending()
         if pending_tasks:
             # This ray function checks tasks and splits into ready and non-ready tasks.
-            ready, not_ready = ray.wait(pending_tasks, num_returns=len(pending_tasks), timeout=10)
-            for obj_id in ready:
-                yield (self.ray_tasks.pop(obj_id), self.ray_objects.pop(obj_id))
+            ready, not_ready = ray.wait(pending_tasks, num_returns=len(pending_tasks), timeout=timeout)
+            for completed_task in self.pop_ready(ready):
+                yield completed_task
+
+
+class LatencyHistogram(object):
+    """
+    Histogram of latencies in exponentially growing buckets, cheap enough to record every iteration
+    of an event loop.
+    """
+    def __init__(self, min_latency=1e-5, max_latency=100.0, buckets_per_decade=4):
+        """
+        Args:
+            min_latency (float): Upper bound of the first bucket in seconds.
+            max_latency (float): Lower bound of the overflow bucket in seconds.
+            buckets_per_decade (int): Number of buckets per factor 10 of latency.
+        """
+        num_bounds = int(round(np.log10(max_latency / min_latency) * buckets_per_decade)) + 1
+        self.bounds = np.logspace(np.log10(min_latency), np.log10(max_latency), num_bounds)
+        # Last bucket counts latencies above max_latency.
+        self.counts = np.zeros(num_bounds + 1, dtype=np.int64)
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, latency):
+        """
+        Args:
+            latency (float): Latency in seconds.
+        """
+        self.counts[np.searchsorted(self.bounds, latency)] += 1
+        self.total += latency
+        self.max = max(self.max, latency)
+
+    def percentile(self, q):
+        """
+        Args:
+            q (float): Percentile in [0, 100].
+
+        Returns:
+            float: Upper bound of the bucket containing the percentile (`max` for the overflow bucket).
+        """
+        count = np.sum(self.counts)
+        if count == 0:
+            return 0.0
+        index = int(np.searchsorted(np.cumsum(self.counts), q / 100.0 * count))
+        return float(self.bounds[index]) if index < len(self.bounds) else self.max
+
+    def get_stats(self):
+        """
+        Returns:
+            dict: Count, mean, max and p50, p90, p99 latencies in seconds plus the raw bucket bounds and counts.
+        """
+        count = int(np.sum(self.counts))
+        return dict(
+            count=count,
+            mean=self.total / count if count > 0 else 0.0,
+            max=self.max,
+            p50=self.percentile(50),
+            p90=self.percentile(90),
+            p99=self.percentile(99),
+            bounds=self.bounds.tolist(),
+            counts=self.counts.tolist()
+        )
+
+    def reset(self):
+        self.counts[:] = 0
+        self.total = 0.0
+        self.max = 0.0
+
+
+class RayMetricsCollector(object):
+    """
+    Periodically requests metrics snapshots from remote workers and collects them without blocking,
+    so live metrics can be gathered while workers are busy sampling.
+    """
+    def __init__(self, interval=5.0):
+        """
+        Args:
+            interval (float): Min time between snapshot requests in seconds.
+        """
+        self.interval = interval
+        self.snapshot_tasks = RayTaskPool()
+        self.last_request = None
+        # Worker -> latest snapshot.
+        self.snapshots = dict()
+
+    def poll(self, workers):
+        """
+        Collects snapshots which arrived since the last poll and requests new ones from workers without an
+        outstanding request if the interval passed.
+
+        Args:
+            workers (list): Remote workers implementing `get_metrics_snapshot`.
+
+        Returns:
+            dict: Worker -> latest snapshot of all workers which delivered one.
+        """
+        completed = list(self.snapshot_tasks.get_completed(timeout=0))
+        if completed:
+            for (worker, _), snapshot in zip(completed, ray.get([obj_id for _, obj_id in completed])):
+                self.snapshots[worker] = snapshot
+
+        now = time.monotonic()
+        if self.last_request is None or now - self.last_request >= self.interval:
+            requested = set(self.snapshot_tasks.ray_tasks.values())
+            for worker in workers:
+                if worker not in requested:
+                    self.snapshot_tasks.add_task(worker, worker.get_metrics_snapshot.remote())
+            self.last_request = now
+        return self.snapshots
+
+    def remove_worker(self, worker):
+        self.snapshot_tasks.remove_worker_tasks(worker)
+        self.snapshots.pop(worker, None)
 
 
 def create_colocated_ray_actors(cls, config, num_agents, max_attempts=10):
     """
-    Creates a specified number of co-located RayActors.
+    Creates a specified number of RayActors co-located with the driver.
 
     Args:
         cls (class): Actor class to create
@@ -89,20 +244,63 @@ def create_colocated_ray_actors(cls, config, num_agents, max_attempts=10):
     Raises:
         RLGraph-Error if not enough agents could be created within the specified number of attempts.
     """
-    agents = []
-    attempt = 1
+    return [actor for actor, _ in create_ray_actors_on_hosts(cls, config, {os.uname()[1]: num_agents}, max_attempts)]
+
+
+def create_ray_actors_on_hosts(cls, config, host_counts, max_attempts=10):
+    """
+    Creates RayActors on specific hosts. Ray does not place actors on a given node, so each attempt
+    creates candidate actors, keeps those placed on hosts which still need actors and terminates the rest.
+    Attempt k creates k times as many candidates as actors are still missing.
+
+    Args:
+        cls (class): Actor class to create, must implement `get_host`.
+        config (dict): Config for actor.
+        host_counts (dict): Host name -> number of actors to create on that host.
+        max_attempts (Optional[int]): Max number of attempts, will raise an error if not all actors could be
+            created within this number.
 
-    while len(agents) < num_agents and attempt <= max_attempts:
-        ray_agents = [cls.remote(config) for _ in range(attempt * num_agents)]
-        local_agents, _ = split_local_non_local_agents(ray_agents)
-        agents.extend(local_agents)
+    Returns:
+        list: (actor, host) tuples of the created actors, grouped by host in the order of `host_counts`.
 
-    if len(agents) < num_agents:
-        raise RLGraphError("Could not create the specified number ({}) of agents.".format(
-            num_agents
-        ))
+    Raises:
+        RLGraph-Error if not enough actors could be created within the specified number of attempts.
+    """
+    missing = dict(host_counts)
+    actors = {host: [] for host in host_counts}
+    attempt = 1
 
-    return agents[:num_agents]
+    while sum(missing.values()) > 0 and attempt <= max_attempts:
+        candidates = [cls.remote(config) for _ in range(attempt * sum(missing.values()))]
+        hosts = ray.get([candidate.get_host.remote() for candidate in candidates])
+        for candidate, host in zip(candidates, hosts):
+            if missing.get(host, 0) > 0:
+                actors[host].append(candidate)
+                missing[host] -= 1
+            else:
+                # Free the resources of unused candidates.
+                candidate.__ray_terminate__.remote()
+        attempt += 1
+
+    if sum(missing.values()) > 0:
+        for host_actors in actors.values():
+            for actor in host_actors:
+                actor.__ray_terminate__.remote()
+        raise RLGraphError("Could not create the specified number of agents per host within {} attempts, "
+                           "missing: {}.".format(max_attempts, {host: n for host, n in missing.items() if n > 0}))
+
+    return [(actor, host) for host in host_counts for actor in actors[host]]
+
+
+def get_actor_hosts(ray_actors):
+    """
+    Args:
+        ray_actors (list): RayActors.
+
+    Returns:
+        list: Host name of each actor.
+    """
+    return ray.get([actor.get_host.remote() for actor in ray_actors])
 
 
 def split_local_non_local_agents(ray_agents):
@@ -117,7 +315,7 @@ def split_local_non_local_agents(ray_agents):
         (list, list): Local and non-local agents.
     """
     localhost = os.uname()[1]
-    hosts = ray.get([agent.get_host.remote() for agent in ray_agents])
+    hosts = get_actor_hosts(ray_agents)
     local = []
     non_local = []
 
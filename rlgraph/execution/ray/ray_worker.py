@@ -17,19 +17,26 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+from collections import deque
 from copy import deepcopy
 import numpy as np
+from six.moves import queue
 from six.moves import xrange as range_
+from threading import Lock, Thread
 import time
 
 from rlgraph import get_distributed_backend
+from rlgraph.utils.n_step_util import n_step_post_process
 from rlgraph.utils.util import SMALL_NUMBER
 from rlgraph.components.neural_networks.preprocessor_stack import PreprocessorStack
+from rlgraph.environments import VectorEnv
 from rlgraph.environments.sequential_vector_env import SequentialVectorEnv
+from rlgraph.execution.batch_preprocessor import BatchPreprocessor
 from rlgraph.execution.environment_sample import EnvironmentSample
+from rlgraph.execution.metrics import RingBuffer
 from rlgraph.execution.ray import RayExecutor
 from rlgraph.execution.ray.ray_actor import RayActor
-from rlgraph.execution.ray.ray_util import ray_compress
+from rlgraph.execution.ray.codecs import Codec
 
 if get_distributed_backend() == "ray":
     import ray
@@ -51,7 +58,6 @@ class RayWorker(RayActor):
             env_spec (dict): Environment config for environment to run.
             frameskip (int): How often actions are repeated after retrieving them from the agent.
         """
-        assert get_distributed_backend() == "ray"
         # Internal frameskip of env.
         self.env_frame_skip = env_spec.get("frameskip", 1)
         # Worker computes weights for prioritized sampling.
@@ -62,10 +68,42 @@ class RayWorker(RayActor):
         self.num_environments = worker_spec.pop("num_worker_environments", 1)
         self.env_ids = ["env_{}".format(i) for i in range_(self.num_environments)]
         self.auto_build = auto_build
+        # Spare environments kept reset in a background reset pool. Resets are synchronous unless `async_reset`
+        # is set, or spare environments are requested via `num_background_envs`.
+        async_reset = worker_spec.pop("async_reset", worker_spec.get("num_background_envs", 0) > 0)
         num_background_envs = worker_spec.pop("num_background_envs", 1)
-
-        # TODO from spec once we decided on generic vectorization.
-        self.vector_env = SequentialVectorEnv(self.num_environments, env_spec, num_background_envs)
+        num_reset_threads = worker_spec.pop("num_reset_threads", 1)
+        # Codec for states and next states, must match the replay memory's codec. If None, states are
+        # returned as raw arrays.
+        codec = worker_spec.pop("codec", "lz4")
+        self.codec = Codec.from_spec(codec) if codec is not None else None
+        # Compress states of an entire sample chunk as one block instead of per state. This only applies to the
+        # transfer, replay memories re-encode the states per state on insert.
+        self.compress_chunks = worker_spec.pop("compress_chunks", False)
+        # Post-process (compute priorities for and compress) each sample chunk in a background thread while
+        # the next chunk is collected. Samples are then returned with a delay of one chunk.
+        self.async_sample_processing = worker_spec.pop("async_sample_processing", False)
+        episode_history_size = worker_spec.pop("episode_history_size", 1000)
+        metrics_window_size = worker_spec.pop("metrics_window_size", 100)
+
+        # Spec of the VectorEnv running the environments, e.g. dict(type="process-vector", num_processes=4).
+        vector_env_spec = worker_spec.pop("vector_env_spec", None)
+        if vector_env_spec is None:
+            self.vector_env = SequentialVectorEnv(
+                self.num_environments, env_spec, num_background_envs=num_background_envs, async_reset=async_reset,
+                num_reset_threads=num_reset_threads
+            )
+        else:
+            self.vector_env = VectorEnv.from_spec(dict(vector_env_spec), num_envs=self.num_environments,
+                                                  env_spec=env_spec)
+        # Computes actions for one half of the environments while the other half is stepped, see `Worker`.
+        if worker_spec.pop("double_buffered_stepping", False):
+            assert self.num_environments >= 2, \
+                "ERROR: Double-buffered stepping requires at least 2 environments, got {}.".format(
+                    self.num_environments)
+            self.env_groups = self.vector_env.get_env_groups(2)
+        else:
+            self.env_groups = [tuple(range_(self.num_environments))]
 
         # Then update agent config.
         agent_config['state_space'] = self.vector_env.state_space
@@ -92,32 +130,53 @@ class RayWorker(RayActor):
         self.preprocessors = {}
         preprocessing_spec = agent_config.get("preprocessing_spec", None)
         self.is_preprocessed = {}
+        # Preprocesses the states of all environments stepped together in one call instead of per environment.
+        self.batch_preprocessor = None
+        if worker_spec.pop("batch_preprocessing", False) and preprocessing_spec is not None:
+            self.batch_preprocessor = BatchPreprocessor(preprocessing_spec, self.num_environments)
         for env_id in self.env_ids:
-            self.preprocessors[env_id] = self.setup_preprocessor(
-                preprocessing_spec, self.vector_env.state_space.with_batch_rank()
-            )
+            if self.batch_preprocessor is None:
+                self.preprocessors[env_id] = self.setup_preprocessor(
+                    preprocessing_spec, self.vector_env.state_space.with_batch_rank()
+                )
+            else:
+                self.preprocessors[env_id] = None
             self.is_preprocessed[env_id] = False
         self.agent = self.setup_agent(agent_config, worker_spec)
+        # Serializes agent calls of the sample processing thread with acting and weight updates.
+        self.agent_lock = Lock()
+        # Version of the last weights set via `set_flat_policy_weights`.
+        self.weights_version = 0
         self.worker_frameskip = frameskip
 
-        # Save these so they can be fetched after training if desired.
-        self.finished_episode_rewards = [[] for _ in range_(self.num_environments)]
-        self.finished_episode_timesteps = [[] for _ in range_(self.num_environments)]
+        # Save these so they can be fetched after training if desired. Only the last `episode_history_size`
+        # episodes per environment are kept so memory stays flat over long runs.
+        self.finished_episode_rewards = [deque(maxlen=episode_history_size) for _ in range_(self.num_environments)]
+        self.finished_episode_timesteps = [deque(maxlen=episode_history_size) for _ in range_(self.num_environments)]
         # Total times sample the "real" wallclock time from start to end for each episode.
-        self.finished_episode_total_times = [[] for _ in range_(self.num_environments)]
+        self.finished_episode_total_times = [deque(maxlen=episode_history_size)
+                                             for _ in range_(self.num_environments)]
         # Sample times stop the wallclock time counter between runs, so only the sampling time is accounted for.
-        self.finished_episode_sample_times = [[] for _ in range_(self.num_environments)]
+        self.finished_episode_sample_times = [deque(maxlen=episode_history_size)
+                                              for _ in range_(self.num_environments)]
+        # Rewards of the most recent episodes over all environments, for live metrics.
+        self.recent_episode_rewards = RingBuffer(metrics_window_size)
 
         self.total_worker_steps = 0
         self.episodes_executed = 0
 
-        # Step time and steps done per call to execute_and_get to measure throughput of this worker.
-        self.sample_times = []
-        self.sample_steps = []
-        self.sample_env_frames = []
+        # Step time and steps done over all calls to execute_and_get to measure throughput of this worker.
+        self.total_sample_time = 0.0
+        self.total_sample_steps = 0
+        self.total_sample_env_frames = 0
+        # Throughput of the most recent calls, for live metrics.
+        self.recent_sample_throughputs = RingBuffer(metrics_window_size)
 
         # To continue running through multiple exec calls.
         self.last_states = self.vector_env.reset_all()
+        # Reset states are views into a buffer overwritten by the next step.
+        if self.vector_env.returns_state_views:
+            self.last_states = np.array(self.last_states)
         self.agent.reset()
 
         self.zero_batched_state = np.zeros((1,) + self.agent.preprocessed_state_space.shape)
@@ -135,6 +194,14 @@ class RayWorker(RayActor):
         # Was the last state a terminal state so env should be reset in next call?
         self.last_terminals = [False for _ in range_(self.num_environments)]
 
+        if self.async_sample_processing:
+            self.sample_processing_queue = queue.Queue()
+            self.processed_sample_queue = queue.Queue()
+            self.num_pending_samples = 0
+            self.sample_processing_thread = Thread(target=self._process_samples)
+            self.sample_processing_thread.daemon = True
+            self.sample_processing_thread.start()
+
     def get_constructor_success(self):
         """
         For debugging: fetch the last attribute. Will fail if constructor failed.
@@ -143,6 +210,7 @@ class RayWorker(RayActor):
 
     @classmethod
     def as_remote(cls, num_cpus=None, num_gpus=None):
+        assert get_distributed_backend() == "ray"
         return ray.remote(num_cpus=num_cpus, num_gpus=num_gpus)(cls)
 
     def init_agent(self):
@@ -215,10 +283,38 @@ class RayWorker(RayActor):
         """
         Collects and returns time step experience.
 
+        With `async_sample_processing`, the collected chunk is post-processed in the background and the
+        chunk collected by the previous call is returned, together with the metrics of its collection. The
+        agent's TD-loss forward pass then overlaps with environment stepping.
+
         Args:
             break_on_terminal (Optional[bool]): If true, breaks when a terminal is encountered. If false,
                 executes exactly 'num_timesteps' steps.
         """
+        if not self.async_sample_processing:
+            (sample_batch, batch_size), metrics = self._collect_timesteps(
+                num_timesteps, max_timesteps_per_episode, use_exploration, break_on_terminal
+            )
+        else:
+            # Keep one chunk in flight: The very first call collects a second chunk before returning the first.
+            while self.num_pending_samples < 2:
+                self.sample_processing_queue.put(self._collect_timesteps(
+                    num_timesteps, max_timesteps_per_episode, use_exploration, break_on_terminal
+                ))
+                self.num_pending_samples += 1
+            sample_batch, batch_size, metrics = self._get_processed_sample()
+
+        return EnvironmentSample(sample_batch=sample_batch, batch_size=batch_size, metrics=metrics)
+
+    def _collect_timesteps(self, num_timesteps, max_timesteps_per_episode, use_exploration, break_on_terminal):
+        """
+        Steps the environments for one chunk of experience, see `execute_and_get_timesteps`.
+
+        Returns:
+            tuple: Chunk and metrics of its collection. The chunk is the sample batch and batch size, or the
+                lists of states, actions, rewards, next states and terminals to post-process with
+                `async_sample_processing`.
+        """
         # Initialize start timestamps. Initializing the timestamps here should make the observed execution timestamps
         # more accurate, as there might be delays between the worker initialization and actual sampling start.
         if not self.last_ep_start_initialized:
@@ -246,7 +342,7 @@ class RayWorker(RayActor):
             sample_rewards[env_id] = []
             sample_terminals[env_id] = []
 
-        env_states = self.last_states
+        env_states = list(self.last_states)
         current_episode_rewards = self.last_ep_rewards
         current_episode_timesteps = self.last_ep_timesteps
         current_episode_start_timestamps = self.last_ep_start_timestamps
@@ -254,46 +350,58 @@ class RayWorker(RayActor):
 
         # Whether the episode in each env has terminated.
         terminals = [False for _ in range_(self.num_environments)]
-        while timesteps_executed < num_timesteps:
-            current_iteration_start_timestamp = time.perf_counter()
-            for i, env_id in enumerate(self.env_ids):
-                state = self.agent.state_space.force_batch(env_states[i])
-                if self.preprocessors[env_id] is not None:
-                    if self.is_preprocessed[env_id] is False:
-                        self.preprocessed_states_buffer[i] = self.preprocessors[env_id].preprocess(state)
-                        self.is_preprocessed[env_id] = True
-                else:
-                    self.preprocessed_states_buffer[i] = env_states[i]
-
-            actions = self.get_action(states=self.preprocessed_states_buffer,
-                                      use_exploration=use_exploration, apply_preprocessing=False)
-            next_states, step_rewards, terminals, infos = self.vector_env.step(actions=actions)
+        # Groups of environments with a step in flight, in the order their steps were started.
+        pending_groups = deque()
+        # Group -> preprocessed states, actions and start time of its step in flight.
+        group_inputs = dict()
+        finished = False
+        while pending_groups or not finished:
+            # Start stepping all groups not in flight. With double-buffered stepping, this computes the actions of
+            # one group while the other group's environments are stepped.
+            if not finished:
+                for group in self.env_groups:
+                    # Do not start steps beyond `num_timesteps`.
+                    if group in group_inputs or \
+                            0 < num_timesteps <= timesteps_executed + sum(len(g) for g in pending_groups):
+                        continue
+                    group_start_timestamp = time.perf_counter()
+                    preprocessed_states, actions = self._get_group_actions(group, env_states, use_exploration)
+                    self.vector_env.step_async(actions=actions, indices=group)
+                    group_inputs[group] = (preprocessed_states, actions, group_start_timestamp)
+                    pending_groups.append(group)
+
+            group = pending_groups.popleft()
+            state_buffer, actions, group_start_timestamp = group_inputs.pop(group)
+            group_next_states, step_rewards, step_terminals, infos = self.vector_env.step_wait(indices=group)
+            # States in a shared buffer are overwritten by the next step, but kept in the sample trajectories.
+            if self.vector_env.returns_state_views:
+                group_next_states = np.array(group_next_states)
             # Worker frameskip not needed as done in env.
-            # for _ in range_(self.worker_frameskip):
-            #     next_states, step_rewards, terminals, infos = self.vector_env.step(actions=actions)
-            #     env_frames += self.num_environments
-            #
-            #     for i, env_id in enumerate(self.env_ids):
-            #         rewards[env_id] += step_rewards[i]
-            #     if np.any(terminals):
-            #         break
-
-            timesteps_executed += self.num_environments
-            env_frames += self.num_environments
-            env_states = next_states
-            current_iteration_time = time.perf_counter() - current_iteration_start_timestamp
+            if self.batch_preprocessor is not None:
+                # Preprocessed next states are the group's current states in its next step.
+                self.preprocessed_states_buffer[list(group)] = self.batch_preprocessor.preprocess(
+                    group_next_states, group
+                )
+            reset_indices = []
+
+            timesteps_executed += len(group)
+            env_frames += len(group)
+            current_iteration_time = time.perf_counter() - group_start_timestamp
 
             # Do accounting for each environment.
-            state_buffer = np.array(self.preprocessed_states_buffer)
-            for i, env_id in enumerate(self.env_ids):
-                # Set is preprocessed to False because env_states are currently NOT preprocessed.
-                self.is_preprocessed[env_id] = False
+            for j, i in enumerate(group):
+                env_id = self.env_ids[i]
+                next_states[i] = group_next_states[j]
+                env_states[i] = group_next_states[j]
+                terminals[i] = step_terminals[j]
+                # Env states are NOT preprocessed yet, unless batch preprocessing already did so above.
+                self.is_preprocessed[env_id] = self.batch_preprocessor is not None
                 current_episode_timesteps[i] += 1
                 # Each position is the running episode reward of that episode. Add step reward.
-                current_episode_rewards[i] += step_rewards[i]
-                sample_states[env_id].append(state_buffer[i])
-                sample_actions[env_id].append(actions[i])
-                sample_rewards[env_id].append(step_rewards[i])
+                current_episode_rewards[i] += step_rewards[j]
+                sample_states[env_id].append(state_buffer[j])
+                sample_actions[env_id].append(actions[j])
+                sample_rewards[env_id].append(step_rewards[j])
                 sample_terminals[env_id].append(terminals[i])
                 current_episode_sample_times[i] += current_iteration_time
 
@@ -303,6 +411,7 @@ class RayWorker(RayActor):
                     self.finished_episode_timesteps[i].append(current_episode_timesteps[i])
                     self.finished_episode_total_times[i].append(time.perf_counter() - current_episode_start_timestamps[i])
                     self.finished_episode_sample_times[i].append(current_episode_sample_times[i])
+                    self.recent_episode_rewards.append(current_episode_rewards[i])
                     episodes_executed[i] += 1
                     self.episodes_executed += 1
 
@@ -311,7 +420,9 @@ class RayWorker(RayActor):
                     env_sample_next_states = env_sample_states[1:]
 
                     next_state = self.agent.state_space.force_batch(next_states[i])
-                    if self.preprocessors[env_id] is not None:
+                    if self.batch_preprocessor is not None:
+                        next_state = np.array(self.preprocessed_states_buffer[i:i + 1])
+                    elif self.preprocessors[env_id] is not None:
                         next_state = self.preprocessors[env_id].preprocess(next_state)
 
                     # Extend because next state has a batch dim.
@@ -338,6 +449,8 @@ class RayWorker(RayActor):
 
                     # Reset this environment and its pre-processor stack.
                     env_states[i] = self.vector_env.reset(i)
+                    if self.vector_env.returns_state_views:
+                        env_states[i] = np.array(env_states[i])
                     if self.preprocessors[env_id] is not None:
                         self.preprocessors[env_id].reset()
                         # This re-fills the sequence with the reset state.
@@ -345,15 +458,24 @@ class RayWorker(RayActor):
                         # Pre - process, add to buffer
                         self.preprocessed_states_buffer[i] = np.array(self.preprocessors[env_id].preprocess(state))
                         self.is_preprocessed[env_id] = True
+                    reset_indices.append(i)
                     current_episode_rewards[i] = 0
                     current_episode_timesteps[i] = 0
                     current_episode_start_timestamps[i] = time.perf_counter()
                     current_episode_sample_times[i] = 0.0
 
-            if 0 < num_timesteps <= timesteps_executed or (break_on_terminal and np.any(terminals)):
-                self.total_worker_steps += timesteps_executed
-                break
+            # Re-fills the sequences of reset environments with their reset states.
+            if self.batch_preprocessor is not None and len(reset_indices) > 0:
+                self.batch_preprocessor.reset(reset_indices)
+                self.preprocessed_states_buffer[reset_indices] = self.batch_preprocessor.preprocess(
+                    np.array([env_states[i] for i in reset_indices]), reset_indices
+                )
+
+            # Steps in flight when finishing are completed.
+            if 0 < num_timesteps <= timesteps_executed or (break_on_terminal and np.any(step_terminals)):
+                finished = True
 
+        self.total_worker_steps += timesteps_executed
         self.last_terminals = terminals
         self.last_states = env_states
         self.last_ep_rewards = current_episode_rewards
@@ -370,7 +492,9 @@ class RayWorker(RayActor):
                 # Get next states for this environment's trajectory.
                 env_sample_next_states = env_sample_states[1:]
                 next_state = self.agent.state_space.force_batch(next_states[i])
-                if self.preprocessors[env_id] is not None:
+                if self.batch_preprocessor is not None:
+                    next_state = np.array(self.preprocessed_states_buffer[i:i + 1])
+                elif self.preprocessors[env_id] is not None:
                     next_state = self.preprocessors[env_id].preprocess(next_state)
                     # This is the env state in the next call so avoid double preprocessing
                     # by adding to buffer.
@@ -389,35 +513,53 @@ class RayWorker(RayActor):
                 batch_next_states.extend(post_next_s)
                 batch_terminals.extend(post_t)
 
-        # Perform final batch-processing once.
-        sample_batch, batch_size = self._batch_process_sample(batch_states, batch_actions,
-                                                              batch_rewards, batch_next_states, batch_terminals)
+        if self.async_sample_processing:
+            chunk = (batch_states, batch_actions, batch_rewards, batch_next_states, batch_terminals)
+        else:
+            # Perform final batch-processing once.
+            chunk = self._batch_process_sample(batch_states, batch_actions, batch_rewards, batch_next_states,
+                                               batch_terminals)
 
         total_time = (time.monotonic() - start) or 1e-10
-        self.sample_steps.append(timesteps_executed)
-        self.sample_times.append(total_time)
-        self.sample_env_frames.append(env_frames)
+        self.total_sample_steps += timesteps_executed
+        self.total_sample_time += total_time
+        self.total_sample_env_frames += env_frames
+        self.recent_sample_throughputs.append(timesteps_executed / total_time)
 
         # Note that the controller already evaluates throughput so there is no need
         # for each worker to calculate expensive statistics now.
-        return EnvironmentSample(
-            sample_batch=sample_batch,
-            batch_size=batch_size,
-            metrics=dict(
-                runtime=total_time,
-                # Agent act/observe throughput.
-                timesteps_executed=timesteps_executed,
-                ops_per_second=(timesteps_executed / total_time),
-            )
+        return chunk, dict(
+            runtime=total_time,
+            # Agent act/observe throughput.
+            timesteps_executed=timesteps_executed,
+            ops_per_second=(timesteps_executed / total_time),
         )
 
-    @ray.method(num_return_vals=2)
     def execute_and_get_with_count(self):
         sample = self.execute_and_get_timesteps(num_timesteps=self.worker_sample_size)
         return sample, sample.batch_size
 
+    # N.b. Workers can also run without Ray, e.g. in the processes of a `LocalApexExecutor`.
+    if get_distributed_backend() == "ray":
+        execute_and_get_with_count = ray.method(num_return_vals=2)(execute_and_get_with_count)
+
     def set_policy_weights(self, weights):
-        self.agent.set_policy_weights(weights)
+        with self.agent_lock:
+            self.agent.set_policy_weights(weights)
+
+    def set_flat_policy_weights(self, flat_weights):
+        """
+        Sets policy weights published by a `WeightPublisher`, unless this worker already holds
+        the same or a newer version.
+
+        Args:
+            flat_weights (FlatWeights): Flattened, versioned weights. The weights are set from views into the
+                flat buffer without unpacking them into separate arrays first.
+        """
+        if flat_weights.version > self.weights_version:
+            with self.agent_lock:
+                self.agent.set_policy_weights(flat_weights.to_weights())
+            self.weights_version = flat_weights.version
 
     def get_workload_statistics(self):
         """
@@ -427,16 +569,18 @@ class RayWorker(RayActor):
             dict: Performance metrics.
         """
         # Adjust env frames for internal env frameskip:
-        adjusted_frames = [env_frames * self.env_frame_skip for env_frames in self.sample_env_frames]
-        if len(self.finished_episode_rewards) > 0:
+        adjusted_frames = self.total_sample_env_frames * self.env_frame_skip
+        sample_time = self.total_sample_time or 1e-10
+        if self.episodes_executed > 0:
             all_finished_rewards = list()
             for env_reward_list in self.finished_episode_rewards:
                 all_finished_rewards.extend(env_reward_list)
             min_episode_reward = np.min(all_finished_rewards)
             max_episode_reward = np.max(all_finished_rewards)
             mean_episode_reward = np.mean(all_finished_rewards)
-            # Mean of final episode rewards over all envs
-            final_episode_reward = np.mean([env_rewards[-1] for env_rewards in self.finished_episode_rewards])
+            # Mean of final episode rewards over all envs which finished an episode.
+            final_episode_reward = np.mean([env_rewards[-1] for env_rewards in self.finished_episode_rewards
+                                            if len(env_rewards) > 0])
         else:
             # Will be aggregated in executor.
             min_episode_reward = None
@@ -445,60 +589,62 @@ class RayWorker(RayActor):
             final_episode_reward = None
 
         return dict(
-            episode_timesteps=self.finished_episode_timesteps,
-            episode_rewards=self.finished_episode_rewards,
-            episode_total_times=self.finished_episode_total_times,
-            episode_sample_times=self.finished_episode_sample_times,
+            episode_timesteps=[list(timesteps) for timesteps in self.finished_episode_timesteps],
+            episode_rewards=[list(rewards) for rewards in self.finished_episode_rewards],
+            episode_total_times=[list(times) for times in self.finished_episode_total_times],
+            episode_sample_times=[list(times) for times in self.finished_episode_sample_times],
             min_episode_reward=min_episode_reward,
             max_episode_reward=max_episode_reward,
             mean_episode_reward=mean_episode_reward,
             final_episode_reward=final_episode_reward,
             episodes_executed=self.episodes_executed,
             worker_steps=self.total_worker_steps,
-            mean_worker_ops_per_second=sum(self.sample_steps) / sum(self.sample_times),
-            mean_worker_env_frames_per_second=sum(adjusted_frames) / sum(self.sample_times)
+            mean_worker_ops_per_second=self.total_sample_steps / sample_time,
+            mean_worker_env_frames_per_second=adjusted_frames / sample_time,
+            reset_metrics=self.vector_env.get_reset_metrics()
+        )
+
+    def get_metrics_snapshot(self):
+        """
+        Returns a cheap snapshot of live metrics over a bounded window of recent sample calls and episodes,
+        to be requested periodically while a workload runs.
+
+        Returns:
+            dict: Live metrics.
+        """
+        return dict(
+            worker_steps=self.total_worker_steps,
+            episodes_executed=self.episodes_executed,
+            recent_ops_per_second=self.recent_sample_throughputs.mean(),
+            mean_worker_ops_per_second=self.total_sample_steps / (self.total_sample_time or 1e-10),
+            recent_mean_episode_reward=self.recent_episode_rewards.mean(),
+            last_episode_reward=self.recent_episode_rewards.last(),
+            weights_version=self.weights_version,
+            reset_stall_time=self.vector_env.get_reset_metrics()["reset_stall_time"]
         )
 
     def _truncate_n_step(self, states, actions, rewards, next_states, terminals, was_terminal=True):
         """
         Computes n-step truncation for exactly one episode segment of one environment.
 
+        Args:
+            states (list): States of the segment.
+            actions (list): Actions of the segment.
+            rewards (list): Rewards of the segment.
+            next_states (list): Next states of the segment.
+            terminals (list): Terminals of the segment.
+            was_terminal (bool): Whether the segment ended an episode.
+
         Returns:
-             n-step truncated (shortened) version.
+             n-step truncated (shortened) version. Next states are references to the given next states.
         """
         if self.n_step_adjustment > 1:
-            new_len = len(states) - self.n_step_adjustment + 1
-
-            # There are 2 cases. If the trajectory did not end in a terminal,
-            # we just have to move states forward and truncate.
-            if was_terminal:
-                # We know the ONLY last terminal is True.
-                terminal_position = len(rewards) - 1
-                for i in range(len(rewards)):
-                    for j in range(1, self.n_step_adjustment):
-                        # Outside sample data. Stop inner loop and set truncate = True
-                        if i + j >= len(next_states):
-                            break
-                        # Normal case: No terminal ahead (so far) in n-step sequence.
-                        if i + j < terminal_position:
-                            next_states[i] = next_states[i + j]
-                            rewards[i] += self.discount ** j * rewards[i + j]
-                        # Terminal ahead: Don't go beyond it.
-                        # Repeat it for the remaining n-steps and always assume r=0.0.
-                        else:
-                            next_states[i] = next_states[terminal_position]
-                            terminals[i] = True
-                            if i + j <= terminal_position:
-                                rewards[i] += self.discount ** j * rewards[i + j]
-            else:
-                # We know this segment does not contain any terminals so we simply have to adjust next
-                # states and rewards.
-                for i in range_(len(rewards) - self.n_step_adjustment + 1):
-                    for j in range_(1, self.n_step_adjustment):
-                        next_states[i] = next_states[i + j]
-                        rewards[i] += self.discount ** j * rewards[i + j]
-                for arr in [states, actions, rewards, next_states, terminals]:
-                    del arr[new_len:]
+            num_records, rewards, terminals, next_state_indices = n_step_post_process(
+                rewards, terminals, self.n_step_adjustment, self.discount, was_terminal=was_terminal
+            )
+            states = states[:num_records]
+            actions = actions[:num_records]
+            next_states = [next_states[i] for i in next_state_indices]
 
         return states, actions, rewards, next_states, terminals
 
@@ -522,45 +668,115 @@ class RayWorker(RayActor):
         if self.worker_computes_weights:
             # Next states were just collected, we batch process them here.
             # TODO make generic agent method?
-            _, loss_per_item = self.agent.get_td_loss(
-                dict(
-                    states=states,
-                    actions=actions,
-                    rewards=rewards,
-                    terminals=terminals,
-                    next_states=next_states,
-                    importance_weights=weights
+            with self.agent_lock:
+                _, loss_per_item = self.agent.get_td_loss(
+                    dict(
+                        states=states,
+                        actions=actions,
+                        rewards=rewards,
+                        terminals=terminals,
+                        next_states=next_states,
+                        importance_weights=weights
+                    )
                 )
-            )
             weights = np.abs(loss_per_item) + SMALL_NUMBER
 
+        if self.codec is not None:
+            states = self.codec.compress_batch(states, chunked=self.compress_chunks)
+            next_states = self.codec.compress_batch(next_states, chunked=self.compress_chunks)
+        else:
+            states = np.asarray(states)
+            next_states = np.asarray(next_states)
+
         return dict(
-            states=np.array([ray_compress(state) for state in states]),
+            states=states,
             actions=np.array(actions),
             rewards=np.array(rewards),
             terminals=np.array(terminals),
-            next_states=np.array([ray_compress(next_state) for next_state in next_states]),
+            next_states=next_states,
             importance_weights=np.array(weights)
         ), len(rewards)
 
+    def _process_samples(self):
+        # Background thread: Post-processes chunks in order of collection.
+        while True:
+            chunk, metrics = self.sample_processing_queue.get()
+            try:
+                self.processed_sample_queue.put(self._batch_process_sample(*chunk) + (metrics,))
+            except Exception as e:
+                self.processed_sample_queue.put(e)
+
+    def _get_processed_sample(self):
+        """
+        Returns the oldest chunk post-processed in the background, blocking until it is ready.
+
+        Returns:
+            tuple: Sample batch dict and batch size, see `_batch_process_sample`, and the metrics of the
+                chunk's collection.
+        """
+        result = self.processed_sample_queue.get()
+        self.num_pending_samples -= 1
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def _get_group_actions(self, group, env_states, use_exploration):
+        """
+        Preprocesses the current states of a group of environments and computes their actions.
+
+        Args:
+            group (tuple): Indices of the environments.
+            env_states (list): Current states of all environments.
+            use_exploration (bool): Whether to use exploration when picking actions.
+
+        Returns:
+            tuple: Preprocessed states and actions of the group's environments.
+        """
+        if self.batch_preprocessor is not None:
+            indices = [i for i in group if self.is_preprocessed[self.env_ids[i]] is False]
+            if len(indices) > 0:
+                self.preprocessed_states_buffer[indices] = self.batch_preprocessor.preprocess(
+                    np.array([env_states[i] for i in indices]), indices
+                )
+                for i in indices:
+                    self.is_preprocessed[self.env_ids[i]] = True
+        else:
+            for i in group:
+                env_id = self.env_ids[i]
+                state = self.agent.state_space.force_batch(env_states[i])
+                if self.preprocessors[env_id] is not None:
+                    if self.is_preprocessed[env_id] is False:
+                        self.preprocessed_states_buffer[i] = self.preprocessors[env_id].preprocess(state)
+                        self.is_preprocessed[env_id] = True
+                else:
+                    self.preprocessed_states_buffer[i] = env_states[i]
+        # Indexing copies the group's states out of the buffer.
+        preprocessed_states = self.preprocessed_states_buffer[list(group)]
+        actions = self.get_action(states=preprocessed_states, use_exploration=use_exploration,
+                                  apply_preprocessing=False)
+        return preprocessed_states, actions
+
     def get_action(self, states, use_exploration, apply_preprocessing):
+        num_states = len(states)
         if self.worker_executes_exploration:
             # Only once for all actions otherwise we would have to call a session anyway.
             if np.random.random() <= self.exploration_epsilon:
-                if self.num_environments == 1:
+                if num_states == 1:
                     # Sample returns without batch dim -> wrap.
-                    action = [self.agent.action_space.sample(size=self.num_environments)]
+                    action = [self.agent.action_space.sample(size=num_states)]
                 else:
-                    action = self.agent.action_space.sample(size=self.num_environments)
+                    action = self.agent.action_space.sample(size=num_states)
             else:
-                if self.num_environments == 1:
-                    action = [self.agent.get_action(states=states, use_exploration=use_exploration,
-                                                    apply_preprocessing=apply_preprocessing)]
-                else:
-                    action = self.agent.get_action(states=states, use_exploration=use_exploration,
-                                                    apply_preprocessing=apply_preprocessing)
+                with self.agent_lock:
+                    if num_states == 1:
+                        action = [self.agent.get_action(states=states, use_exploration=use_exploration,
+                                                        apply_preprocessing=apply_preprocessing)]
+                    else:
+                        action = self.agent.get_action(states=states, use_exploration=use_exploration,
+                                                       apply_preprocessing=apply_preprocessing)
             return action
         else:
-            return self.agent.get_action(states=states, use_exploration=use_exploration,
-                                         apply_preprocessing=apply_preprocessing)
+            with self.agent_lock:
+                return self.agent.get_action(states=states, use_exploration=use_exploration,
+                                             apply_preprocessing=apply_preprocessing)
 
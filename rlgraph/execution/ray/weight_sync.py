@@ -0,0 +1,156 @@
+# Copyright 2018 The RLgraph authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+
+from rlgraph import get_distributed_backend
+
+if get_distributed_backend() == "ray":
+    import ray
+
+
+# Byte alignment of each weight within the flat buffer.
+WEIGHT_ALIGNMENT = 64
+
+
+class FlatWeights(object):
+    """
+    Policy weights flattened into one contiguous byte buffer plus the layout (name, dtype, shape and
+    byte offset) of each weight, so a set of weights is serialized and transferred as a single array.
+    """
+    def __init__(self, layout, buffer, version=0):
+        """
+        Args:
+            layout (list): (name, dtype str, shape, byte offset) tuple per weight.
+            buffer (ndarray): Flat uint8 buffer.
+            version (int): Version of the weights.
+        """
+        self.layout = layout
+        self.buffer = buffer
+        self.version = version
+
+    @staticmethod
+    def from_weights(weights, version=0, out=None):
+        """
+        Flattens a weights dict.
+
+        Args:
+            weights (dict): Weight name -> array, as returned by `Agent.get_policy_weights`.
+            version (int): Version of the weights.
+            out (Optional[FlatWeights]): Flat weights of the same layout whose buffer is reused.
+
+        Returns:
+            FlatWeights: Flattened weights.
+        """
+        weights = {name: FlatWeights._to_numpy(value) for name, value in weights.items()}
+        layout = []
+        offset = 0
+        for name in sorted(weights.keys()):
+            value = weights[name]
+            layout.append((name, value.dtype.str, value.shape, offset))
+            offset += -(-value.nbytes // WEIGHT_ALIGNMENT) * WEIGHT_ALIGNMENT
+
+        if out is not None and out.layout == layout:
+            buffer = out.buffer
+        else:
+            buffer = np.zeros(offset, dtype=np.uint8)
+        for name, _, _, weight_offset in layout:
+            value = weights[name]
+            buffer[weight_offset:weight_offset + value.nbytes] = value.reshape(-1).view(np.uint8)
+        return FlatWeights(layout, buffer, version)
+
+    @staticmethod
+    def _to_numpy(value):
+        # PyTorch parameters.
+        if hasattr(value, "detach"):
+            value = value.detach().cpu().numpy()
+        # N.b. `np.ascontiguousarray` would turn scalars (e.g. step counters) into 1D arrays.
+        return np.require(value, requirements="C")
+
+    def to_weights(self):
+        """
+        Returns the weights as views into the flat buffer, i.e. without copying.
+
+        Returns:
+            dict: Weight name -> array.
+        """
+        weights = {}
+        for name, dtype, shape, offset in self.layout:
+            dtype = np.dtype(dtype)
+            count = int(np.prod(shape))
+            weights[name] = np.frombuffer(self.buffer, dtype=dtype, count=count, offset=offset).reshape(shape)
+        return weights
+
+
+class WeightPublisher(object):
+    """
+    Publishes versioned policy weights to remote workers. Each new version is flattened and put into the
+    object store once; workers are only sent the object id of a version newer than the one they hold.
+    """
+    def __init__(self):
+        self.version = 0
+        self.weights_id = None
+        self.flat_weights = None
+        # Worker -> version it holds.
+        self.worker_versions = dict()
+        self.num_publishes = 0
+        self.num_syncs = 0
+
+    def publish(self, weights):
+        """
+        Publishes a new version of the weights.
+
+        Args:
+            weights (dict): Weight name -> array, as returned by `Agent.get_policy_weights`.
+
+        Returns:
+            int: Version of the published weights.
+        """
+        self.version += 1
+        # The buffer can be reused as `ray.put` copies it into the object store.
+        self.flat_weights = FlatWeights.from_weights(weights, self.version, out=self.flat_weights)
+        self.weights_id = ray.put(self.flat_weights)
+        self.num_publishes += 1
+        return self.version
+
+    def sync(self, ray_worker):
+        """
+        Sends the latest weights to a worker unless it already holds them.
+
+        Args:
+            ray_worker (RayWorker): Remote worker implementing `set_flat_policy_weights`.
+
+        Returns:
+            bool: True if weights were sent.
+        """
+        if self.weights_id is None or self.worker_versions.get(ray_worker, 0) >= self.version:
+            return False
+        ray_worker.set_flat_policy_weights.remote(self.weights_id)
+        self.worker_versions[ray_worker] = self.version
+        self.num_syncs += 1
+        return True
+
+    def remove_worker(self, ray_worker):
+        """
+        Forgets the version held by a worker, e.g. after it was terminated.
+
+        Args:
+            ray_worker (RayWorker): Remote worker.
+        """
+        self.worker_versions.pop(ray_worker, None)
@@ -0,0 +1,195 @@
+# Copyright 2018 The RLgraph authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from collections import deque
+import time
+
+import numpy as np
+
+
+class WorkerScheduler(object):
+    """
+    Straggler-aware scheduling of sample workers.
+
+    Tracks the rolling throughput of every worker over its last task completions. Throughput is compared
+    per environment, so workers running different numbers of environments are comparable. When evaluated,
+    workers below a fraction of the median throughput get their task depth (number of sample tasks in
+    flight) reduced, while workers which recovered get it restored. Workers below a lower fraction are
+    reported for replacement, with a number of environments scaled down to their relative throughput.
+    """
+    def __init__(self, max_task_depth, window_size=10, min_task_completions=3, adapt_task_depth=True,
+                 slow_worker_fraction=0.5, replace_worker_fraction=0.0, rebalance_environments=True):
+        """
+        Args:
+            max_task_depth (int): Max number of sample tasks in flight per worker.
+            window_size (int): Number of task completions throughput is computed over.
+            min_task_completions (int): Number of completions before a worker's throughput is evaluated.
+            adapt_task_depth (bool): If True, reduces the task depth of slow workers.
+            slow_worker_fraction (float): Workers with less than this fraction of the median throughput
+                are slow.
+            replace_worker_fraction (float): Workers with less than this fraction of the median throughput
+                are reported for replacement. 0 disables replacement.
+            rebalance_environments (bool): If True, replacements of stragglers run a number of environments
+                scaled by the straggler's relative throughput.
+        """
+        assert max_task_depth >= 1, "ERROR: Max task depth must be >= 1, is {}.".format(max_task_depth)
+        assert min_task_completions >= 2, "ERROR: Throughput requires at least 2 task completions."
+        self.max_task_depth = max_task_depth
+        self.window_size = max(window_size, min_task_completions)
+        self.min_task_completions = min_task_completions
+        self.adapt_task_depth = adapt_task_depth
+        self.slow_worker_fraction = slow_worker_fraction
+        self.replace_worker_fraction = replace_worker_fraction
+        self.rebalance_environments = rebalance_environments
+
+        self.worker_names = dict()
+        self.num_environments = dict()
+        # Worker -> deque of (completion time, steps) tuples.
+        self.completions = dict()
+        self.task_depths = dict()
+        self.pending_tasks = dict()
+        self.num_depth_reductions = 0
+        self.num_replacements = 0
+
+    def add_worker(self, worker, name, num_environments=1):
+        """
+        Args:
+            worker (any): Worker handle.
+            name (str): Worker name used in metrics.
+            num_environments (int): Number of environments the worker runs.
+        """
+        self.worker_names[worker] = name
+        self.num_environments[worker] = num_environments
+        self.completions[worker] = deque(maxlen=self.window_size)
+        self.task_depths[worker] = self.max_task_depth
+        self.pending_tasks[worker] = 0
+
+    def remove_worker(self, worker):
+        for registry in [self.worker_names, self.num_environments, self.completions, self.task_depths,
+                         self.pending_tasks]:
+            registry.pop(worker, None)
+
+    def task_scheduled(self, worker):
+        self.pending_tasks[worker] += 1
+
+    def task_completed(self, worker, steps, timestamp=None):
+        """
+        Args:
+            worker (any): Worker which completed a task.
+            steps (int): Env steps sampled in the task.
+            timestamp (Optional[float]): Monotonic completion time, defaults to now.
+        """
+        self.pending_tasks[worker] = max(0, self.pending_tasks[worker] - 1)
+        self.completions[worker].append((time.monotonic() if timestamp is None else timestamp, steps))
+
+    def get_num_tasks_to_schedule(self, worker):
+        """
+        Returns:
+            int: Number of tasks to schedule to fill the worker's current task depth.
+        """
+        return max(0, self.task_depths[worker] - self.pending_tasks[worker])
+
+    def get_throughput(self, worker, now=None):
+        """
+        Returns a worker's rolling throughput: The steps sampled since its oldest tracked completion divided by
+        the time passed since, so workers which stopped completing tasks decay towards 0.
+
+        Args:
+            worker (any): Worker handle.
+            now (Optional[float]): Monotonic time to compute throughput at, defaults to now.
+
+        Returns:
+            Union[float, None]: Env steps per second, or None if the worker completed too few tasks yet.
+        """
+        completions = self.completions[worker]
+        if len(completions) < self.min_task_completions:
+            return None
+        elapsed = (time.monotonic() if now is None else now) - completions[0][0]
+        steps = sum(steps for _, steps in completions) - completions[0][1]
+        return steps / elapsed if elapsed > 0 else None
+
+    def update(self, now=None):
+        """
+        Evaluates worker throughputs, adapts task depths and identifies stragglers.
+
+        Args:
+            now (Optional[float]): Monotonic time to evaluate throughputs at, defaults to now.
+
+        Returns:
+            list: (worker, number of environments for its replacement) tuples of workers to replace.
+        """
+        if now is None:
+            now = time.monotonic()
+        relative_throughputs = self._get_relative_throughputs(now)
+        replacements = []
+        for worker, relative_throughput in relative_throughputs.items():
+            if relative_throughput < self.replace_worker_fraction:
+                num_environments = self.num_environments[worker]
+                if self.rebalance_environments:
+                    num_environments = max(1, int(num_environments * relative_throughput))
+                replacements.append((worker, num_environments))
+                self.num_replacements += 1
+            elif not self.adapt_task_depth:
+                continue
+            elif relative_throughput < self.slow_worker_fraction:
+                if self.task_depths[worker] > 1:
+                    self.task_depths[worker] -= 1
+                    self.num_depth_reductions += 1
+            elif self.task_depths[worker] < self.max_task_depth:
+                self.task_depths[worker] += 1
+        return replacements
+
+    def get_metrics(self, now=None):
+        """
+        Returns:
+            dict: Rolling throughput, relative throughput, task depth and pending tasks per worker name,
+                plus the number of task depth reductions and replacements so far.
+        """
+        if now is None:
+            now = time.monotonic()
+        relative_throughputs = self._get_relative_throughputs(now)
+        workers = dict()
+        for worker, name in self.worker_names.items():
+            workers[name] = dict(
+                throughput=self.get_throughput(worker, now),
+                relative_throughput=relative_throughputs.get(worker),
+                task_depth=self.task_depths[worker],
+                pending_tasks=self.pending_tasks[worker],
+                num_environments=self.num_environments[worker]
+            )
+        return dict(
+            workers=workers,
+            num_depth_reductions=self.num_depth_reductions,
+            num_replacements=self.num_replacements
+        )
+
+    def _get_relative_throughputs(self, now):
+        # Throughput per environment relative to the median of all evaluated workers.
+        throughputs = dict()
+        for worker in self.worker_names:
+            throughput = self.get_throughput(worker, now)
+            if throughput is not None:
+                throughputs[worker] = throughput / self.num_environments[worker]
+        # A straggler needs others to compare against.
+        if len(throughputs) < 2:
+            return dict()
+        median = np.median(list(throughputs.values()))
+        if median <= 0:
+            return dict()
+        return {worker: throughput / median for worker, throughput in throughputs.items()}
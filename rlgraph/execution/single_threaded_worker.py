@@ -17,6 +17,7 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+from collections import deque
 from copy import deepcopy
 
 import numpy as np
@@ -26,12 +27,22 @@ import time
 
 from rlgraph.utils.rlgraph_errors import RLGraphError
 from rlgraph.utils.util import default_dict
+from rlgraph.execution.batch_preprocessor import BatchPreprocessor
 from rlgraph.execution.worker import Worker
 
 
 class SingleThreadedWorker(Worker):
 
-    def __init__(self, preprocessing_spec=None, worker_executes_preprocessing=True, **kwargs):
+    def __init__(self, preprocessing_spec=None, worker_executes_preprocessing=True, batch_preprocessing=False,
+                 **kwargs):
+        """
+        Args:
+            preprocessing_spec (Optional[list]): Python preprocessing layer specs.
+            worker_executes_preprocessing (bool): Whether the worker preprocesses states in Python before passing
+                them to the agent.
+            batch_preprocessing (bool): If True, preprocesses the states of all environments stepped together
+                in one call via a `BatchPreprocessor` instead of one `PreprocessorStack` call per environment.
+        """
         super(SingleThreadedWorker, self).__init__(**kwargs)
 
         self.logger.info("Initialized single-threaded executor with {} environments '{}' and Agent '{}'".format(
@@ -42,10 +53,16 @@ class SingleThreadedWorker(Worker):
             assert preprocessing_spec is not None
             self.preprocessors = {}
             self.state_is_preprocessed = {}
+            self.batch_preprocessor = None
+            if batch_preprocessing:
+                self.batch_preprocessor = BatchPreprocessor(preprocessing_spec, self.num_environments)
             for env_id in self.env_ids:
-                self.preprocessors[env_id] = self.setup_preprocessor(
-                    preprocessing_spec, self.vector_env.state_space.with_batch_rank()
-                )
+                if self.batch_preprocessor is None:
+                    self.preprocessors[env_id] = self.setup_preprocessor(
+                        preprocessing_spec, self.vector_env.state_space.with_batch_rank()
+                    )
+                else:
+                    self.preprocessors[env_id] = None
                 self.state_is_preprocessed[env_id] = False
 
         self.apply_preprocessing = not self.worker_executes_preprocessing
@@ -99,6 +116,51 @@ class SingleThreadedWorker(Worker):
         else:
             return None
 
+    def _get_group_actions(self, group, env_states, use_exploration):
+        """
+        Preprocesses the current states of a group of environments and computes their actions.
+
+        Args:
+            group (tuple): Indices of the environments.
+            env_states (list): Current states of all environments.
+            use_exploration (bool): Whether to use exploration when picking actions.
+
+        Returns:
+            tuple: Preprocessed states and actions of the group's environments.
+        """
+        if self.worker_executes_preprocessing:
+            if self.batch_preprocessor is not None:
+                indices = [i for i in group if self.state_is_preprocessed[self.env_ids[i]] is False]
+                if len(indices) > 0:
+                    self.preprocessed_states_buffer[indices] = self.batch_preprocessor.preprocess(
+                        np.array([env_states[i] for i in indices]), indices
+                    )
+                    for i in indices:
+                        self.state_is_preprocessed[self.env_ids[i]] = True
+            else:
+                for i in group:
+                    env_id = self.env_ids[i]
+                    state = self.agent.state_space.force_batch(env_states[i])
+                    if self.preprocessors[env_id] is not None:
+                        if self.state_is_preprocessed[env_id] is False:
+                            self.preprocessed_states_buffer[i] = self.preprocessors[env_id].preprocess(state)
+                            self.state_is_preprocessed[env_id] = True
+                    else:
+                        self.preprocessed_states_buffer[i] = env_states[i]
+            # Indexing copies the group's states out of the buffer.
+            preprocessed_states = self.preprocessed_states_buffer[list(group)]
+            # TODO extra returns when worker is not applying preprocessing.
+            actions = self.agent.get_action(
+                states=preprocessed_states, use_exploration=use_exploration,
+                apply_preprocessing=self.apply_preprocessing
+            )
+        else:
+            preprocessed_states, actions = self.agent.get_action(
+                states=np.array([env_states[i] for i in group]), use_exploration=use_exploration,
+                apply_preprocessing=True, extra_returns="preprocessed_states"
+            )
+        return preprocessed_states, actions
+
     def execute_timesteps(self, num_timesteps, max_timesteps_per_episode=0, update_spec=None, use_exploration=True,
                           frameskip=None, reset=True):
         return self._execute(
@@ -184,64 +246,82 @@ class SingleThreadedWorker(Worker):
                 self.episode_starts[i] = time.perf_counter()
                 if self.worker_executes_preprocessing:
                     self.state_is_preprocessed[env_id] = False
-
-            self.env_states = self.vector_env.reset_all()
+            if self.worker_executes_preprocessing and self.batch_preprocessor is not None:
+                self.batch_preprocessor.reset()
+
+            env_states = self.vector_env.reset_all()
+            # Reset states are views into a buffer overwritten by the next step.
+            if self.vector_env.returns_state_views:
+                env_states = np.array(env_states)
+            self.env_states = list(env_states)
             self.agent.reset()
         elif self.env_states[0] is None:
             raise RLGraphError("Runner must be reset at the very beginning. Environment is in invalid state.")
 
-        # Only run everything for at most num_timesteps (if defined).
         env_states = self.env_states
-        while not (0 < num_timesteps <= timesteps_executed):
-            if self.render:
-                # This renders the first underlying environment.
-                self.vector_env.render()
-
-            if self.worker_executes_preprocessing:
-                for i, env_id in enumerate(self.env_ids):
-                    state = self.agent.state_space.force_batch(env_states[i])
-                    if self.preprocessors[env_id] is not None:
-                        if self.state_is_preprocessed[env_id] is False:
-                            self.preprocessed_states_buffer[i] = self.preprocessors[env_id].preprocess(state)
-                            self.state_is_preprocessed[env_id] = True
-                    else:
-                        self.preprocessed_states_buffer[i] = env_states[i]
-                # TODO extra returns when worker is not applying preprocessing.
-                actions = self.agent.get_action(
-                    states=self.preprocessed_states_buffer, use_exploration=use_exploration,
-                    apply_preprocessing=self.apply_preprocessing
-                )
-                preprocessed_states = np.array(self.preprocessed_states_buffer)
-            else:
-                preprocessed_states, actions = self.agent.get_action(
-                    states=np.array(env_states), use_exploration=use_exploration,
-                    apply_preprocessing=True, extra_returns="preprocessed_states"
-                )
+        # Groups of environments with a step in flight, in the order their steps were started.
+        pending_groups = deque()
+        # Group -> preprocessed states and actions of its step in flight.
+        group_inputs = dict()
+        finished = False
+        # Only run everything for at most num_timesteps (if defined). Steps in flight when finishing are completed.
+        while pending_groups or not finished:
+            # Start stepping all groups not in flight. With double-buffered stepping, this computes the actions of
+            # one group while the other group's environments are stepped.
+            if not finished:
+                for group in self.env_groups:
+                    # Do not start steps beyond `num_timesteps`.
+                    if group in group_inputs or \
+                            0 < num_timesteps <= timesteps_executed + sum(len(g) for g in pending_groups):
+                        continue
+                    if self.render:
+                        # This renders the first underlying environment.
+                        self.vector_env.render()
+                    preprocessed_states, actions = self._get_group_actions(group, env_states, use_exploration)
+                    self.vector_env.step_async(actions=actions, indices=group)
+                    group_inputs[group] = (preprocessed_states, actions)
+                    pending_groups.append(group)
+
+            group = pending_groups.popleft()
+            preprocessed_states, actions = group_inputs.pop(group)
 
             # Accumulate the reward over n env-steps (equals one action pick). n=self.frameskip.
-            env_rewards = [0 for _ in range_(self.num_environments)]
+            env_rewards = [0 for _ in group]
             next_states = None
-            for _ in range_(frameskip):
-                next_states, step_rewards, episode_terminals, infos = self.vector_env.step(actions=actions)
-
-                self.env_frames += self.num_environments
-                for i, step_reward in enumerate(step_rewards):
-                    env_rewards[i] += step_reward
-                if np.any(episode_terminals):
+            for skip in range_(frameskip):
+                if skip > 0:
+                    self.vector_env.step_async(actions=actions, indices=group)
+                next_states, step_rewards, step_terminals, infos = self.vector_env.step_wait(indices=group)
+
+                self.env_frames += len(group)
+                for j, step_reward in enumerate(step_rewards):
+                    env_rewards[j] += step_reward
+                if np.any(step_terminals):
                     break
+            # States in a shared buffer are overwritten by the next step, but kept by the agent's buffers.
+            if self.vector_env.returns_state_views:
+                next_states = list(np.array(next_states))
+            # Preprocesses the next states of the whole group at once, which are then the group's current states.
+            batch_preprocessing = self.worker_executes_preprocessing and self.batch_preprocessor is not None
+            if batch_preprocessing:
+                preprocessed_next_states = self.batch_preprocessor.preprocess(np.array(next_states), group)
+                self.preprocessed_states_buffer[list(group)] = preprocessed_next_states
+            reset_indices = []
 
             # Only render once per action.
             if self.render:
                 self.vector_env.environments[0].render()
 
-            for i, env_id in enumerate(self.env_ids):
-                self.episode_returns[i] += env_rewards[i]
+            for j, i in enumerate(group):
+                env_id = self.env_ids[i]
+                episode_terminals[i] = step_terminals[j]
+                self.episode_returns[i] += env_rewards[j]
                 self.episode_timesteps[i] += 1
 
                 if 0 < max_timesteps_per_episode[i] <= self.episode_timesteps[i]:
                     episode_terminals[i] = True
                 if self.worker_executes_preprocessing:
-                    self.state_is_preprocessed[env_id] = False
+                    self.state_is_preprocessed[env_id] = batch_preprocessing
                 # Do accounting for finished episodes.
                 if episode_terminals[i]:
                     episodes_executed += 1
@@ -259,6 +339,8 @@ class SingleThreadedWorker(Worker):
 
                     # Reset this environment and its preprocecssor stack.
                     env_states[i] = self.vector_env.reset(i)
+                    if self.vector_env.returns_state_views:
+                        env_states[i] = np.array(env_states[i])
                     if self.worker_executes_preprocessing and self.preprocessors[env_id] is not None:
                         self.preprocessors[env_id].reset()
                         # This re-fills the sequence with the reset state.
@@ -266,30 +348,39 @@ class SingleThreadedWorker(Worker):
                         # Pre - process, add to buffer
                         self.preprocessed_states_buffer[i] = np.array(self.preprocessors[env_id].preprocess(state))
                         self.state_is_preprocessed[env_id] = True
+                    reset_indices.append(i)
 
                     self.episode_returns[i] = 0
                     self.episode_timesteps[i] = 0
                     self.episode_starts[i] = time.perf_counter()
                 else:
                     # Otherwise assign states to next states
-                    env_states[i] = next_states[i]
+                    env_states[i] = next_states[j]
 
-                if self.worker_executes_preprocessing and self.preprocessors[env_id] is not None:
+                if batch_preprocessing:
+                    next_states[j] = preprocessed_next_states[j]
+                elif self.worker_executes_preprocessing and self.preprocessors[env_id] is not None:
                     next_state = self.agent.state_space.force_batch(env_states[i])
-                    next_states[i] = np.array(self.preprocessors[env_id].preprocess(next_state))
+                    next_states[j] = np.array(self.preprocessors[env_id].preprocess(next_state))
                 # TODO: If worker does not execute preprocessing, next state is not preprocessed here.
                 # Observe per environment.
                 self.agent.observe(
-                    preprocessed_states=preprocessed_states[i], actions=actions[i], internals=[],
-                    rewards=env_rewards[i], next_states=next_states[i],
-                    terminals=episode_terminals[i], env_id=self.env_ids[i]
+                    preprocessed_states=preprocessed_states[j], actions=actions[j], internals=[],
+                    rewards=env_rewards[j], next_states=next_states[j],
+                    terminals=episode_terminals[i], env_id=env_id
+                )
+            # Re-fills the sequences of reset environments with their reset states.
+            if batch_preprocessing and len(reset_indices) > 0:
+                self.batch_preprocessor.reset(reset_indices)
+                self.preprocessed_states_buffer[reset_indices] = self.batch_preprocessor.preprocess(
+                    np.array([env_states[i] for i in reset_indices]), reset_indices
                 )
             self.update_if_necessary()
-            timesteps_executed += self.num_environments
+            timesteps_executed += len(group)
             num_timesteps_reached = (0 < num_timesteps <= timesteps_executed)
 
             if 0 < num_episodes <= episodes_executed or num_timesteps_reached:
-                break
+                finished = True
 
         total_time = (time.perf_counter() - start) or 1e-10
 
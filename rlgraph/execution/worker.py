@@ -22,7 +22,7 @@ import logging
 from six.moves import xrange as range_
 
 from rlgraph.utils.specifiable import Specifiable
-from rlgraph.environments import SequentialVectorEnv
+from rlgraph.environments import VectorEnv
 
 
 class Worker(Specifiable):
@@ -30,29 +30,46 @@ class Worker(Specifiable):
     Generic worker to locally interact with simulator environments.
     """
     def __init__(self, agent, env_spec=None, num_envs=1, frameskip=1, render=False,
-                 worker_executes_exploration=True, exploration_epsilon=0.1, episode_finish_callback=None):
+                 worker_executes_exploration=True, exploration_epsilon=0.1, episode_finish_callback=None,
+                 vector_env_spec=None, double_buffered_stepping=False):
         """
         Args:
             agent (Agent): Agent to execute environment on.
             env_spec Optional[Union[callable, dict]]): Either an environment spec or a callable returning a new
                 environment.
-            num_envs (int): How many single Environments should be run in parallel in a SequentialVectorEnv.
+            num_envs (int): How many single Environments should be run in parallel in a VectorEnv.
             frameskip (int): How often actions are repeated after retrieving them from the agent.
                 This setting can be overwritten in the single calls to the different `execute_..` methods.
             render (bool): Whether to render the environment after each action.
                 Default: False.
             worker_executes_exploration (bool): If worker executes exploration by sampling.
             exploration_epsilon (Optional[float]): Epsilon to use if worker executes exploration.
+            vector_env_spec (Optional[dict]): Spec of the VectorEnv running the environments, e.g.
+                dict(type="process-vector", num_processes=4). Defaults to a SequentialVectorEnv.
+            double_buffered_stepping (bool): If True, splits the environments into two groups and computes actions
+                for one group while the other group's environments are stepped via `VectorEnv.step_async`. Only
+                overlaps with vector envs stepping in the background, e.g. a ProcessVectorEnv.
         """
         super(Worker, self).__init__()
         self.num_environments = num_envs
         self.logger = logging.getLogger(__name__)
         if env_spec is not None:
             self.env_ids = ["env_{}".format(i) for i in range_(self.num_environments)]
-            self.vector_env = SequentialVectorEnv(env_spec=env_spec, num_envs=self.num_environments)
+            self.vector_env = VectorEnv.from_spec(
+                dict(vector_env_spec or dict(type="sequential-vector")), env_spec=env_spec,
+                num_envs=self.num_environments
+            )
+            if double_buffered_stepping:
+                assert self.num_environments >= 2, \
+                    "ERROR: Double-buffered stepping requires at least 2 environments, got {}.".format(
+                        self.num_environments)
+                self.env_groups = self.vector_env.get_env_groups(2)
+            else:
+                self.env_groups = [tuple(range_(self.num_environments))]
         else:
             self.env_ids = []
             self.vector_env = None
+            self.env_groups = []
         self.agent = agent
         self.frameskip = frameskip
         self.render = render
@@ -225,4 +225,40 @@ class TestPrioritizedReplay(unittest.TestCase):
             self.assertEqual(sum_segment_values[start], 2.0)
             # min is still 1.
             self.assertEqual(min_segment_values[start], 1.0)
-            start = int(start / 2)
\ No newline at end of file
+            start = int(start / 2)
+
+    def test_segment_tree_batch_update(self):
+        """
+        Tests that batched priority updates recompute all affected tree nodes.
+        """
+        memory = PrioritizedReplay(
+            capacity=self.capacity,
+            alpha=self.alpha,
+            beta=self.beta
+        )
+        test = ComponentTest(component=memory, input_spaces=self.input_spaces)
+        priority_capacity = 1
+        while priority_capacity < self.capacity:
+            priority_capacity *= 2
+
+        observation = non_terminal_records(self.record_space, 6)
+        test.test(("insert_records", observation), expected_outputs=None)
+        indices = np.asarray([0, 3, 4, 5])
+        priorities = np.asarray([0.5, 2.0, 0.25, 3.0])
+        test.test(("update_records", [indices, priorities]), expected_outputs=None)
+
+        memory_variables = memory.get_variables(["sum-segment-tree", "min-segment-tree"], global_scope=False)
+        sum_segment_values, min_segment_values = test.read_variable_values(
+            memory_variables["sum-segment-tree"], memory_variables["min-segment-tree"]
+        )
+        expected_sum = np.zeros(2 * priority_capacity)
+        expected_min = np.full(2 * priority_capacity, float("inf"))
+        leaves = np.ones(6)
+        leaves[indices] = priorities
+        expected_sum[priority_capacity:priority_capacity + 6] = leaves
+        expected_min[priority_capacity:priority_capacity + 6] = leaves
+        for node in range(priority_capacity - 1, 0, -1):
+            expected_sum[node] = expected_sum[2 * node] + expected_sum[2 * node + 1]
+            expected_min[node] = min(expected_min[2 * node], expected_min[2 * node + 1])
+        self.assertTrue(np.allclose(sum_segment_values[1:], expected_sum[1:]))
+        self.assertTrue(np.allclose(min_segment_values[1:], expected_min[1:]))
@@ -17,13 +17,21 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import os
+import shutil
+import tempfile
 import unittest
 import numpy as np
 from six.moves import xrange as range_
+from rlgraph.components.helpers.mem_segment_tree import NumpyMinSumSegmentTree
+from rlgraph.components.helpers.mem_snapshot import load_snapshot, write_snapshot
 from rlgraph.components.memories.mem_prioritized_replay import MemPrioritizedReplay
 from rlgraph.execution.ray.apex.apex_memory import ApexMemory
+from rlgraph.execution.ray.apex.sharded_replay_coordinator import ShardedReplayCoordinator
+from rlgraph.execution.ray.codecs import Codec
 from rlgraph.execution.ray.ray_util import ray_compress
 from rlgraph.spaces import Dict, IntBox, BoolBox, FloatBox
+from rlgraph.utils.rlgraph_errors import RLGraphError
 
 
 # TODO (Michael): Clean up memory semantics and tests re:
@@ -151,6 +159,30 @@ class TestPythonPrioritizedReplay(unittest.TestCase):
         # Does not return anything
         memory.update_records(indices, np.random.uniform(size=10))
 
+    def test_columnar_batch_insert(self):
+        """
+        Tests chunked inserts into columnar storage, including wrap-around.
+        """
+        record_space = Dict(states=FloatBox(shape=(3,)), actions=IntBox(4), rewards=float, terminals=BoolBox(),
+                            add_batch_rank=True)
+        memory = MemPrioritizedReplay(capacity=self.capacity, next_states=False, storage="columnar")
+        # Call API methods eagerly without building a graph.
+        memory.execution_mode = "define_by_run"
+        memory.create_variables(dict(records=record_space))
+        observations = [record_space.sample(size=4) for _ in range_(3)]
+        for observation in observations:
+            memory.insert_records(observation)
+        self.assertEqual(memory.index, 2)
+        self.assertEqual(memory.size, self.capacity)
+
+        # The last two records wrapped around to the start of the buffer.
+        inserted = np.concatenate([observation["states"] for observation in observations])
+        expected = np.concatenate([inserted[self.capacity:], inserted[2:self.capacity]])
+        records = memory._read_records(np.arange(self.capacity))
+        self.assertTrue(np.allclose(np.asarray(records["states"]), expected))
+        self.assertTrue(np.all(memory.merged_segment_tree.get_batch(np.arange(self.capacity)) ==
+                               memory.default_new_weight))
+
     def test_segment_tree_insert_values(self):
         """
         Tests if segment tree inserts into correct positions.
@@ -255,3 +287,402 @@ class TestPythonPrioritizedReplay(unittest.TestCase):
         self.assertEqual(tree.index_of_prefixsum(1.51), 2)
         self.assertEqual(tree.index_of_prefixsum(3.0), 3)
         self.assertEqual(tree.index_of_prefixsum(5.50), 3)
+
+    def test_batched_tree_insert_and_sample(self):
+        """
+        Tests batched inserts and batched prefix-sum sampling against the single-element tree ops.
+        """
+        tree = NumpyMinSumSegmentTree(capacity=4)
+        tree.insert_batch(np.array([0, 1, 2, 3]), np.array([0.5, 1.0, 1.0, 3.0]))
+        self.assertTrue(np.isclose(tree.sum_segment_tree.get_sum(), 5.5))
+        self.assertTrue(np.isclose(tree.min_segment_tree.get_min_value(), 0.5))
+
+        prefix_sums = np.array([0.0, 0.55, 0.99, 1.51, 3.0, 5.50])
+        indices = tree.sample_batch(prefix_sums)
+        self.assertEqual(list(indices), [0, 1, 1, 2, 3, 3])
+        for prefix_sum, index in zip(prefix_sums, indices):
+            self.assertEqual(tree.sum_segment_tree.index_of_prefixsum(prefix_sum), index)
+
+        # Overwrite a subset and compare to sequential inserts.
+        tree.insert_batch(np.array([3, 1]), np.array([0.25, 2.0]))
+        self.assertTrue(np.isclose(tree.sum_segment_tree.get_sum(), 3.75))
+        self.assertTrue(np.isclose(tree.min_segment_tree.get_min_value(), 0.25))
+        self.assertTrue(np.allclose(tree.get_batch(np.array([0, 1, 2, 3])), [0.5, 2.0, 1.0, 0.25]))
+
+    def test_apex_columnar_insert_batch(self):
+        """
+        Tests chunked inserts into the columnar Apex memory, including wrap-around.
+        """
+        memory = ApexMemory(
+            capacity=self.capacity,
+            alpha=self.alpha,
+            beta=self.beta
+        )
+        for _ in range_(3):
+            observation = self.apex_space.sample(size=4)
+            memory.insert_batch(dict(
+                states=observation["states"],
+                actions=observation["actions"],
+                rewards=observation["reward"],
+                terminals=observation["terminals"],
+                next_states=observation["states"],
+                importance_weights=observation["weights"]
+            ))
+        self.assertEqual(memory.size, self.capacity)
+        self.assertEqual(memory.index, 2)
+        self.assertEqual(memory.record_columns["states"].shape, (self.capacity, 4))
+
+        # Last two records wrapped around to the start of the buffer.
+        self.assertTrue(np.allclose(memory.record_columns["states"][:2], observation["states"][2:]))
+        self.assertTrue(np.allclose(memory.record_columns["states"][-2:], observation["states"][:2]))
+
+        batch, indices, weights = memory.get_records(5)
+        self.assertEqual(batch["states"].shape, (5, 4))
+        self.assertEqual(batch["actions"].shape, (5, 2))
+        self.assertEqual(len(indices), 5)
+        self.assertEqual(len(weights), 5)
+
+    def test_apex_chunk_compressed_insert(self):
+        """
+        Tests that states compressed as one block per chunk are stored compressed per state.
+        """
+        memory = ApexMemory(
+            capacity=self.capacity,
+            alpha=self.alpha,
+            beta=self.beta
+        )
+        observation = self.apex_space.sample(size=4)
+        states = observation["states"].astype(np.float32)
+        memory.insert_batch(dict(
+            states=memory.codec.compress_batch(states, chunked=True),
+            actions=observation["actions"],
+            rewards=observation["reward"],
+            terminals=observation["terminals"],
+            next_states=memory.codec.compress_batch(states, chunked=True),
+            importance_weights=observation["weights"]
+        ))
+        self.assertEqual(memory.record_columns["states"].dtype, object)
+        self.assertTrue(isinstance(memory.record_columns["states"][0], bytes))
+
+        records = memory.read_records(np.arange(4))
+        self.assertTrue(np.allclose(records["states"], states))
+        self.assertTrue(np.allclose(records["next_states"], states))
+
+    def test_apex_frame_storage(self):
+        """
+        Tests that frame storage rebuilds n-step states and next states across trajectory fragments
+        and removes records whose frames were overwritten.
+        """
+        frame_stack = 4
+        n_step = 2
+        memory = ApexMemory(
+            capacity=self.capacity,
+            alpha=self.alpha,
+            beta=self.beta,
+            n_step_adjustment=n_step,
+            storage="frames",
+            frame_stack=frame_stack,
+            frame_capacity=20
+        )
+        # Two fragments of one trajectory: 6 consecutive stacked states each, the first starting
+        # with a repeated reset frame as produced by the sequence preprocessor.
+        frames = [np.random.uniform(size=(3, 1)) for _ in range_(12)]
+        frames = [frames[0]] * (frame_stack - 1) + frames
+        stacks = np.array([np.concatenate(frames[i:i + frame_stack], axis=-1) for i in range_(12)])
+        states = np.concatenate([stacks[:4], stacks[6:10]])
+        next_states = np.concatenate([stacks[2:6], stacks[8:12]])
+        memory.insert_batch(dict(
+            states=states,
+            actions=np.zeros(8),
+            rewards=np.zeros(8),
+            terminals=np.zeros(8, dtype=bool),
+            next_states=next_states
+        ))
+        # 4 + 5 frames for the first fragment. The second fragment continues its last next state, so
+        # it only needs 1 + 5 new frames.
+        self.assertEqual(memory.frame_buffer.frames_written, 15)
+        records = memory.read_records(np.arange(8))
+        self.assertTrue(np.allclose(records["states"], states))
+        self.assertTrue(np.allclose(records["next_states"], next_states))
+
+        # 9 more frames overwrite the frames of the first 4 records. Records 0 and 1 are overwritten
+        # by the new records, 2 and 3 must be removed from sampling.
+        memory.insert_batch(dict(
+            states=stacks[:4],
+            actions=np.zeros(4),
+            rewards=np.zeros(4),
+            terminals=np.zeros(4, dtype=bool),
+            next_states=stacks[2:6]
+        ))
+        self.assertEqual(memory.frame_buffer.frames_written, 24)
+        self.assertEqual(memory.oldest_valid, 4)
+        self.assertTrue(np.all(memory.merged_segment_tree.get_batch(np.array([2, 3])) == 0.0))
+        batch, indices, weights = memory.get_records(20)
+        self.assertFalse(np.any(np.isin(indices, [2, 3])))
+        self.assertTrue(np.allclose(memory.read_records(np.array([0, 1]))["states"], stacks[2:4]))
+
+    def test_sharded_replay_global_weights(self):
+        """
+        Tests that shards are sampled by priority mass and importance weights of sharded memories
+        match the weights of a single memory holding all records.
+        """
+        shards = [ApexMemory(capacity=4, alpha=self.alpha, beta=self.beta) for _ in range_(2)]
+        single_memory = ApexMemory(capacity=8, alpha=self.alpha, beta=self.beta)
+        coordinator = ShardedReplayCoordinator(shards, shard_capacity=4, alpha=self.alpha)
+
+        priorities = [np.array([1.0, 2.0, 3.0, 4.0]), np.array([0.5, 0.5, 0.5, 0.5])]
+        for shard, shard_priorities in zip(shards, priorities):
+            records = dict(
+                states=np.zeros((4, 2)),
+                actions=np.zeros(4),
+                rewards=np.zeros(4),
+                terminals=np.zeros(4, dtype=bool),
+                next_states=np.zeros((4, 2)),
+                importance_weights=shard_priorities
+            )
+            self.assertIs(coordinator.route_records(4), shard)
+            shard.insert_batch(records)
+            single_memory.insert_batch(records)
+            coordinator.update_shard_stats(shard, shard.get_priority_stats())
+        # Max priorities are raised by priority updates and propagated to all shards.
+        shards[0].update_records(np.array([3]), np.array([4.0]))
+        coordinator.update_shard_stats(shards[0], shards[0].get_priority_stats())
+
+        global_stats = coordinator.get_global_stats()
+        self.assertEqual(global_stats["size"], 8)
+        self.assertAlmostEqual(global_stats["sum"], single_memory.get_priority_stats()["sum"])
+        self.assertAlmostEqual(global_stats["min"], single_memory.get_priority_stats()["min"])
+        self.assertAlmostEqual(global_stats["max"], 4.0)
+
+        # Shards are sampled proportionally to their share of the global priority mass.
+        shard_mass = shards[0].get_priority_stats()["sum"] / global_stats["sum"]
+        samples = [coordinator.sample_shard() is shards[0] for _ in range_(3000)]
+        self.assertAlmostEqual(np.mean(samples), shard_mass, delta=0.05)
+
+        # Weights of sharded records equal the weights the single memory assigns to the same priorities.
+        _, single_indices, single_weights = single_memory.get_records(100)
+        single_priorities = single_memory.merged_segment_tree.get_batch(single_indices)
+        for shard in shards:
+            _, indices, weights = shard.get_records(10, global_stats)
+            priorities = shard.merged_segment_tree.get_batch(indices)
+            for priority, weight in zip(priorities, weights):
+                self.assertTrue(np.allclose(weight, single_weights[single_priorities == priority]))
+
+    def test_sharded_replay_route_into_full_shard(self):
+        """
+        Tests that routing records into a full shard replaces priority mass instead of accumulating it.
+        """
+        shards = [ApexMemory(capacity=4, alpha=self.alpha, beta=self.beta) for _ in range_(2)]
+        coordinator = ShardedReplayCoordinator(shards, shard_capacity=4, alpha=self.alpha)
+        max_priority = coordinator.max_priority ** self.alpha
+
+        # Partially filling a shard adds the max priority mass of each record.
+        coordinator.route_records(3, shard=shards[0])
+        self.assertAlmostEqual(coordinator.priority_sums[0], 3 * max_priority)
+        self.assertEqual(coordinator.sizes[0], 3)
+
+        # Only the free slot adds mass, evicted records hold the mean priority which equals the max priority here.
+        coordinator.route_records(3, shard=shards[0])
+        self.assertAlmostEqual(coordinator.priority_sums[0], 4 * max_priority)
+        self.assertEqual(coordinator.sizes[0], 4)
+
+        # Repeated batches into the full shard never exceed the mass of a shard holding only max priorities.
+        for _ in range_(10):
+            coordinator.route_records(2, shard=shards[0])
+        self.assertAlmostEqual(coordinator.priority_sums[0], 4 * max_priority)
+
+        # After a report of lower priorities, evicted records are replaced by max priority records.
+        coordinator.update_shard_stats(shards[0], dict(sum=2.0, min=0.5, max=coordinator.max_priority, size=4))
+        coordinator.route_records(2, shard=shards[0])
+        self.assertAlmostEqual(coordinator.priority_sums[0], 2.0 + 2 * (max_priority - 0.5))
+        self.assertEqual(coordinator.sizes[0], 4)
+
+        # A batch larger than the shard replaces all of its records.
+        coordinator.route_records(6, shard=shards[0])
+        self.assertAlmostEqual(coordinator.priority_sums[0], 4 * max_priority)
+        self.assertEqual(coordinator.get_global_stats()["size"], 4)
+
+    def test_apex_memmap_storage(self):
+        """
+        Tests that memmap storage returns the same records as columnar storage, including compressed states.
+        """
+        memmap_dir = tempfile.mkdtemp()
+        try:
+            codec = Codec.from_spec("none")
+            memory = ApexMemory(capacity=self.capacity, alpha=self.alpha, beta=self.beta, codec=codec,
+                                storage="memmap", memmap_dir=memmap_dir)
+            columnar_memory = ApexMemory(capacity=self.capacity, alpha=self.alpha, beta=self.beta, codec=codec)
+            for _ in range_(3):
+                observation = self.apex_space.sample(size=4)
+                records = dict(
+                    states=codec.compress_batch(observation["states"]),
+                    actions=observation["actions"],
+                    rewards=observation["reward"],
+                    terminals=observation["terminals"],
+                    next_states=codec.compress_batch(observation["states"]),
+                    importance_weights=observation["weights"]
+                )
+                memory.insert_batch(records)
+                columnar_memory.insert_batch(records)
+            self.assertEqual(memory.size, self.capacity)
+            self.assertEqual(memory.index, 2)
+
+            # Unsorted indices with duplicates.
+            indices = np.array([7, 1, 7, 0, 9])
+            records = memory.read_records(indices)
+            expected = columnar_memory.read_records(indices)
+            for name in ApexMemory.record_fields:
+                self.assertTrue(np.allclose(records[name], expected[name]))
+        finally:
+            shutil.rmtree(memmap_dir)
+
+    def test_apex_memmap_row_width(self):
+        """
+        Tests that memmap rows fit incompressible states and temporary record files are removed on close.
+        """
+        memory = ApexMemory(capacity=self.capacity, alpha=self.alpha, beta=self.beta, storage="memmap")
+        small_states = np.zeros((4, 64), dtype=np.uint8)
+        memory.insert_batch(dict(
+            states=memory.codec.compress_batch(small_states),
+            actions=np.zeros((4, 2)),
+            rewards=np.zeros(4),
+            terminals=np.zeros(4, dtype=np.bool_),
+            next_states=memory.codec.compress_batch(small_states)
+        ))
+        self.assertGreaterEqual(memory.record_columns["states"].shape[1], 64)
+
+        # Random states do not compress, their compressed values must still fit the rows.
+        states = np.random.randint(0, 256, size=(4, 64), dtype=np.uint8)
+        memory.insert_batch(dict(
+            states=memory.codec.compress_batch(states),
+            actions=np.zeros((4, 2)),
+            rewards=np.zeros(4),
+            terminals=np.zeros(4, dtype=np.bool_),
+            next_states=memory.codec.compress_batch(states)
+        ))
+        self.assertTrue(np.array_equal(memory.read_records(np.arange(4, 8))["states"], states))
+
+        directory = memory.record_storage.directory
+        self.assertTrue(os.path.exists(directory))
+        memory.record_storage.close()
+        self.assertFalse(os.path.exists(directory))
+
+    def test_apex_memory_snapshot(self):
+        """
+        Tests saving and restoring records, priorities and indices of Apex memories.
+        """
+        snapshot_dir = tempfile.mkdtemp()
+        try:
+            for storage in ["columnar", "list", "memmap"]:
+                path = os.path.join(snapshot_dir, storage + ".snapshot")
+                kwargs = dict(capacity=self.capacity, alpha=self.alpha, beta=self.beta, codec="none",
+                              storage=storage)
+                memory = ApexMemory(**kwargs)
+                for _ in range_(3):
+                    observation = self.apex_space.sample(size=4)
+                    memory.insert_batch(dict(
+                        states=memory.codec.compress_batch(observation["states"]),
+                        actions=observation["actions"],
+                        rewards=observation["reward"],
+                        terminals=observation["terminals"],
+                        next_states=memory.codec.compress_batch(observation["states"]),
+                        importance_weights=observation["weights"]
+                    ))
+                memory.update_records(np.array([1, 2]), np.array([5.0, 0.1]))
+                # Records are copied by the writer thread, which waits while the memory's lock is held.
+                with memory.lock:
+                    snapshot = memory.save(path, background=True)
+                    self.assertTrue(snapshot.is_alive())
+                snapshot.join()
+
+                restored = ApexMemory(**kwargs)
+                restored.load(path)
+                self.assertEqual(restored.index, memory.index)
+                self.assertEqual(restored.size, memory.size)
+                self.assertEqual(restored.max_priority, 5.0)
+                indices = np.arange(self.capacity)
+                self.assertTrue(np.allclose(restored.merged_segment_tree.get_batch(indices),
+                                            memory.merged_segment_tree.get_batch(indices)))
+                records = restored.read_records(indices)
+                expected = memory.read_records(indices)
+                for name in ApexMemory.record_fields:
+                    self.assertTrue(np.allclose(records[name], expected[name]))
+        finally:
+            shutil.rmtree(snapshot_dir)
+
+    def test_apex_memory_background_snapshot_with_inserts(self):
+        """
+        Tests that a background snapshot holds the memory as of the save while inserts overwrite its rows.
+        """
+        snapshot_dir = tempfile.mkdtemp()
+        try:
+            for storage in ["columnar", "list", "memmap"]:
+                path = os.path.join(snapshot_dir, storage + ".snapshot")
+                kwargs = dict(capacity=self.capacity, alpha=self.alpha, beta=self.beta, codec="none",
+                              storage=storage)
+                memory = ApexMemory(**kwargs)
+
+                def insert():
+                    observation = self.apex_space.sample(size=4)
+                    memory.insert_batch(dict(
+                        states=memory.codec.compress_batch(observation["states"]),
+                        actions=observation["actions"],
+                        rewards=observation["reward"],
+                        terminals=observation["terminals"],
+                        next_states=memory.codec.compress_batch(observation["states"]),
+                        importance_weights=observation["weights"]
+                    ))
+
+                for _ in range_(3):
+                    insert()
+                indices = np.arange(self.capacity)
+                expected = memory.read_records(indices)
+                expected_priorities = memory.merged_segment_tree.get_batch(indices)
+                expected_index = memory.index
+
+                # Inserts overwrite every row before the writer thread copies any.
+                with memory.lock:
+                    snapshot = memory.save(path, background=True)
+                    for _ in range_(3):
+                        insert()
+                snapshot.join()
+
+                restored = ApexMemory(**kwargs)
+                restored.load(path)
+                self.assertEqual(restored.index, expected_index)
+                self.assertEqual(restored.size, self.capacity)
+                self.assertTrue(np.allclose(restored.merged_segment_tree.get_batch(indices), expected_priorities))
+                records = restored.read_records(indices)
+                for name in ApexMemory.record_fields:
+                    self.assertTrue(np.allclose(records[name], expected[name]))
+
+            memory = ApexMemory(capacity=self.capacity, storage="frames", codec="none")
+            self.assertRaises(RLGraphError, memory.save, os.path.join(snapshot_dir, "frames.snapshot"),
+                              background=True)
+        finally:
+            shutil.rmtree(snapshot_dir)
+
+    def test_snapshot_chunk_encodings(self):
+        """
+        Tests writing numeric arrays and object arrays of bytes or equally shaped values without pickling.
+        """
+        snapshot_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(snapshot_dir, "arrays.snapshot")
+            values = np.empty(3, dtype=object)
+            values[:] = [np.arange(2), np.arange(2, 4), np.arange(4, 6)]
+            compressed = np.array([b"a", b"", b"\x00bc\x00"], dtype=object)
+            write_snapshot(path, dict(size=3), dict(numeric=np.arange(12).reshape((6, 2)), values=values,
+                                                    compressed=compressed), compression="zlib")
+            metadata, arrays = load_snapshot(path)
+            self.assertEqual(metadata, dict(size=3))
+            self.assertTrue(np.array_equal(arrays["numeric"], np.arange(12).reshape((6, 2))))
+            self.assertEqual([list(value) for value in arrays["values"]], [[0, 1], [2, 3], [4, 5]])
+            self.assertEqual(list(arrays["compressed"]), [b"a", b"", b"\x00bc\x00"])
+
+            # Arbitrary objects would require pickling.
+            objects = np.empty(1, dtype=object)
+            objects[0] = dict(a=1)
+            self.assertRaises(RLGraphError, write_snapshot, path, dict(), dict(objects=objects))
+        finally:
+            shutil.rmtree(snapshot_dir)
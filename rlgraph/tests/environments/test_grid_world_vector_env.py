@@ -0,0 +1,98 @@
+# Copyright 2018 The RLgraph authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import unittest
+
+import numpy as np
+
+from rlgraph.agents.random_agent import RandomAgent
+from rlgraph.environments import GridWorld, GridWorldVectorEnv, SequentialVectorEnv, VectorEnv
+from rlgraph.execution.single_threaded_worker import SingleThreadedWorker
+from rlgraph.utils.rlgraph_errors import RLGraphError
+
+
+class TestGridWorldVectorEnv(unittest.TestCase):
+    """
+    Tests stepping grid worlds with array operations against stepping `GridWorld`s one by one.
+    """
+    def _run(self, vector_env, actions):
+        results = [(np.array(vector_env.reset_all()), None, None)]
+        for step_actions in actions:
+            next_states, rewards, terminals, _ = vector_env.step(step_actions)
+            results.append((np.array(next_states), list(rewards), list(terminals)))
+            for i, terminal in enumerate(terminals):
+                if terminal:
+                    vector_env.reset(i)
+        return results
+
+    def test_matches_grid_world(self):
+        num_envs = 8
+        actions = np.random.RandomState(10).randint(0, 4, size=(200, num_envs))
+        for env_spec in [dict(type="grid-world", world="4x4"),
+                         dict(type="grid-world", world="16x16", reward_function="rich"),
+                         dict(type="grid-world", world="2x2", state_representation="cam")]:
+            expected = self._run(SequentialVectorEnv(num_envs=num_envs, env_spec=env_spec), actions)
+            actual = self._run(GridWorldVectorEnv(num_envs=num_envs, env_spec=env_spec), actions)
+            for (expected_states, expected_rewards, expected_terminals), (states, rewards, terminals) in \
+                    zip(expected, actual):
+                self.assertTrue(np.array_equal(states, expected_states))
+                self.assertEqual(rewards, expected_rewards)
+                self.assertEqual(terminals, expected_terminals)
+
+    def test_step_async_groups_and_spec(self):
+        vector_env = VectorEnv.from_spec(dict(type="grid-world-vector"), num_envs=4,
+                                         env_spec=dict(type="grid-world", world="2x2"))
+        self.assertIsInstance(vector_env, GridWorldVectorEnv)
+        group_a, group_b = vector_env.get_env_groups(2)
+        vector_env.reset_all()
+        # Group a moves down, then right into the goal. Group b moves right into the hole.
+        vector_env.step_async([2, 2], indices=group_a)
+        vector_env.step_async([1, 1], indices=group_b)
+        states, rewards, terminals, _ = vector_env.step_wait(indices=group_b)
+        self.assertEqual(list(states), [2, 2])
+        self.assertEqual(list(terminals), [True, True])
+        states, rewards, terminals, _ = vector_env.step_wait(indices=group_a)
+        self.assertEqual(list(states), [1, 1])
+        states, rewards, terminals, _ = vector_env.step([1, 1, 0, 0])
+        self.assertEqual(list(states), [3, 3, 2, 2])
+        self.assertEqual(list(rewards), [1, 1, -5, -5])
+        self.assertEqual(vector_env.reset(2), 0)
+        self.assertEqual(list(vector_env.positions), [3, 3, 0, 2])
+        self.assertEqual(vector_env.get_reset_metrics()["resets"], 5)
+
+        self.assertRaises(RLGraphError, GridWorldVectorEnv, num_envs=2, env_spec=dict(type="grid-world",
+                                                                                      world="8x16"))
+
+    def test_worker(self):
+        env_spec = dict(type="grid-world", world="4x4")
+        agent = RandomAgent(
+            action_space=GridWorld.from_spec(env_spec).action_space,
+            state_space=GridWorld.from_spec(env_spec).state_space
+        )
+        worker = SingleThreadedWorker(
+            env_spec=env_spec,
+            agent=agent,
+            num_envs=16,
+            worker_executes_preprocessing=False,
+            vector_env_spec=dict(type="grid-world-vector"),
+            double_buffered_stepping=True
+        )
+        result = worker.execute_timesteps(1000)
+        self.assertEqual(result['timesteps_executed'], 1000)
+        self.assertGreater(result['episodes_executed'], 0)
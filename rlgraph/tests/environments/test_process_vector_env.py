@@ -0,0 +1,105 @@
+# Copyright 2018 The RLgraph authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import unittest
+
+import numpy as np
+
+from rlgraph.environments import ProcessVectorEnv, SequentialVectorEnv, VectorEnv
+
+
+class TestProcessVectorEnv(unittest.TestCase):
+    """
+    Tests stepping environments in worker processes against stepping them sequentially.
+    """
+    env_spec = dict(type="grid-world", world="2x2")
+    # Down, right (goal), right (hole), left (wall), down, up.
+    actions = [2, 1, 1, 3, 2, 0]
+
+    def _run(self, vector_env, num_envs):
+        results = [(np.array(vector_env.reset_all()), None, None)]
+        for step in range(len(self.actions)):
+            # Every env takes a differently shifted action sequence.
+            actions = [self.actions[(step + i) % len(self.actions)] for i in range(num_envs)]
+            next_states, rewards, terminals, _ = vector_env.step(actions)
+            results.append((np.array(next_states), rewards, terminals))
+            for i, terminal in enumerate(terminals):
+                if terminal:
+                    self.assertEqual(vector_env.reset(i), 0)
+        return results
+
+    def test_matches_sequential_vector_env(self):
+        num_envs = 5
+        sequential_env = SequentialVectorEnv(num_envs=num_envs, env_spec=self.env_spec)
+        process_env = ProcessVectorEnv(num_envs=num_envs, env_spec=self.env_spec, num_processes=2)
+        try:
+            self.assertEqual(process_env.env_groups, [[0, 1, 2], [3, 4]])
+            expected = self._run(sequential_env, num_envs)
+            actual = self._run(process_env, num_envs)
+            for (expected_states, expected_rewards, expected_terminals), (states, rewards, terminals) in \
+                    zip(expected, actual):
+                self.assertEqual(list(states), list(expected_states))
+                self.assertEqual(rewards, expected_rewards)
+                self.assertEqual(terminals, expected_terminals)
+        finally:
+            process_env.terminate()
+
+    def test_async_reset_and_spec(self):
+        vector_env = VectorEnv.from_spec(dict(type="process-vector", num_processes=2, async_reset=True),
+                                         num_envs=2, env_spec=self.env_spec)
+        try:
+            self.assertIsInstance(vector_env, ProcessVectorEnv)
+            states = vector_env.reset_all()
+            self.assertEqual(list(states), [0, 0])
+            # Env 0 reaches the goal, env 1 moves down.
+            states, rewards, terminals, _ = vector_env.step([2, 2])
+            states, rewards, terminals, _ = vector_env.step([1, 0])
+            self.assertEqual(terminals, [True, False])
+            self.assertEqual(list(states), [3, 0])
+            # The terminated env was reset in the background.
+            self.assertEqual(vector_env.reset(0), 0)
+            # Returned states are views into the shared buffer.
+            self.assertEqual(list(vector_env.states), [0, 0])
+        finally:
+            vector_env.terminate()
+
+    def test_step_async_groups(self):
+        # All environments share one process, so replies of one group are received while waiting on another.
+        vector_env = ProcessVectorEnv(num_envs=4, env_spec=self.env_spec, num_processes=1)
+        try:
+            group_a, group_b = vector_env.get_env_groups(2)
+            self.assertEqual((group_a, group_b), ((0, 1), (2, 3)))
+            vector_env.reset_all()
+            # Group a moves down, group b against the wall.
+            vector_env.step_async([2, 2], indices=group_a)
+            vector_env.step_async([0, 0], indices=group_b)
+            states, rewards, terminals, _ = vector_env.step_wait(indices=group_b)
+            self.assertEqual(list(states), [0, 0])
+            self.assertEqual(terminals, [False, False])
+
+            # Step b again and reset one of its environments while a is still in flight.
+            self.assertEqual(vector_env.reset(2), 0)
+            vector_env.step_async([2, 0], indices=group_b)
+            states, rewards, terminals, _ = vector_env.step_wait(indices=group_a)
+            self.assertEqual(list(states), [1, 1])
+            states, rewards, terminals, _ = vector_env.step_wait(indices=group_b)
+            self.assertEqual(list(states), [1, 0])
+            self.assertEqual(vector_env.replies, dict())
+        finally:
+            vector_env.terminate()
@@ -0,0 +1,111 @@
+# Copyright 2018 The RLgraph authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import time
+import unittest
+
+from rlgraph.environments import GridWorld, SequentialVectorEnv
+from rlgraph.environments.reset_pool import ResetPool
+from rlgraph.utils.rlgraph_errors import RLGraphError
+
+
+class SlowResetGridWorld(GridWorld):
+    """
+    GridWorld with an expensive reset, like a long no-op sequence.
+    """
+    def __init__(self, reset_time=0.2, fail_reset=False):
+        self.reset_time = reset_time
+        self.fail_reset = fail_reset
+        # Resets once on construction.
+        self.initialized = False
+        super(SlowResetGridWorld, self).__init__(world="2x2")
+        self.initialized = True
+
+    def reset(self, randomize=False):
+        if self.initialized:
+            time.sleep(self.reset_time)
+        if self.fail_reset and self.initialized:
+            raise ValueError("Reset failed.")
+        return super(SlowResetGridWorld, self).reset(randomize)
+
+
+class TestResetPool(unittest.TestCase):
+    """
+    Tests resetting environments in the background.
+    """
+    def test_swap_for_spare_env(self):
+        pool = ResetPool(env_spec=SlowResetGridWorld, num_spare_envs=2, num_threads=2)
+        try:
+            # Wait for the spares to be reset.
+            time.sleep(0.5)
+            env = SlowResetGridWorld()
+            env.step(2)
+
+            start = time.perf_counter()
+            state, ready_env = pool.swap(env)
+            self.assertLess(time.perf_counter() - start, 0.1)
+            self.assertEqual(state, 0)
+            self.assertIsNot(ready_env, env)
+
+            metrics = pool.get_metrics()
+            self.assertEqual(metrics["resets"], 1)
+            self.assertEqual(metrics["reset_stalls"], 0)
+
+            # Both spares are taken or being reset, the next swaps wait on resets.
+            pool.swap(ready_env)
+            pool.swap(ready_env)
+            metrics = pool.get_metrics()
+            self.assertEqual(metrics["resets"], 3)
+            self.assertGreaterEqual(metrics["reset_stalls"], 1)
+            self.assertGreater(metrics["max_reset_stall_time"], 0.0)
+        finally:
+            pool.terminate()
+
+    def test_reset_errors_and_timeout(self):
+        pool = ResetPool(env_spec=SlowResetGridWorld, num_spare_envs=1, timeout=1.0)
+        try:
+            # Receives the spare while the failing environment is reset in the background.
+            state, ready_env = pool.swap(SlowResetGridWorld(fail_reset=True))
+            self.assertEqual(state, 0)
+            # The reset error is raised by the next swap, which leaves the caller's environment with the caller.
+            self.assertRaises(ValueError, pool.swap, ready_env)
+            self.assertNotIn(ready_env, list(pool.in_need_reset.queue))
+            # The failed environment was replaced, so the pool keeps serving environments.
+            state, new_env = pool.swap(ready_env)
+            self.assertEqual(state, 0)
+            self.assertIsNot(new_env, ready_env)
+        finally:
+            pool.terminate()
+
+        pool = ResetPool(env_spec=lambda: SlowResetGridWorld(reset_time=2.0), num_spare_envs=1, timeout=0.5)
+        try:
+            # The spare is still being reset.
+            self.assertRaises(RLGraphError, pool.swap, SlowResetGridWorld())
+        finally:
+            pool.terminate()
+
+    def test_sequential_vector_env_async_reset(self):
+        vector_env = SequentialVectorEnv(num_envs=2, env_spec=dict(type="grid-world", world="2x2"),
+                                         num_background_envs=2, async_reset=True)
+        self.assertIsInstance(vector_env.resetter, ResetPool)
+        self.assertEqual(vector_env.reset_all(), [0, 0])
+        vector_env.step([2, 2])
+        self.assertEqual(vector_env.reset(1), 0)
+        self.assertEqual(vector_env.get_reset_metrics()["resets"], 3)
+        vector_env.terminate()
@@ -0,0 +1,68 @@
+# Copyright 2018 The RLgraph authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import unittest
+
+from rlgraph.execution.ray.apex.sharded_replay_coordinator import ShardedReplayCoordinator
+from rlgraph.execution.ray.placement import ActorPlacement
+
+
+class TestActorPlacement(unittest.TestCase):
+    """
+    Tests packing replay shards onto worker nodes and assigning workers to shards on their node.
+    """
+    def test_num_shards_per_host(self):
+        placement = ActorPlacement(workers_per_replay_shard=2)
+        worker_hosts = ["node-a", "node-b", "node-a", "node-a", "node-c"]
+        self.assertEqual(dict(placement.get_num_shards_per_host(worker_hosts)),
+                         {"node-a": 2, "node-b": 1, "node-c": 1})
+
+    def test_workers_assigned_to_local_shards(self):
+        placement = ActorPlacement(workers_per_replay_shard=2)
+        placement.add_shard("shard-a0", "node-a")
+        placement.add_shard("shard-a1", "node-a")
+        placement.add_shard("shard-b0", "node-b")
+
+        shards = [placement.add_worker(worker, "node-a") for worker in ["w0", "w1", "w2", "w3"]]
+        # Workers on a node are spread evenly over its shards.
+        self.assertEqual(sorted(shards), ["shard-a0", "shard-a0", "shard-a1", "shard-a1"])
+        self.assertEqual(placement.add_worker("w4", "node-b"), "shard-b0")
+
+        # A worker on a node without shards goes to the least loaded shard.
+        self.assertEqual(placement.add_worker("w5", "node-c"), "shard-b0")
+        self.assertEqual(placement.get_shard("w5"), "shard-b0")
+
+        metrics = placement.get_metrics()
+        self.assertEqual(metrics["workers_per_shard"], [2, 2, 2])
+        self.assertEqual(metrics["num_local_assignments"], 5)
+
+        # Removed workers free their slot for replacements.
+        placement.remove_worker("w0")
+        placement.remove_worker("w2")
+        self.assertIsNone(placement.get_shard("w0"))
+        self.assertEqual(placement.add_worker("w6", "node-a"), "shard-a0")
+        self.assertEqual(placement.add_worker("w7", "node-a"), "shard-a0")
+
+    def test_coordinator_routes_to_assigned_shard(self):
+        coordinator = ShardedReplayCoordinator(shards=["shard-0", "shard-1"], shard_capacity=100)
+        self.assertEqual(coordinator.route_records(10, shard="shard-1"), "shard-1")
+        self.assertEqual(list(coordinator.num_routed), [0, 10])
+        self.assertEqual(list(coordinator.sizes), [0, 10])
+        # Unassigned batches still balance shards.
+        self.assertEqual(coordinator.route_records(5), "shard-0")
@@ -0,0 +1,64 @@
+# Copyright 2018 The RLgraph authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import unittest
+
+import numpy as np
+
+from rlgraph import get_backend
+from rlgraph.execution.ray import RayWorker
+from rlgraph.tests.test_util import config_from_path
+
+
+class TestAsyncSampleProcessing(unittest.TestCase):
+    """
+    Tests computing sample priorities in a background thread of a worker, run locally without Ray.
+    """
+    env_spec = dict(type="grid-world", world="2x2", save_mode=False)
+
+    def _get_worker(self, async_sample_processing):
+        agent_config = config_from_path("configs/apex_agent_for_2x2_gridworld.json")
+        # TODO remove after unified backends
+        if get_backend() == "pytorch":
+            agent_config["memory_spec"]["type"] = "mem_prioritized_replay"
+        worker_spec = agent_config["execution_spec"].pop("ray_spec")["worker_spec"]
+        worker_spec.update(worker_sample_size=50, worker_computes_weights=True, codec=None,
+                           async_sample_processing=async_sample_processing)
+        return RayWorker(agent_config, worker_spec, self.env_spec, auto_build=True)
+
+    def test_async_sample_processing(self):
+        worker = self._get_worker(async_sample_processing=True)
+        for _ in range(3):
+            sample, batch_size = worker.execute_and_get_with_count()
+            batch = sample.get_batch()
+            self.assertEqual(batch_size, 50)
+            self.assertEqual(batch["states"].shape, (50, 4))
+            # Priorities are computed from TD-errors.
+            self.assertFalse(np.allclose(batch["importance_weights"], 1.0))
+            # One chunk is always being processed in the background.
+            self.assertEqual(worker.num_pending_samples, 1)
+            # Metrics describe the collection of the returned chunk only.
+            self.assertEqual(sample.metrics["timesteps_executed"], 50)
+        self.assertEqual(worker.get_workload_statistics()["worker_steps"], 200)
+
+    def test_sync_sample_processing(self):
+        worker = self._get_worker(async_sample_processing=False)
+        sample, batch_size = worker.execute_and_get_with_count()
+        self.assertEqual(batch_size, 50)
+        self.assertEqual(worker.get_workload_statistics()["worker_steps"], 50)
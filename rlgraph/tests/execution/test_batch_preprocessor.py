@@ -0,0 +1,70 @@
+# Copyright 2018 The RLgraph authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import unittest
+
+import numpy as np
+
+from rlgraph.execution.batch_preprocessor import BatchPreprocessor
+from rlgraph.execution.single_threaded_worker import SingleThreadedWorker
+from rlgraph.spaces import IntBox
+from rlgraph.tests.test_util import config_from_path
+from rlgraph.utils.rlgraph_errors import RLGraphError
+
+
+class TestBatchPreprocessor(unittest.TestCase):
+    """
+    Tests batch preprocessing against one Python preprocessor stack per environment.
+    """
+    num_envs = 3
+    in_space = IntBox(256, shape=(210, 160, 3), dtype="uint8")
+
+    def test_matches_preprocessor_stacks(self):
+        preprocessing_spec = config_from_path("configs/ray_apex_for_pong.json")["preprocessing_spec"]
+        batch_preprocessor = BatchPreprocessor(preprocessing_spec, num_envs=self.num_envs)
+        preprocessors = [SingleThreadedWorker.setup_preprocessor(preprocessing_spec, self.in_space.with_batch_rank())
+                         for _ in range(self.num_envs)]
+
+        for step in range(6):
+            states = self.in_space.sample(size=self.num_envs)
+            # Resets env 1 after the third step.
+            if step == 3:
+                batch_preprocessor.reset([1])
+                preprocessors[1].reset()
+            # Only envs 0 and 1 are stepped in odd steps.
+            env_indices = [0, 1] if step % 2 == 1 else [0, 1, 2]
+            batch_states = batch_preprocessor.preprocess(states[env_indices], env_indices)
+            for j, i in enumerate(env_indices):
+                expected = np.asarray(preprocessors[i].preprocess(states[i:i + 1]))[0]
+                self.assertEqual(batch_states[j].shape, expected.shape)
+                self.assertTrue(np.allclose(batch_states[j], expected))
+
+    def test_resize_in_chunks_and_unsupported_layers(self):
+        # 300 RGB images exceed the max number of channels of a single cv2 call.
+        batch_preprocessor = BatchPreprocessor([dict(type="image_resize", width=8, height=6)], num_envs=300)
+        images = IntBox(256, shape=(20, 10, 3), dtype="uint8").sample(size=300)
+        resized = batch_preprocessor.preprocess(images)
+        self.assertEqual(resized.shape, (300, 6, 8, 3))
+        preprocessor = SingleThreadedWorker.setup_preprocessor(
+            [dict(type="image_resize", width=8, height=6)], IntBox(256, shape=(20, 10, 3), add_batch_rank=True)
+        )
+        self.assertTrue(np.array_equal(resized[299], np.asarray(preprocessor.preprocess(images[299:]))[0]))
+
+        self.assertRaises(RLGraphError, BatchPreprocessor, [dict(type="image_crop", x=0, y=0, width=4, height=4)],
+                          num_envs=1)
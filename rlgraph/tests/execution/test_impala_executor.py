@@ -0,0 +1,73 @@
+# Copyright 2018 The RLgraph authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import unittest
+
+from rlgraph.agents.impala_agent import IMPALAAgent
+from rlgraph.execution.ray.impala import IMPALAExecutor
+from rlgraph.tests.test_util import config_from_path
+
+
+class TestIMPALAExecutor(unittest.TestCase):
+    """
+    Tests the IMPALAExecutor which runs IMPALA actors and a learner via Ray.
+    """
+    environment_spec = dict(
+        type="deepmind-lab", level_id="seekavoid_arena_01", observations=["RGB_INTERLEAVED", "INSTR"],
+        frameskip=4
+    )
+
+    def test_impala_executor_on_deepmind_lab(self):
+        """
+        Runs a short workload with two actors and checks trajectories reach the learner and weights are
+        broadcast to the actors.
+        """
+        agent_config = config_from_path("configs/impala_agent_for_deepmind_lab_env.json")
+        agent_config.update(
+            architecture="small",
+            worker_sample_size=20,
+            internal_states_space=IMPALAAgent.default_internal_states_space,
+            fifo_queue_spec=dict(capacity=8),
+            execution_spec=dict(
+                ray_spec=dict(
+                    executor_spec=dict(
+                        redis_address=None,
+                        num_cpus=4,
+                        num_gpus=0,
+                        num_sample_workers=2,
+                        env_interaction_task_depth=2,
+                        weight_sync_steps=40,
+                        trajectory_queue_size=8
+                    ),
+                    worker_spec=dict(num_trajectories_per_task=1)
+                )
+            )
+        )
+        executor = IMPALAExecutor(environment_spec=self.environment_spec, agent_config=agent_config)
+
+        result = executor.execute_workload(workload=dict(
+            num_timesteps=2000, report_interval=200, report_interval_min_seconds=1)
+        )
+        print(result)
+        self.assertGreaterEqual(result["timesteps_executed"], 2000)
+
+        learner_metrics = executor.get_learner_metrics()
+        print(learner_metrics)
+        self.assertGreater(learner_metrics["trajectories_inserted"], 0)
+        self.assertGreater(executor.weight_publisher.version, 0)
@@ -0,0 +1,50 @@
+# Copyright 2018 The RLgraph authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import unittest
+
+from rlgraph.execution.ray.ray_util import LatencyHistogram
+
+
+class TestLatencyHistogram(unittest.TestCase):
+    """
+    Tests the latency histogram of the Ape-X driver loop.
+    """
+    def test_latency_percentiles(self):
+        histogram = LatencyHistogram(min_latency=1e-3, max_latency=1.0, buckets_per_decade=1)
+        self.assertEqual(histogram.get_stats()["count"], 0)
+
+        for _ in range(90):
+            histogram.record(0.0005)
+        for _ in range(9):
+            histogram.record(0.05)
+        histogram.record(5.0)
+
+        stats = histogram.get_stats()
+        self.assertEqual(stats["count"], 100)
+        self.assertEqual(stats["bounds"], [0.001, 0.01, 0.1, 1.0])
+        self.assertEqual(stats["counts"], [90, 0, 9, 0, 1])
+        self.assertAlmostEqual(stats["p50"], 0.001)
+        self.assertAlmostEqual(stats["p90"], 0.001)
+        self.assertAlmostEqual(stats["p99"], 0.1)
+        self.assertEqual(stats["max"], 5.0)
+        self.assertAlmostEqual(stats["mean"], (90 * 0.0005 + 9 * 0.05 + 5.0) / 100)
+
+        histogram.reset()
+        self.assertEqual(histogram.get_stats()["count"], 0)
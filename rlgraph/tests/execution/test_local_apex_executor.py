@@ -0,0 +1,77 @@
+# Copyright 2018 The RLgraph authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import unittest
+
+import numpy as np
+
+from rlgraph import get_backend
+from rlgraph.execution.local import LocalApexExecutor
+from rlgraph.tests.test_util import config_from_path, recursive_assert_almost_equal
+
+
+class TestLocalApexExecutor(unittest.TestCase):
+    """
+    Tests the LocalApexExecutor which runs Apex-style workloads in local processes without Ray.
+    """
+    def test_learning_2x2_grid_world(self):
+        """
+        Tests if the local executor can learn a simple environment with two sample worker processes.
+        """
+        env_spec = dict(
+            type="grid-world",
+            world="2x2",
+            save_mode=False
+        )
+        agent_config = config_from_path("configs/apex_agent_for_2x2_gridworld.json")
+        # TODO remove after unified backends
+        if get_backend() == "pytorch":
+            agent_config["memory_spec"]["type"] = "mem_prioritized_replay"
+        agent_config["execution_spec"]["ray_spec"]["executor_spec"]["num_sample_workers"] = 2
+        executor = LocalApexExecutor(
+            environment_spec=env_spec,
+            agent_config=agent_config,
+        )
+
+        try:
+            result = executor.execute_workload(workload=dict(
+                num_timesteps=3000, report_interval=100, report_interval_min_seconds=1)
+            )
+        finally:
+            executor.terminate()
+        print(result)
+        print(executor.get_replay_metrics())
+        print(executor.get_learner_metrics())
+        self.assertGreaterEqual(result["timesteps_executed"], 3000)
+
+        print("STATES:\n{}".format(executor.local_agent.last_q_table["states"]))
+        print("\n\nQ(s,a)-VALUES:\n{}".format(np.round(executor.local_agent.last_q_table["q_values"], decimals=2)))
+
+        # Check q-table for correct values.
+        expected_q_values_per_state = {
+            (1.0, 0, 0, 0): (-1, -5, 0, -1),
+            (0, 1.0, 0, 0): (-1, 1, 0, 0)
+        }
+        for state, q_values in zip(
+                executor.local_agent.last_q_table["states"], executor.local_agent.last_q_table["q_values"]
+        ):
+            state, q_values = tuple(state), tuple(q_values)
+            assert state in expected_q_values_per_state, \
+                "ERROR: state '{}' not expected in q-table as it's a terminal state!".format(state)
+            recursive_assert_almost_equal(q_values, expected_q_values_per_state[state], decimals=0)
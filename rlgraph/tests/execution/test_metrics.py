@@ -0,0 +1,87 @@
+# Copyright 2018 The RLgraph authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import csv
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from rlgraph.execution import MetricsSink, RingBuffer
+
+
+class TestMetrics(unittest.TestCase):
+    """
+    Tests bounded metric buffers and metrics export sinks.
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_ring_buffer(self):
+        ring_buffer = RingBuffer(capacity=3)
+        self.assertIsNone(ring_buffer.mean())
+        self.assertIsNone(ring_buffer.last())
+        for value in range(5):
+            ring_buffer.append(value)
+        self.assertEqual(len(ring_buffer), 3)
+        self.assertEqual(ring_buffer.count, 5)
+        self.assertTrue(np.array_equal(ring_buffer.values(), [2, 3, 4]))
+        self.assertEqual(ring_buffer.last(), 4)
+        self.assertEqual(ring_buffer.mean(), 3.0)
+
+    def test_sinks(self):
+        records = [dict(iteration=i, throughput=np.float64(100.0 * i), reward=None, name="run") for i in range(3)]
+
+        jsonl_path = os.path.join(self.directory, "metrics.jsonl")
+        csv_path = os.path.join(self.directory, "metrics.csv")
+        prometheus_path = os.path.join(self.directory, "prom", "metrics.prom")
+        sinks = [
+            MetricsSink.from_spec(dict(type="jsonl", path=jsonl_path)),
+            MetricsSink.from_spec(dict(type="csv", path=csv_path)),
+            MetricsSink.from_spec(dict(type="prometheus", path=prometheus_path, labels=dict(run="test")))
+        ]
+        for record in records:
+            for sink in sinks:
+                sink.write(record)
+        for sink in sinks:
+            sink.close()
+
+        with open(jsonl_path) as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(lines[2]["throughput"], 200.0)
+        self.assertIsNone(lines[2]["reward"])
+
+        with open(csv_path) as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[1]["iteration"], "1")
+
+        with open(prometheus_path) as f:
+            lines = f.read().splitlines()
+        # Only numeric values of the latest record are exported.
+        self.assertIn('rlgraph_throughput{run="test"} 200.0', lines)
+        self.assertIn('rlgraph_iteration{run="test"} 2.0', lines)
+        self.assertFalse(any("reward" in line or "name" in line for line in lines))
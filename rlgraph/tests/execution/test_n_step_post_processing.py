@@ -0,0 +1,82 @@
+# Copyright 2018 The RLgraph authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import unittest
+
+import numpy as np
+
+from rlgraph.utils.n_step_util import n_step_post_process
+
+
+class TestNStepPostProcessing(unittest.TestCase):
+    """
+    Tests vectorized n-step post-processing against a record-by-record reference.
+    """
+    discount = 0.9
+
+    def _reference(self, rewards, terminals, n_step, was_terminal):
+        last = len(rewards) - 1
+        num_records = len(rewards) if was_terminal else len(rewards) - n_step + 1
+        n_step_rewards, n_step_terminals, next_state_indices = [], [], []
+        for i in range(num_records):
+            end = min(i + n_step - 1, last)
+            n_step_rewards.append(sum(self.discount ** k * rewards[i + k] for k in range(end - i + 1)))
+            n_step_terminals.append(terminals[i] or (was_terminal and end == last))
+            next_state_indices.append(end)
+        return num_records, n_step_rewards, n_step_terminals, next_state_indices
+
+    def test_terminal_segment(self):
+        rewards = np.random.uniform(-1, 1, size=10)
+        terminals = [False] * 9 + [True]
+        for n_step in [2, 3, 12]:
+            expected = self._reference(rewards, terminals, n_step, was_terminal=True)
+            num_records, n_step_rewards, n_step_terminals, next_state_indices = n_step_post_process(
+                rewards, terminals, n_step, self.discount, was_terminal=True
+            )
+            self.assertEqual(num_records, expected[0])
+            self.assertTrue(np.allclose(n_step_rewards, expected[1]))
+            self.assertEqual(list(n_step_terminals), expected[2])
+            self.assertEqual(list(next_state_indices), expected[3])
+
+    def test_non_terminal_segment(self):
+        rewards = list(np.random.uniform(-1, 1, size=10))
+        terminals = [False] * 10
+        expected = self._reference(rewards, terminals, 3, was_terminal=False)
+        num_records, n_step_rewards, n_step_terminals, next_state_indices = n_step_post_process(
+            rewards, terminals, 3, self.discount, was_terminal=False
+        )
+        self.assertEqual(num_records, 8)
+        self.assertTrue(np.allclose(n_step_rewards, expected[1]))
+        self.assertFalse(np.any(n_step_terminals))
+        self.assertEqual(list(next_state_indices), expected[3])
+
+        # Segments shorter than n yield no records.
+        num_records, n_step_rewards, _, _ = n_step_post_process([1.0, 1.0], [False, False], 3, self.discount,
+                                                                 was_terminal=False)
+        self.assertEqual(num_records, 0)
+        self.assertEqual(len(n_step_rewards), 0)
+
+    def test_one_step(self):
+        num_records, n_step_rewards, n_step_terminals, next_state_indices = n_step_post_process(
+            np.array([1, 2, 3], dtype=np.float32), [False, False, True], 1, self.discount
+        )
+        self.assertEqual(num_records, 3)
+        self.assertTrue(np.array_equal(n_step_rewards, [1.0, 2.0, 3.0]))
+        self.assertEqual(n_step_rewards.dtype, np.float32)
+        self.assertTrue(np.array_equal(next_state_indices, [0, 1, 2]))
@@ -0,0 +1,110 @@
+# Copyright 2018 The RLgraph authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import time
+import unittest
+
+import numpy as np
+
+from rlgraph.execution.environment_sample import EnvironmentSample
+from rlgraph.execution.ray.apex.ray_memory_actor import RayMemoryActor
+from rlgraph.utils.rlgraph_errors import RLGraphError
+
+
+class TestRayMemoryActor(unittest.TestCase):
+    """
+    Tests the replay actor's logic locally, i.e. without starting it as a Ray actor.
+    """
+    chunksize = 20
+
+    def _get_sample(self):
+        return EnvironmentSample(sample_batch=dict(
+            states=np.random.uniform(size=(self.chunksize, 4)),
+            actions=np.random.randint(0, 2, size=self.chunksize),
+            rewards=np.random.uniform(-2, 2, size=self.chunksize),
+            terminals=np.zeros(self.chunksize, dtype=bool),
+            next_states=np.random.uniform(size=(self.chunksize, 4))
+        ))
+
+    def _get_replay_spec(self, concurrent):
+        return dict(
+            memory_spec=dict(capacity=100),
+            min_sample_memory_size=40,
+            sample_batch_size=16,
+            codec="none",
+            concurrent=concurrent,
+            prefetch_depth=3
+        )
+
+    def test_concurrent_sampling(self):
+        """
+        Tests that the concurrent actor ingests samples in the background, serves prefetched batches and
+        applies priority updates in bulk.
+        """
+        actor = RayMemoryActor(self._get_replay_spec(concurrent=True))
+        for _ in range(5):
+            actor.observe(self._get_sample())
+
+        batch = None
+        deadline = time.time() + 10
+        while batch is None and time.time() < deadline:
+            batch = actor.get_batch()
+        self.assertIsNotNone(batch)
+        self.assertEqual(batch["states"].shape, (16, 4))
+        # Rewards are clipped on insert.
+        self.assertTrue(np.all(np.isin(batch["rewards"], [-1.0, 0.0, 1.0])))
+
+        actor.update_priorities(batch["indices"], np.full(16, 5.0))
+        actor.update_priorities(batch["indices"][:4], np.full(4, 3.0))
+        # Commands run in the memory thread after pending priority updates were applied.
+        max_priority = actor._run_in_memory_thread(lambda: actor.memory.max_priority)
+        self.assertEqual(max_priority, 5.0)
+
+        metrics = actor.get_metrics()
+        self.assertEqual(metrics["records_inserted"], 5 * self.chunksize)
+        self.assertEqual(metrics["memory_size"], 5 * self.chunksize)
+        self.assertEqual(metrics["priority_updates"], 2)
+        self.assertGreaterEqual(metrics["batches_sampled"], metrics["batches_served"])
+        self.assertLessEqual(metrics["prefetch_queue_depth"], 3)
+
+    def test_memory_thread_error(self):
+        """
+        Tests that callers waiting for the memory thread are released when it terminates.
+        """
+        actor = RayMemoryActor(self._get_replay_spec(concurrent=True))
+        # Records without rewards fail to insert.
+        actor.ingest_queue.put(EnvironmentSample(sample_batch=dict(states=np.zeros((2, 4)))))
+        with self.assertRaises(Exception):
+            actor._run_in_memory_thread(lambda: actor.memory.size)
+        actor.memory_thread.join(timeout=10)
+        self.assertFalse(actor.memory_thread.is_alive())
+        with self.assertRaises(RLGraphError):
+            actor.observe(self._get_sample())
+
+    def test_sequential_sampling(self):
+        """
+        Tests the default, sequential actor.
+        """
+        actor = RayMemoryActor(self._get_replay_spec(concurrent=False))
+        actor.observe(self._get_sample())
+        self.assertIsNone(actor.get_batch())
+        actor.observe(self._get_sample())
+        batch, stats = actor.get_batch_with_stats()
+        self.assertEqual(len(batch["indices"]), 16)
+        self.assertEqual(stats["size"], 2 * self.chunksize)
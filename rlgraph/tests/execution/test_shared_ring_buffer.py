@@ -0,0 +1,75 @@
+# Copyright 2018 The RLgraph authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import multiprocessing
+import unittest
+
+import numpy as np
+
+from rlgraph.execution.local.shared_ring_buffer import SharedRingBuffer
+
+
+def produce(ring, num_batches):
+    for i in range(num_batches):
+        ring.put(dict(states=np.full((i + 1, 2, 2), i, dtype=np.uint8), rewards=np.arange(i + 1, dtype=np.float32)))
+
+
+class TestSharedRingBuffer(unittest.TestCase):
+    """
+    Tests moving record batches between processes through a shared-memory ring buffer.
+    """
+    field_specs = dict(states=((2, 2), np.uint8), rewards=((), np.float32))
+
+    def test_put_get(self):
+        ring = SharedRingBuffer(self.field_specs, num_slots=3, slot_size=4)
+        self.assertIsNone(ring.get(timeout=0))
+
+        self.assertTrue(ring.put(dict(states=np.ones((3, 2, 2)), rewards=[1.0, 2.0, 3.0])))
+        # Occupies two slots.
+        self.assertTrue(ring.put(dict(states=np.zeros((6, 2, 2)), rewards=np.arange(6))))
+        # No free slot left.
+        self.assertFalse(ring.put(dict(states=np.zeros((1, 2, 2)), rewards=[0.0]), timeout=0))
+
+        values = ring.get(timeout=0)
+        self.assertEqual(values["states"].shape, (3, 2, 2))
+        self.assertEqual(values["states"].dtype, np.uint8)
+        self.assertTrue(np.array_equal(values["rewards"], [1.0, 2.0, 3.0]))
+        self.assertTrue(np.array_equal(ring.get(timeout=0)["rewards"], [0, 1, 2, 3]))
+        self.assertTrue(np.array_equal(ring.get(timeout=0)["rewards"], [4, 5]))
+        self.assertIsNone(ring.get(timeout=0))
+
+    def test_cross_process(self):
+        num_batches = 10
+        ring = SharedRingBuffer(self.field_specs, num_slots=3, slot_size=4)
+        producer = multiprocessing.Process(target=produce, args=(ring, num_batches))
+        producer.start()
+
+        received = []
+        while sum(len(values["rewards"]) for values in received) < num_batches * (num_batches + 1) // 2:
+            values = ring.get(timeout=30)
+            self.assertIsNotNone(values)
+            received.append(values)
+        producer.join()
+
+        rewards = np.concatenate([values["rewards"] for values in received])
+        states = np.concatenate([values["states"] for values in received])
+        expected_rewards = np.concatenate([np.arange(i + 1) for i in range(num_batches)])
+        expected_states = np.concatenate([np.full((i + 1, 2, 2), i) for i in range(num_batches)])
+        self.assertTrue(np.array_equal(rewards, expected_rewards))
+        self.assertTrue(np.array_equal(states, expected_states))
@@ -20,7 +20,7 @@ from __future__ import print_function
 import unittest
 
 from rlgraph.agents.random_agent import RandomAgent
-from rlgraph.environments import OpenAIGymEnv
+from rlgraph.environments import GridWorld, OpenAIGymEnv
 from rlgraph.execution.single_threaded_worker import SingleThreadedWorker
 
 
@@ -71,3 +71,26 @@ class TestSingleThreadedWorker(unittest.TestCase):
         self.assertEqual(result['episodes_executed'], 5)
         self.assertLessEqual(result['env_frames'], 50)
         self.assertGreaterEqual(result['runtime'], 0.0)
+
+    def test_double_buffered_stepping(self):
+        """
+        Tests stepping one half of the environments while acting on the other half.
+        """
+        env_spec = dict(type="grid-world", world="2x2")
+        agent = RandomAgent(
+            action_space=GridWorld.from_spec(env_spec).action_space,
+            state_space=GridWorld.from_spec(env_spec).state_space
+        )
+        worker = SingleThreadedWorker(
+            env_spec=env_spec,
+            agent=agent,
+            num_envs=4,
+            worker_executes_preprocessing=False,
+            double_buffered_stepping=True
+        )
+        self.assertEqual(worker.env_groups, [(0, 1), (2, 3)])
+
+        result = worker.execute_timesteps(100)
+        self.assertEqual(result['timesteps_executed'], 100)
+        self.assertEqual(result['env_frames'], 100)
+        self.assertGreater(result['episodes_executed'], 0)
@@ -0,0 +1,82 @@
+# Copyright 2018 The RLgraph authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import unittest
+
+import numpy as np
+
+from rlgraph.execution.ray.apex.apex_executor import UpdateWorker
+from rlgraph.spaces import FloatBox, IntBox
+
+
+class DummyAgent(object):
+    """
+    Records the batches it is updated with.
+    """
+    def __init__(self):
+        self.preprocessed_state_space = FloatBox(shape=(4,))
+        self.action_space = IntBox(2)
+        self.batches = []
+
+    def update(self, batch=None):
+        self.batches.append(batch)
+        return 0.0, np.ones(len(batch["indices"]))
+
+
+class TestUpdateWorker(unittest.TestCase):
+    """
+    Tests the Ape-X learner thread.
+    """
+    def test_prefetched_updates(self):
+        agent = DummyAgent()
+        update_worker = UpdateWorker(agent=agent, in_queue_size=4, num_loader_threads=2)
+        update_worker.start()
+
+        # Non-contiguous float64 states as e.g. produced by fancy indexing a Fortran-ordered array.
+        states = np.asfortranarray(np.random.uniform(size=(8, 4)))
+        batch = dict(
+            states=states,
+            actions=[0, 1] * 4,
+            rewards=np.zeros(8),
+            terminals=np.zeros(8, dtype=int),
+            next_states=states,
+            importance_weights=np.ones(8),
+            indices=np.arange(8)
+        )
+        update_worker.input_queue.put(("memory", None))
+        for _ in range(3):
+            update_worker.input_queue.put(("memory", batch))
+        results = [update_worker.output_queue.get(timeout=10) for _ in range(3)]
+
+        for memory, indices, loss_per_item in results:
+            self.assertEqual(memory, "memory")
+            self.assertTrue(np.array_equal(indices, np.arange(8)))
+        for update_batch in agent.batches:
+            self.assertTrue(update_batch["states"].flags["C_CONTIGUOUS"])
+            self.assertEqual(update_batch["states"].dtype, np.float32)
+            self.assertEqual(update_batch["actions"].dtype, np.int32)
+            self.assertEqual(update_batch["terminals"].dtype, np.bool_)
+            self.assertEqual(update_batch["rewards"].dtype, np.float32)
+
+        metrics = update_worker.get_metrics()
+        self.assertEqual(metrics["updates"], 3)
+        self.assertGreater(metrics["idle_time"], 0.0)
+        self.assertGreaterEqual(metrics["idle_fraction"], 0.0)
+        self.assertLessEqual(metrics["idle_fraction"], 1.0)
+        self.assertAlmostEqual(metrics["idle_fraction"] + metrics["compute_fraction"], 1.0)
@@ -0,0 +1,59 @@
+# Copyright 2018 The RLgraph authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import pickle
+import unittest
+
+import numpy as np
+
+from rlgraph.execution.ray.weight_sync import FlatWeights, WEIGHT_ALIGNMENT
+
+
+class TestWeightSync(unittest.TestCase):
+    """
+    Tests flattening policy weights into a single buffer.
+    """
+    def test_flat_weights(self):
+        weights = {
+            "policy/dense/kernel": np.random.uniform(size=(3, 5)).astype(np.float32),
+            "policy/dense/bias": np.random.uniform(size=5).astype(np.float32),
+            "policy/conv/kernel": np.random.uniform(size=(2, 2, 3, 4)),
+            "policy/step": np.array(7, dtype=np.int64)
+        }
+        flat_weights = FlatWeights.from_weights(weights, version=3)
+        self.assertEqual(flat_weights.buffer.dtype, np.uint8)
+        for _, _, _, offset in flat_weights.layout:
+            self.assertEqual(offset % WEIGHT_ALIGNMENT, 0)
+
+        # Round trip through serialization as done by the object store.
+        restored = pickle.loads(pickle.dumps(flat_weights))
+        self.assertEqual(restored.version, 3)
+        restored_weights = restored.to_weights()
+        self.assertEqual(sorted(restored_weights.keys()), sorted(weights.keys()))
+        for name, value in weights.items():
+            self.assertEqual(restored_weights[name].dtype, value.dtype)
+            self.assertTrue(np.array_equal(restored_weights[name], value))
+            # Views into the flat buffer, not copies.
+            self.assertTrue(np.shares_memory(restored_weights[name], restored.buffer))
+
+        # Re-flattening the same layout reuses the buffer.
+        weights["policy/dense/bias"] += 1.0
+        updated = FlatWeights.from_weights(weights, version=4, out=flat_weights)
+        self.assertIs(updated.buffer, flat_weights.buffer)
+        self.assertTrue(np.array_equal(updated.to_weights()["policy/dense/bias"], weights["policy/dense/bias"]))
@@ -0,0 +1,95 @@
+# Copyright 2018 The RLgraph authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import unittest
+
+from rlgraph.execution.ray.worker_scheduler import WorkerScheduler
+
+
+class TestWorkerScheduler(unittest.TestCase):
+    """
+    Tests throughput tracking, task depth adaption and straggler detection.
+    """
+    def _complete_tasks(self, scheduler, worker, steps, start, interval, num_tasks=5):
+        for i in range(num_tasks):
+            scheduler.task_scheduled(worker)
+            scheduler.task_completed(worker, steps, timestamp=start + i * interval)
+
+    def test_task_depth_adaption(self):
+        scheduler = WorkerScheduler(max_task_depth=3, slow_worker_fraction=0.5)
+        for worker in ["a", "b", "c"]:
+            scheduler.add_worker(worker, name=worker)
+            self.assertEqual(scheduler.get_num_tasks_to_schedule(worker), 3)
+
+        self._complete_tasks(scheduler, "a", steps=100, start=13.0, interval=1.0)
+        self._complete_tasks(scheduler, "b", steps=100, start=13.0, interval=1.0)
+        # Not enough completions to be evaluated.
+        self.assertIsNone(scheduler.get_throughput("c", now=17.0))
+        self.assertEqual(scheduler.get_throughput("a", now=17.0), 100.0)
+        self._complete_tasks(scheduler, "c", steps=100, start=1.0, interval=4.0)
+
+        self.assertEqual(scheduler.update(now=17.0), [])
+        self.assertEqual(scheduler.task_depths["c"], 2)
+        self.assertEqual(scheduler.task_depths["a"], 3)
+        scheduler.update(now=17.0)
+        scheduler.update(now=17.0)
+        self.assertEqual(scheduler.task_depths["c"], 1)
+        self.assertEqual(scheduler.num_depth_reductions, 2)
+        self.assertEqual(scheduler.get_num_tasks_to_schedule("c"), 1)
+
+        metrics = scheduler.get_metrics(now=17.0)
+        self.assertEqual(metrics["workers"]["c"]["task_depth"], 1)
+        self.assertEqual(metrics["workers"]["c"]["relative_throughput"], 0.25)
+
+        # Recovered worker gets its depth back.
+        self._complete_tasks(scheduler, "c", steps=100, start=17.1, interval=0.1, num_tasks=10)
+        scheduler.update(now=18.1)
+        self.assertEqual(scheduler.task_depths["c"], 2)
+
+    def test_straggler_replacement(self):
+        scheduler = WorkerScheduler(max_task_depth=2, replace_worker_fraction=0.2)
+        scheduler.add_worker("a", name="a", num_environments=4)
+        scheduler.add_worker("b", name="b", num_environments=4)
+        scheduler.add_worker("c", name="c", num_environments=8)
+        self._complete_tasks(scheduler, "a", steps=100, start=31.0, interval=1.0)
+        self._complete_tasks(scheduler, "b", steps=100, start=31.0, interval=1.0)
+        # Same throughput per environment as a and b.
+        self._complete_tasks(scheduler, "c", steps=200, start=31.0, interval=1.0)
+        self.assertEqual(scheduler.update(now=35.0), [])
+
+        scheduler.remove_worker("c")
+        scheduler.add_worker("c", name="c", num_environments=4)
+        self._complete_tasks(scheduler, "c", steps=100, start=1.0, interval=8.5)
+        replacements = scheduler.update(now=35.0)
+        # c is at about 0.12 of the median and gets replaced with fewer environments.
+        self.assertEqual(replacements, [("c", 1)])
+        self.assertEqual(scheduler.num_replacements, 1)
+
+        # Without other workers to compare against, no worker is a straggler.
+        scheduler.remove_worker("a")
+        scheduler.remove_worker("b")
+        self.assertEqual(scheduler.update(now=35.0), [])
+
+    def test_zero_timestamps(self):
+        scheduler = WorkerScheduler(max_task_depth=2)
+        scheduler.add_worker("a", name="a")
+        # Timestamps and evaluation times of 0 are valid monotonic times.
+        self._complete_tasks(scheduler, "a", steps=100, start=0.0, interval=1.0)
+        self.assertEqual(scheduler.get_throughput("a", now=4.0), 100.0)
+        self.assertEqual(scheduler.get_metrics(now=4.0)["workers"]["a"]["throughput"], 100.0)
@@ -0,0 +1,90 @@
+# Copyright 2018 The RLgraph authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import unittest
+
+import numpy as np
+import time
+
+from six.moves import xrange as range_
+
+from rlgraph.execution.ray import Codec
+
+
+class TestCodecPerformance(unittest.TestCase):
+    """
+    Measures throughput and compression ratio of the sample transfer codecs on Atari-shaped frame stacks.
+    """
+    # Matches the Ape-X sample chunk size and preprocessed Atari states.
+    chunksize = 50
+    num_chunks = 100
+    frame_shape = (84, 84)
+    frame_stack = 4
+
+    codecs = ["none", "lz4", "zstd", "arrow_lz4_base64"]
+
+    def _generate_chunk(self):
+        """
+        Generates a chunk of frame stacks resembling Atari screens: A static background with a few
+        moving objects, where consecutive stacks share all but one frame.
+        """
+        background = np.random.randint(0, 8, size=self.frame_shape).astype(np.uint8) * 16
+        frames = []
+        for t in range_(self.chunksize + self.frame_stack - 1):
+            frame = background.copy()
+            for obj in range_(3):
+                row = (7 * t + 23 * obj) % (self.frame_shape[0] - 4)
+                col = (5 * t + 31 * obj) % (self.frame_shape[1] - 4)
+                frame[row:row + 4, col:col + 4] = 255
+            frames.append(frame)
+        return np.array([np.stack(frames[i:i + self.frame_stack], axis=-1) for i in range_(self.chunksize)])
+
+    def test_codec_throughput(self):
+        chunks = [self._generate_chunk() for _ in range_(self.num_chunks)]
+        raw_bytes = sum(chunk.nbytes for chunk in chunks)
+
+        for codec_spec in self.codecs:
+            try:
+                codec = Codec.from_spec(codec_spec)
+                codec.compress(chunks[0][0])
+            except Exception as e:
+                print("Skipping codec {}: {}".format(codec_spec, e))
+                continue
+
+            for chunked in [False, True]:
+                start = time.monotonic()
+                compressed = [codec.compress_batch(chunk, chunked=chunked) for chunk in chunks]
+                compress_time = time.monotonic() - start
+
+                start = time.monotonic()
+                decompressed = [codec.decompress_batch(data) for data in compressed]
+                decompress_time = time.monotonic() - start
+
+                if chunked:
+                    compressed_bytes = sum(len(data) for data in compressed)
+                else:
+                    compressed_bytes = sum(sum(len(item) for item in data) for data in compressed)
+                for chunk, data in zip(chunks, decompressed):
+                    self.assertTrue(np.array_equal(chunk, data))
+
+                print("Codec: {}, chunked: {}: compress: {:.1f} MB/s, decompress: {:.1f} MB/s, "
+                      "compression ratio: {:.2f}".format(
+                        codec_spec, chunked, raw_bytes / compress_time / 1e6, raw_bytes / decompress_time / 1e6,
+                        raw_bytes / compressed_bytes
+                      ))
@@ -25,6 +25,7 @@ import time
 from six.moves import xrange as range_
 
 from rlgraph import get_distributed_backend
+from rlgraph.components.memories.mem_prioritized_replay import MemPrioritizedReplay
 from rlgraph.execution.ray.apex.apex_memory import ApexMemory
 from rlgraph.execution.ray.ray_util import ray_compress
 from rlgraph.spaces import Dict, BoolBox, FloatBox
@@ -232,6 +233,58 @@ class TestPythonMemoryPerformance(unittest.TestCase):
             len(records), tp, end
         ))
 
+    def test_rlgraph_apex_batch_insert(self):
+        """
+        Tests RLgraph's python memory performance for chunked inserts into columnar storage.
+        """
+        memory = ApexMemory(
+            capacity=self.capacity,
+            alpha=1.0
+        )
+        chunks = int(self.inserts / self.chunksize)
+        records = [self.record_space.sample(size=self.chunksize) for _ in range_(chunks)]
+        start = time.monotonic()
+        for chunk in records:
+            memory.insert_batch(dict(
+                states=chunk['states'],
+                actions=chunk['actions'],
+                rewards=chunk['reward'],
+                terminals=chunk['terminals'],
+                next_states=chunk['states']
+            ))
+        end = time.monotonic() - start
+        tp = len(records) * self.chunksize / end
+        print('#### Testing RLGraph python prioritized replay ####')
+        print('Testing columnar batch insert performance:')
+        print('Inserted {} chunks, throughput: {} records/s, total time: {} s'.format(
+            len(records), tp, end
+        ))
+
+    def test_rlgraph_mem_prioritized_replay_batch_insert(self):
+        """
+        Compares chunked inserts into list and columnar storage of the MemPrioritizedReplay.
+        """
+        chunks = int(self.inserts / self.chunksize)
+        records = [self.record_space.sample(size=self.chunksize) for _ in range_(chunks)]
+        for storage in ["list", "columnar"]:
+            memory = MemPrioritizedReplay(
+                capacity=self.capacity,
+                next_states=False,
+                alpha=self.alpha,
+                beta=self.beta,
+                storage=storage
+            )
+            memory.create_variables(dict(records=self.record_space))
+            start = time.monotonic()
+            for chunk in records:
+                memory.insert_records(chunk)
+            end = time.monotonic() - start
+            tp = len(records) * self.chunksize / end
+            print('#### Testing RLGraph MemPrioritizedReplay, storage: {} ####'.format(storage))
+            print('Inserted {} chunks, throughput: {} records/s, total time: {} s'.format(
+                len(records), tp, end
+            ))
+
     def test_rlgraph_sampling(self):
         """
         Tests RLgraph's sampling performance.
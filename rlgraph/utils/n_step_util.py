@@ -0,0 +1,78 @@
+# Copyright 2018 The RLgraph authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+from six.moves import xrange as range_
+
+
+def n_step_post_process(rewards, terminals, n_step, discount, was_terminal=True):
+    """
+    Computes n-step transitions for exactly one trajectory segment of one environment.
+
+    Record i of the result has the discounted reward sum r_i + discount * r_i+1 + ... + discount^(n-1) * r_i+n-1
+    and the next state of record i+n-1. States are not touched: Instead of moving next states, the indices
+    of the next states to use are returned, so callers can gather them from their own buffers.
+
+    If the segment ended in a terminal, sums are cut off at the last record, whose next state all records
+    within n steps of it use, and these records are marked terminal. Otherwise, the last n-1 records lack
+    enough future rewards and are dropped from the result.
+
+    Args:
+        rewards (Union[list,ndarray]): Rewards of the segment.
+        terminals (Union[list,ndarray]): Terminals of the segment.
+        n_step (int): Number of steps to discount over. Values <= 1 return the segment unchanged.
+        discount (float): The discount factor (gamma).
+        was_terminal (bool): Whether the segment ended an episode.
+
+    Returns:
+        tuple:
+            - int: The number of records in the result, i.e. the result consists of the first
+                `num_records` states and actions of the segment.
+            - ndarray: The n-step rewards.
+            - ndarray: The n-step terminals.
+            - ndarray: For each result record, the index of the segment record whose next state to use.
+    """
+    rewards = np.asarray(rewards)
+    rewards = rewards.astype(np.result_type(rewards.dtype, np.float32), copy=False)
+    terminals = np.asarray(terminals, dtype=bool)
+    num_segment_records = len(rewards)
+    if n_step <= 1:
+        return num_segment_records, rewards, terminals, np.arange(num_segment_records)
+
+    last = num_segment_records - 1
+    if was_terminal:
+        num_records = num_segment_records
+        next_state_indices = np.minimum(np.arange(num_records) + n_step - 1, last)
+    else:
+        num_records = max(0, num_segment_records - n_step + 1)
+        next_state_indices = np.arange(num_records) + n_step - 1
+
+    # Adds the k-step-ahead rewards of all records at once, i.e. loops over the n steps, not the records.
+    n_step_rewards = rewards[:num_records].copy()
+    for k in range_(1, n_step):
+        num_ahead = min(num_records, num_segment_records - k)
+        if num_ahead <= 0:
+            break
+        n_step_rewards[:num_ahead] += discount ** k * rewards[k:k + num_ahead]
+
+    n_step_terminals = terminals[:num_records].copy()
+    if was_terminal:
+        n_step_terminals[max(0, last - n_step + 1):last] = True
+
+    return num_records, n_step_rewards, n_step_terminals, next_state_indices